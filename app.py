@@ -3,15 +3,27 @@ Pybricks IDE - Text-based deployment application for LEGO SPIKE Prime/Robot Inve
 NO BLOCKS. NO SCRATCH. PURE PYTHON CODE EDITOR.
 """
 import streamlit as st
-import asyncio
 import os
 
 # Disable tqdm globally to prevent conflicts with Streamlit on Windows
 os.environ['TQDM_DISABLE'] = '1'
 
+import tempfile
+import time
 import traceback
+import uuid
+from collections import deque
 from datetime import datetime
-from pybricks_manager import PybricksManager
+from pybricks_manager import (ControlError, HubRegistry, JobState, LiveError, LogStore,
+                              OutputArchive, Project, RunPolicy)
+from pybricks_manager.live import MARKER as LIVE_MARKER
+from pybricks_manager.log_store import LEVELS as LOG_LEVELS
+from pybricks_manager.minify import MinifyOptions, minify
+from pybricks_manager.preflight import PreflightError
+from pybricks_manager.supervisor import LinkState
+
+# Debug log entries kept per session (oldest are dropped)
+DEBUG_LOG_CAPACITY = 2000
 
 # Debug logging system
 def debug(level, message, details=None):
@@ -23,19 +35,192 @@ def debug(level, message, details=None):
         message: Main log message
         details: Optional dict/list/str with additional information
     """
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]  # HH:MM:SS.mmm
+    if "debug_log" not in st.session_state:
+        st.session_state.debug_log = LogStore(DEBUG_LOG_CAPACITY)
+    
+    st.session_state.debug_log.add(level, message, details)
+
+# Script reduction before compiling (label -> options, None = off)
+MINIFY_MODES = {
+    "Desactivada": None,
+    "Segura (docstrings, comentarios, espacios)": MinifyOptions(),
+    "Completa (+ assert y bloques if DEBUG)": MinifyOptions(strip_asserts=True, strip_debug=True),
+}
+
+# Hub output shown in the Output panel (oldest lines are dropped)
+OUTPUT_DISPLAY_LINES = 2000
+# Lines per st.code block: full blocks never change, so a refresh only
+# renders the last block and the ones added since the previous refresh
+OUTPUT_CHUNK_LINES = 200
+# Seconds between Output panel refreshes while a program runs
+OUTPUT_REFRESH = 0.5
+
+def pull_output():
+    """
+    Move hub output produced since the last read into the session buffer
     
-    log_entry = {
-        "timestamp": timestamp,
-        "level": level,
-        "message": message,
-        "details": details
-    }
+    Returns:
+        List of new lines (empty if nothing arrived)
+    """
+    subscription = st.session_state.subscription
+    if subscription is None:
+        return []
+    # Answers of the live agent are shown as results, not as output
+    lines = [line for line in subscription.read() if not line.startswith(LIVE_MARKER)]
+    chunks = st.session_state.output
+    # At most one screenful per refresh; older lines would be dropped anyway
+    for line in lines[-OUTPUT_DISPLAY_LINES:]:
+        if not chunks or len(chunks[-1]) >= OUTPUT_CHUNK_LINES:
+            chunks.append([])
+        chunks[-1].append(line)
+    return lines
+
+def output_streaming():
+    """True while a job of this session or of the followed hub is running or queued"""
+    current_job = st.session_state.manager.jobs.current
+    # The live agent runs until it is replaced; its answers come back with each request
+    return bool(st.session_state.jobs) or (st.session_state.subscription is not None
+                                           and current_job is not None
+                                           and current_job is not st.session_state.manager.live.job)
+
+def output_panel():
+    """Output console; refreshed on its own (not the whole page) while a program runs"""
+    pull_output()
+    if st.session_state.output:
+        for chunk in st.session_state.output:
+            st.code("\n".join(chunk))
+    else:
+        st.text("Output will appear here...")
     
-    if "debug_log" not in st.session_state:
-        st.session_state.debug_log = []
+    # Reporting a finished job and updating the buttons need the whole page
+    current_job = st.session_state.manager.jobs.current
+    if any(job.done for job in st.session_state.jobs) or current_job is not st.session_state.output_job:
+        st.session_state.output_job = current_job
+        st.rerun()
+
+def show_diagnostics(diagnostics):
+    """Show pre-flight errors and warnings with their line numbers"""
+    for d in diagnostics:
+        if d.severity == "error":
+            st.error(f"❌ {d}")
+        else:
+            st.warning(f"⚠️ {d}")
+
+def spool_export(chunks):
+    """Write export chunks to a temporary file and return it for the download"""
+    # One chunk in memory at a time; the file is removed once it is closed
+    spool = tempfile.TemporaryFile()
+    for chunk in chunks:
+        spool.write(chunk.encode("utf-8"))
+    spool.seek(0)
+    return spool
+
+def current_program():
+    """
+    What Run and Check work on: the project if an entry file is set, else the editor code
     
-    st.session_state.debug_log.append(log_entry)
+    The Project is kept in the session so that only edited modules are
+    compiled again.
+    """
+    entry = st.session_state.get("project_entry", "").strip()
+    if not entry:
+        return st.session_state.code
+    project = st.session_state.get("project")
+    if project is None or project.entry != os.path.abspath(entry):
+        project = st.session_state.project = Project(entry)
+    return project
+
+@st.cache_resource
+def hub_registry():
+    """Hub connections shared by every browser session of this server"""
+    # Every run's output is also kept on disk for the Archivo panel
+    return HubRegistry(archive=OutputArchive())
+
+def use_manager(manager):
+    """Switch the session to another manager (link events restart from its latest)"""
+    st.session_state.manager = manager
+    st.session_state.link_event_seq = manager.supervisor.events_since(0)[1]
+
+def join_hub(address):
+    """
+    Subscribe this session to the shared hub at ``address``
+    
+    The hub is only connected if no other session has connected it yet.
+    
+    Returns:
+        True if the hub is connected
+    """
+    hub = hub_registry().hub(address)
+    subscription = st.session_state.subscription
+    if subscription is None or subscription.hub is not hub:
+        leave_hub()
+        subscription = st.session_state.subscription = hub.subscribe(st.session_state.session_name)
+    # This session's scan ends here; scans of other sessions keep running
+    hub.manager.call(hub.manager.stop_scan(st.session_state.session_name))
+    connected = hub.connect(subscription)
+    use_manager(hub.manager)
+    return connected
+
+def leave_hub():
+    """Stop following the shared hub (its connection stays up for other sessions)"""
+    if st.session_state.subscription is not None:
+        st.session_state.subscription.close()
+        st.session_state.subscription = None
+    use_manager(hub_registry().detached)
+
+def hub_control():
+    """
+    Control the shared hub as this session (context manager yielding its manager)
+    
+    Raises:
+        ControlError: if another session controls the hub
+    """
+    subscription = st.session_state.subscription
+    return subscription.hub.control(subscription)
+
+def run_live(code, sync=True):
+    """
+    Send code to the hub's live agent (started if needed)
+    
+    With ``sync`` only the statements of the script that changed since the
+    last sync are sent. If the agent is not available the script runs
+    normally instead.
+    """
+    try:
+        with hub_control() as manager:
+            if sync:
+                result = manager.call(manager.live.sync(code))
+            else:
+                result = manager.call(manager.live.execute(code))
+    except ControlError as e:
+        debug("WARN", "Live request refused", {"reason": str(e)})
+        st.warning(f"🔒 {e}")
+        return
+    except PreflightError as e:
+        show_diagnostics(e.diagnostics)
+        return
+    except LiveError as e:
+        debug("WARN", "Live mode unavailable", {"reason": str(e)})
+        st.warning(f"⚡ {e}")
+        if sync:
+            st.info("Ejecución normal")
+            submit_run(RunPolicy.REPLACE)
+        return
+    
+    debug("INFO" if result.ok else "ERROR", "Live request", {
+        "statements": result.statements,
+        "bytes": result.sent,
+        "elapsed_ms": round(result.elapsed * 1000, 1),
+        "hub_ms": result.hub_ms,
+    })
+    if not result.ok:
+        st.error("❌ Error en el hub")
+        st.code(result.error)
+    elif sync:
+        st.success(f"⚡ {result.statements} sentencia(s) enviadas en {result.elapsed * 1000:.0f} ms"
+                   if result.statements else "⚡ Sin cambios")
+    else:
+        st.code(f">>> {code}" + (f"\n{result.value}" if result.value is not None else ""))
 
 # Page configuration
 st.set_page_config(
@@ -46,13 +231,21 @@ st.set_page_config(
 
 # Initialize session state
 if "manager" not in st.session_state:
-    st.session_state.manager = PybricksManager()
+    # Until the session joins a hub it scans and checks with the registry's
+    # detached manager; control and output go through its subscription
+    st.session_state.session_name = f"sesión {uuid.uuid4().hex[:4]}"
+    st.session_state.subscription = None
+    use_manager(hub_registry().detached)
 if "devices" not in st.session_state:
     st.session_state.devices = []
 if "output" not in st.session_state:
-    st.session_state.output = []
+    # Blocks of up to OUTPUT_CHUNK_LINES lines (see pull_output())
+    st.session_state.output = deque(maxlen=OUTPUT_DISPLAY_LINES // OUTPUT_CHUNK_LINES)
+    st.session_state.output_job = None
+    # Run handles not reported yet
+    st.session_state.jobs = []
 if "debug_log" not in st.session_state:
-    st.session_state.debug_log = []
+    st.session_state.debug_log = LogStore(DEBUG_LOG_CAPACITY)
 if "code" not in st.session_state:
     st.session_state.code = """from pybricks.hubs import PrimeHub
 from pybricks.tools import wait
@@ -85,66 +278,225 @@ with col1:
     )
     st.session_state.code = code
     
+    with st.expander("📁 Multi-file project"):
+        st.text_input(
+            "Entry file:",
+            key="project_entry",
+            placeholder="robot/main.py",
+            help="Run and Check use this file and the local modules it imports "
+                 "from its folder instead of the editor code. Leave empty to run the editor."
+        )
+        if isinstance(current_program(), Project) and st.session_state.project.last_build:
+            stats = st.session_state.project.last_build
+            st.caption(f"Last build: {stats.modules} modules, {stats.compiled} compiled, "
+                       f"{stats.size} bytes in {stats.elapsed * 1000:.0f} ms")
+    
+    with st.expander("🗜️ Reducción del script"):
+        mode = st.selectbox(
+            "Antes de compilar:",
+            list(MINIFY_MODES),
+            key="minify_mode",
+            help="Las líneas no se mueven: los errores del hub siguen apuntando a la línea del editor"
+        )
+        # Passed with this session's runs; the manager is shared with other sessions
+        if MINIFY_MODES[mode] is not None:
+            try:
+                reduction = minify(st.session_state.code, MINIFY_MODES[mode])
+                st.caption(f"🗜️ {reduction} · {reduction.removed['docstrings']} docstrings, "
+                           f"{reduction.removed['comments']} comentarios, {reduction.removed['asserts']} assert, "
+                           f"{reduction.removed['debug_blocks']} bloques DEBUG")
+            except SyntaxError:
+                st.caption("🗜️ El script tiene errores de sintaxis (ver 🔎 Check)")
+    
+    with st.expander("⚡ Modo en vivo"):
+        st.checkbox(
+            "▶️ Run envía solo los cambios",
+            key="live_mode",
+            help="Un agente residente en el hub ejecuta las funciones y sentencias editadas "
+                 "sin reiniciar el programa: motores y variables conservan su estado. "
+                 "El bloque if __name__ == \"__main__\" no se ejecuta; llama a tus funciones abajo."
+        )
+        live = st.session_state.manager.live
+        if live.active:
+            st.caption(f"⚡ Agente activo (job {live.job.id})")
+        snippet = st.text_input("Ejecutar en el hub:", key="live_snippet", placeholder="probar_pid(kp=1.2)")
+        if st.button("⚡ Ejecutar", disabled=not st.session_state.manager.connected or not snippet):
+            run_live(snippet, sync=False)
+    
     # Control buttons
-    btn_col1, btn_col2, btn_col3 = st.columns([1, 1, 4])
+    btn_col1, btn_col2, btn_col3, btn_col4 = st.columns([1, 1, 1, 3])
+    
+    def submit_run(policy):
+        """Queue the current program; returns at once with the job handle"""
+        program = current_program()
+        debug("INFO", "Run submitted", {
+            "code_length": len(st.session_state.code),
+            "project": program.entry if isinstance(program, Project) else None,
+            "policy": policy.value
+        })
+        try:
+            with hub_control() as manager:
+                if policy == RunPolicy.QUEUE and manager.live.active:
+                    # The agent never ends by itself; a queued run would wait forever
+                    manager.call(manager.live.stop())
+                job = manager.run_script(program, policy=policy,
+                                         minify=MINIFY_MODES[st.session_state.minify_mode])
+        except ControlError as e:
+            debug("WARN", "Run refused", {"reason": str(e)})
+            st.warning(f"🔒 {e}")
+            return
+        if policy == RunPolicy.REPLACE:
+            # Clear previous output
+            st.session_state.output.clear()
+            debug("DEBUG", "Cleared output buffer")
+        st.session_state.jobs.append(job)
     
     with btn_col1:
         if st.button("▶️ Run", type="primary", disabled=not st.session_state.manager.connected):
-            if st.session_state.manager.connected:
-                debug("INFO", "Run button clicked", {"code_length": len(st.session_state.code)})
-                with st.spinner("Uploading and executing..."):
-                    try:
-                        # Clear previous output
-                        st.session_state.output = []
-                        debug("DEBUG", "Cleared output buffer")
-                        
-                        debug("INFO", "Starting script upload and execution")
-                        
-                        # Use a persistent container for real-time output
-                        # Run script (now a standard async call)
-                        asyncio.run(st.session_state.manager.run_script(st.session_state.code))
-                        
-                        debug("SUCCESS", "Script executed successfully!")
-                        st.success("✅ Script executed successfully!")
-                    except Exception as e:
-                        debug("ERROR", "Script execution failed", {
-                            "exception": str(e),
-                            "type": type(e).__name__,
-                            "traceback": traceback.format_exc()
-                        })
-                        st.error(f"❌ Error: {str(e)}")
+            if st.session_state.get("live_mode") and not isinstance(current_program(), Project):
+                run_live(st.session_state.code)
+            else:
+                submit_run(RunPolicy.REPLACE)
     
     with btn_col2:
         if st.button("⏹️ Stop", disabled=not st.session_state.manager.connected):
             debug("INFO", "Stop button clicked")
             try:
-                debug("DEBUG", "Calling stop_script()")
-                asyncio.run(st.session_state.manager.stop_script())
+                with hub_control() as manager:
+                    if manager.jobs.current is not None or manager.jobs.queued():
+                        debug("DEBUG", "Cancelling running and queued jobs")
+                        manager.jobs.cancel_all()
+                    else:
+                        # Program started outside the queue (e.g. on the hub button)
+                        debug("DEBUG", "Calling stop_script()")
+                        manager.call(manager.stop_script())
                 debug("SUCCESS", "Script stopped successfully")
                 st.info("Script stopped")
+            except ControlError as e:
+                debug("WARN", "Stop refused", {"reason": str(e)})
+                st.warning(f"🔒 {e}")
             except Exception as e:
                 debug("ERROR", "Failed to stop script", {
                     "exception": str(e),
                     "traceback": traceback.format_exc()
                 })
                 st.error(f"Error stopping: {str(e)}")
+    
+    with btn_col3:
+        if st.button("➕ Encolar", disabled=not st.session_state.manager.connected,
+                     help="Ejecutar después del programa en curso"):
+            submit_run(RunPolicy.QUEUE)
+    
+    # Outcome of jobs submitted from this session, reported once each
+    for job in [j for j in st.session_state.jobs if j.done]:
+        st.session_state.jobs.remove(job)
+        if job.state == JobState.DONE:
+            debug("SUCCESS", f"Job {job.id} executed successfully!", {"elapsed": round(job.elapsed, 2)})
+            st.success(f"✅ Job {job.id} executed successfully! ({job.elapsed:.1f} s)")
+        elif job.state == JobState.CANCELLED:
+            debug("INFO", f"Job {job.id} cancelled")
+        elif isinstance(job.error, PreflightError):
+            debug("ERROR", "Script rejected before upload", {
+                "diagnostics": [str(d) for d in job.error.diagnostics]
+            })
+            show_diagnostics(job.error.diagnostics)
+        else:
+            debug("ERROR", "Script execution failed", {
+                "exception": str(job.error),
+                "type": type(job.error).__name__
+            })
+            st.error(f"❌ Error: {str(job.error)}")
+    
+    # Running and queued jobs
+    queue = st.session_state.manager.jobs
+    if queue.current is not None:
+        st.caption(f"⏳ Job {queue.current.id} en ejecución ({queue.current.elapsed or 0:.1f} s)")
+    for job in queue.queued():
+        st.caption(f"🕒 Job {job.id} en cola (prioridad {job.priority})")
+    
+    with btn_col4:
+        # Works without a hub: parse, API check and compile only
+        if st.button("🔎 Check"):
+            program = current_program()
+            manager = st.session_state.manager
+            try:
+                minify_options = MINIFY_MODES[st.session_state.minify_mode]
+                if isinstance(program, Project):
+                    result = manager.call(manager.validate_project(program, minify=minify_options))
+                else:
+                    result = manager.call(manager.validate_script(program.strip(), minify=minify_options))
+            except OSError as e:
+                result = None
+                st.error(f"❌ Could not read project: {e}")
+            if result is not None:
+                debug("INFO" if result.ok else "WARN", "Pre-flight check", {
+                    "ok": result.ok,
+                    "elapsed_ms": round(result.elapsed * 1000, 1),
+                    "diagnostics": [str(d) for d in result.diagnostics]
+                })
+                if result.ok and not result.diagnostics:
+                    st.success(f"✅ No problems found ({len(result.mpy)} bytes compiled)")
+                show_diagnostics(result.diagnostics)
 
 with col2:
     st.subheader("🔌 Connection")
     
+    # Link events from the reconnect supervisor go to the debug log
+    supervisor = st.session_state.manager.supervisor
+    link_events, st.session_state.link_event_seq = supervisor.events_since(
+        st.session_state.get("link_event_seq", 0)
+    )
+    for event in link_events:
+        debug("ERROR" if event.state in (LinkState.LOST, LinkState.FAILED) else "INFO",
+              f"Link {event.previous.value} -> {event.state.value}", {
+                  "address": event.address,
+                  "attempt": event.attempt,
+                  "delay": round(event.delay, 2),
+                  "error": event.error,
+              })
+    
+    # Status of the shared hub published by other sessions (link events are
+    # already reported above)
+    subscription = st.session_state.subscription
+    if subscription is not None:
+        for event in subscription.events():
+            if event.kind != "link":
+                debug("INFO", event.message, {"kind": event.kind, **event.data})
+    
     # Connection status
     if st.session_state.manager.connected:
         st.success("✅ Connected")
+        hub = subscription.hub
+        viewers = len(hub.subscribers(active_within=hub.lease_timeout))
+        controller = hub.controller
+        st.caption(f"👥 {viewers} sesión(es) · "
+                   + ("🎮 control: esta sesión" if subscription.controlling
+                      else f"🎮 control: {controller.label}" if controller is not None
+                      else "🎮 control libre"))
+    elif supervisor.reconnecting:
+        st.info(f"🔄 Connection lost, reconnecting to {supervisor.address}...")
+    elif supervisor.state == LinkState.FAILED:
+        st.error(f"❌ Could not reconnect: {supervisor.last_error}")
     else:
         st.warning("⚠️ Not connected")
     
+    # Hubs other sessions are connected to can be joined without a new connection
+    if subscription is None:
+        for hub in hub_registry().hubs():
+            if hub.manager.connected and st.button(f"👀 Unirse a {hub.address}", key=f"join_{hub.address}"):
+                debug("INFO", "Joined shared hub", {"address": hub.address})
+                join_hub(hub.address)
+                st.rerun()
+    
     # Scan for devices (NOW WORKS!)
     if st.button("🔍 Scan for Devices", type="primary", disabled=st.session_state.manager.connected):
         debug("INFO", "Scan button clicked", {"timeout": 5.0})
         with st.spinner("Scanning for Pybricks hubs..."):
             try:
                 debug("DEBUG", "Starting BLE scan...")
-                devices = asyncio.run(st.session_state.manager.scan_devices(timeout=5.0))
+                # Held for this session: other sessions' scans are independent
+                devices = st.session_state.manager.call(st.session_state.manager.scan_devices(
+                    timeout=5.0, holder=st.session_state.session_name))
                 st.session_state.devices = devices
                 if devices:
                     debug("SUCCESS", f"Found {len(devices)} Pybricks device(s)", {
@@ -162,8 +514,30 @@ with col2:
                 })
                 st.error(f"Scan error: {str(e)}")
     
+    # Live device table kept up to date by the background scanner
+    scanner = st.session_state.manager.scanner
+    if scanner.running:
+        st.session_state.devices = [d.as_dict() for d in scanner.devices()]
+        if st.button("⏹️ Stop Scan"):
+            st.session_state.manager.call(st.session_state.manager.stop_scan(st.session_state.session_name))
+            debug("INFO", "Background scan stopped", {"advertisements": scanner.advertisements})
+            st.rerun()
+    
     # Device selection
     if st.session_state.devices:
+        now = time.monotonic()
+        st.dataframe(
+            [
+                {
+                    "Name": d['name'],
+                    "Address": d['address'],
+                    "RSSI": d.get('rssi'),
+                    "Last seen (s)": round(now - d['last_seen'], 1) if d.get('last_seen') else None,
+                }
+                for d in st.session_state.devices
+            ],
+            hide_index=True,
+        )
         device_names = [f"{d['name']} ({d['address']})" for d in st.session_state.devices]
         selected = st.selectbox("Select device:", device_names)
         
@@ -178,8 +552,11 @@ with col2:
                 })
                 with st.spinner(f"Connecting to {selected_device['name']}..."):
                     try:
-                        debug("DEBUG", "Calling hub.connect()...", {"address": selected_device['address']})
-                        success = asyncio.run(st.session_state.manager.connect(selected_device['address']))
+                        debug("DEBUG", "Calling hub.connect()...", {
+                            "address": selected_device['address'],
+                            "device_cache": st.session_state.manager.device_cache.stats()
+                        })
+                        success = join_hub(selected_device['address'])
                         if success:
                             debug("SUCCESS", "Hub connected successfully!", {
                                 "device": selected_device['name'],
@@ -210,8 +587,11 @@ with col2:
             debug("INFO", "Manual connect button clicked", {"address": manual_address})
             with st.spinner(f"Connecting to {manual_address}..."):
                 try:
-                    debug("DEBUG", "Calling hub.connect() with manual address", {"address": manual_address})
-                    success = asyncio.run(st.session_state.manager.connect(manual_address))
+                    debug("DEBUG", "Calling hub.connect() with manual address", {
+                        "address": manual_address,
+                        "device_cache": st.session_state.manager.device_cache.stats()
+                    })
+                    success = join_hub(manual_address)
                     if success:
                         debug("SUCCESS", "Manual connection successful!", {"address": manual_address})
                         st.success("Connected!")
@@ -229,14 +609,23 @@ with col2:
     
     # Disconnect button
     if st.session_state.manager.connected:
-        if st.button("🔌 Disconnect"):
+        disc_col, leave_col = st.columns(2)
+        if leave_col.button("🚪 Salir", help="Dejar de seguir el hub sin desconectarlo para las demás sesiones"):
+            debug("INFO", "Left shared hub", {"address": subscription.hub.address})
+            leave_hub()
+            st.rerun()
+        if disc_col.button("🔌 Disconnect"):
             debug("INFO", "Disconnect button clicked")
             try:
                 debug("DEBUG", "Calling hub.disconnect()")
-                asyncio.run(st.session_state.manager.disconnect())
+                subscription.hub.disconnect(subscription)
+                leave_hub()
                 st.session_state.devices = []
                 debug("SUCCESS", "Disconnected successfully")
                 st.rerun()
+            except ControlError as e:
+                debug("WARN", "Disconnect refused", {"reason": str(e)})
+                st.warning(f"🔒 {e}")
             except Exception as e:
                 debug("ERROR", "Disconnect failed", {
                     "exception": str(e),
@@ -250,11 +639,76 @@ with col2:
     output_container = st.container(height=300)
     
     with output_container:
-        if st.session_state.output:
-            for line in st.session_state.output:
-                st.code(line)
-        else:
-            st.text("Output will appear here...")
+        st.fragment(output_panel, run_every=OUTPUT_REFRESH if output_streaming() else None)()
+
+    # Telemetry charts (only once the hub has sent samples)
+    telemetry = st.session_state.manager.telemetry
+    if telemetry is not None and telemetry.channels:
+        import pandas as pd
+
+        st.subheader("📈 Telemetría")
+        window = st.slider("Ventana (s)", 1, 120, 10)
+        for channel in telemetry.channels:
+            times, values = telemetry.window(channel, seconds=window, max_points=500)
+            if not len(times):
+                continue
+            name = telemetry.names.get(channel, f"Canal {channel}")
+            st.caption(name)
+            st.line_chart(pd.DataFrame(values, index=times - times[0]))
+
+    # Phase timings of the registry: every session and hub of this app server
+    metrics = st.session_state.manager.metrics.snapshot()
+    if metrics["phases"]:
+        with st.expander("📊 Métricas (todas las sesiones)"):
+            import pandas as pd
+
+            st.caption("Compartidas por todas las sesiones y hubs de este servidor, no solo esta pestaña")
+
+            def ms(value):
+                return None if value is None else round(value * 1000, 1)
+
+            st.dataframe(pd.DataFrame(
+                [
+                    {"Fase": name, "N": p["count"], "Última (ms)": ms(p["last"]),
+                     "Media (ms)": ms(p["mean"]), "p95 (ms)": ms(p["p95"])}
+                    for name, p in metrics["phases"].items()
+                ]
+            ).set_index("Fase"))
+            counters = metrics["counters"]
+            count_col1, count_col2, count_col3 = st.columns(3)
+            count_col1.metric("Bytes enviados", int(counters.get("bytes_sent", 0)))
+            count_col2.metric("Reintentos", int(counters.get("upload_retries", 0)))
+            count_col3.metric("Reconexiones", int(counters.get("reconnects", 0)))
+            st.download_button(
+                label="💾 Prometheus",
+                data=st.session_state.manager.metrics.prometheus(),
+                file_name="pybricks_metrics.prom",
+                mime="text/plain"
+            )
+
+    # Archived output of earlier runs, read from disk on demand
+    archive = st.session_state.manager.archive
+    runs = archive.runs() if archive is not None else []
+    if runs:
+        with st.expander("🗄️ Archivo de ejecuciones"):
+            run_id = st.selectbox("Ejecución:", runs, help="Más reciente primero")
+            reader = archive.reader(run_id)
+            search_col, lines_col = st.columns([3, 1])
+            with search_col:
+                pattern = st.text_input("Buscar:", key="archive_grep",
+                                        help="Texto a buscar en toda la ejecución")
+            with lines_col:
+                archive_lines = st.selectbox("Líneas:", [50, 200, 1000], key="archive_lines")
+            if pattern:
+                entries = reader.grep(pattern, ignore_case=True, limit=archive_lines)
+                st.caption(f"{len(entries)} coincidencias (máx. {archive_lines})")
+            else:
+                entries = reader.tail(archive_lines)
+                st.caption(f"Últimas líneas de {reader.line_count()}")
+            st.code("\n".join(
+                f"{e.number:>7}  {datetime.fromtimestamp(e.timestamp):%H:%M:%S}  {e.text}"
+                for e in entries
+            ) or "(vacío)")
 
 # Footer
 st.markdown("---")
@@ -272,39 +726,51 @@ debug_col1, debug_col2, debug_col3 = st.columns([1, 1, 4])
 
 with debug_col1:
     if st.button("🗑️ Limpiar Log"):
-        st.session_state.debug_log = []
+        st.session_state.debug_log.clear()
         debug("INFO", "Debug log cleared by user")
         st.rerun()
 
+with debug_col3:
+    filter_col, size_col, page_col = st.columns([3, 1, 1])
+    with filter_col:
+        debug_levels = st.multiselect(
+            "Niveles:",
+            list(LOG_LEVELS),
+            default=list(LOG_LEVELS),
+        )
+    with size_col:
+        per_page = st.selectbox("Por página:", [25, 50, 100, 200], index=1)
+    debug_page, debug_pages = st.session_state.debug_log.page(0, per_page, debug_levels)
+    with page_col:
+        page_number = st.number_input("Página:", min_value=1, max_value=debug_pages, value=1,
+                                      help="Página 1 = entradas más recientes")
+    if page_number > 1:
+        debug_page, _ = st.session_state.debug_log.page(page_number - 1, per_page, debug_levels)
+
 with debug_col2:
-    if st.button("📥 Descargar Log"):
-        if st.session_state.debug_log:
-            # Generate log file content
-            log_content = "PYBRICKS IDE - DEBUG LOG\n"
-            log_content += "=" * 80 + "\n"
-            log_content += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-            log_content += "=" * 80 + "\n\n"
-            
-            for entry in st.session_state.debug_log:
-                log_content += f"[{entry['timestamp']}] {entry['level']}: {entry['message']}\n"
-                if entry['details']:
-                    import json
-                    log_content += f"  Details: {json.dumps(entry['details'], indent=2)}\n"
-                log_content += "\n"
-            
-            # Offer download
-            st.download_button(
-                label="💾 Download debug.txt",
-                data=log_content,
-                file_name=f"pybricks_debug_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                mime="text/plain"
-            )
+    export_format = st.selectbox("Formato:", ["txt", "jsonl"])
+    debug_log = st.session_state.debug_log
+    if export_format == "jsonl":
+        export = debug_log.iter_jsonl
+        mime = "application/x-ndjson"
+    else:
+        export = debug_log.iter_text
+        mime = "text/plain"
+    # Generated only on click, streamed from the generator into a temp file
+    st.download_button(
+        label=f"📥 Descargar debug.{export_format}",
+        data=lambda: spool_export(export()),
+        file_name=f"pybricks_debug_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+        mime=mime,
+        on_click="ignore",
+        disabled=not len(debug_log)
+    )
 
 # Debug log display
 debug_container = st.container(height=400)
 
 with debug_container:
-    if st.session_state.debug_log:
+    if debug_page:
         # Level emoji mapping
         level_emoji = {
             "INFO": "ℹ️",
@@ -314,36 +780,24 @@ with debug_container:
             "DEBUG": "🔍"
         }
         
-        # Display each log entry
-        for entry in st.session_state.debug_log:
+        # Newest entries first
+        for entry in reversed(debug_page):
             emoji = level_emoji.get(entry['level'], "📝")
-            timestamp = entry['timestamp']
-            level = entry['level']
-            message = entry['message']
-            details = entry['details']
-            
-            # Format log line
-            log_line = f"`{timestamp}` {emoji} **{level}**: {message}"
-            st.markdown(log_line)
+            st.markdown(f"`{entry['timestamp']}` {emoji} **{entry['level']}**: {entry['message']}")
             
-            # Display details if present
-            if details:
-                if isinstance(details, dict):
-                    # Format dict details with indentation
-                    st.markdown("```")
-                    import json
-                    st.text(json.dumps(details, indent=2))
-                    st.markdown("```")
-                elif isinstance(details, list):
-                    # Format list details
-                    st.markdown("```")
-                    import json
-                    st.text(json.dumps(details, indent=2))
-                    st.markdown("```")
+            # Details were serialised when the entry was added
+            if entry['details']:
+                if entry['structured']:
+                    st.json(entry['details'])
                 else:
-                    # String details
-                    st.markdown(f"  _{details}_")
-            
-            st.markdown("")  # Add spacing
+                    st.markdown(f"  _{entry['details']}_")
+        
+        if st.session_state.debug_log.dropped:
+            st.caption(f"{st.session_state.debug_log.dropped} entradas antiguas descartadas "
+                       f"(máximo {DEBUG_LOG_CAPACITY})")
     else:
         st.info("📋 El log de debug está vacío. Realiza acciones en la app para ver los mensajes de debug aquí.")
+
+# While a job is running or queued the Output panel refreshes itself every
+# OUTPUT_REFRESH seconds (see output_panel()) and reruns the page once a job
+# finishes, so the rest of the page is not rebuilt for every output line.
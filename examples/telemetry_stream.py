@@ -0,0 +1,46 @@
+"""
+Example Pybricks script - Telemetry Stream
+Streams motor angle and speed to the Telemetry panel as binary frames
+
+The host timestamps samples when it receives them, and samples that arrive
+in one BLE packet share a timestamp. Channel 1 carries the hub's own clock
+in milliseconds for when the exact timing matters.
+"""
+from pybricks.hubs import PrimeHub
+from pybricks.pupdevices import Motor
+from pybricks.parameters import Port
+from pybricks.tools import wait, StopWatch
+
+import ustruct
+import usys
+
+hub = PrimeHub()
+motor = Motor(Port.A)
+watch = StopWatch()
+
+try:
+    _out = usys.stdout.buffer
+except AttributeError:
+    _out = None
+
+
+def send(channel, *values):
+    """Send integer samples on a telemetry channel"""
+    if _out is not None:
+        # 0x1E | channel | count | ord("i") | int32 values (ustruct has no "c" code)
+        _out.write(ustruct.pack("<BBBB%di" % len(values), 0x1E, channel, len(values), ord("i"), *values))
+    else:
+        # Text fallback for firmware without stdout.buffer
+        print("TLM", channel, *values)
+
+
+print("Streaming telemetry for 10 seconds...")
+motor.run(300)
+
+while watch.time() < 10000:
+    send(0, motor.angle(), motor.speed())
+    send(1, watch.time())
+    wait(20)
+
+motor.stop()
+print("Done!")
@@ -0,0 +1,86 @@
+"""
+Pybricks Hub Manager - Bluetooth LE communication with SPIKE Prime/Robot Inventor
+
+Submodules are imported on first attribute access, so ``python -m
+pybricks_manager --help`` and other light users do not pay for bleak and
+pybricksdev.
+"""
+import importlib
+from typing import TYPE_CHECKING
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "PybricksManager": "manager",
+    "HubPool": "pool",
+    "HubResult": "pool",
+    "HubState": "pool",
+    "CompileCache": "compiler",
+    "CompileError": "compiler",
+    "ControlError": "registry",
+    "DeviceCache": "devices",
+    "DeviceScanner": "scanner",
+    "EventLoopThread": "loop",
+    "HubEvent": "registry",
+    "HubRegistry": "registry",
+    "HubSimulator": "simhub",
+    "Job": "jobs",
+    "JobCancelled": "jobs",
+    "JobQueue": "jobs",
+    "JobState": "jobs",
+    "LinkProfile": "simhub",
+    "LiveError": "live",
+    "LiveResult": "live",
+    "LiveSession": "live",
+    "LogStore": "log_store",
+    "MinifyOptions": "minify",
+    "MinifyResult": "minify",
+    "OutputArchive": "archive",
+    "OutputBuffer": "output",
+    "Preflight": "preflight",
+    "PreflightError": "preflight",
+    "ProgramUploader": "upload",
+    "Project": "project",
+    "RunPolicy": "jobs",
+    "SeenDevice": "scanner",
+    "SharedHub": "registry",
+    "SimulatedHub": "simhub",
+    "Subscription": "registry",
+    "TelemetryDecoder": "telemetry",
+    "TelemetryStore": "telemetry",
+    "UploadStats": "upload",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .archive import OutputArchive
+    from .compiler import CompileCache, CompileError
+    from .devices import DeviceCache
+    from .jobs import Job, JobCancelled, JobQueue, JobState, RunPolicy
+    from .live import LiveError, LiveResult, LiveSession
+    from .log_store import LogStore
+    from .loop import EventLoopThread
+    from .manager import PybricksManager
+    from .minify import MinifyOptions, MinifyResult
+    from .output import OutputBuffer
+    from .preflight import Preflight, PreflightError
+    from .pool import HubPool, HubResult, HubState
+    from .project import Project
+    from .registry import ControlError, HubEvent, HubRegistry, SharedHub, Subscription
+    from .scanner import DeviceScanner, SeenDevice
+    from .simhub import HubSimulator, LinkProfile, SimulatedHub
+    from .telemetry import TelemetryDecoder, TelemetryStore
+    from .upload import ProgramUploader, UploadStats
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,8 @@
+"""
+python -m pybricks_manager - see :mod:`pybricks_manager.cli`
+"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,504 @@
+"""
+On-disk archive of hub output, one directory per program run
+
+Every run is written to size-rotated segment files with a sparse index, and
+read back through ``mmap``, so neither writing nor reading a run needs memory
+proportional to its length::
+
+    runs/20260301-101500-1-A4C138123456/
+        meta.json
+        000000000000.log    tab-separated "<unix time>\\t<line>" records
+        000000000000.idx    (line, byte offset, time) every index_interval lines
+        000000041871.log    next segment, named after its first line number
+        000000041871.idx
+"""
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import IO, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR = os.environ.get(
+    "PYBRICKS_RUN_ARCHIVE",
+    os.path.join(os.path.expanduser("~"), ".cache", "pybricks_manager", "runs"),
+)
+
+# line number, byte offset in the segment, unix time
+_INDEX_RECORD = struct.Struct("<QQd")
+
+_LABEL_CHARS = re.compile(r"[^A-Za-z0-9_.-]+")
+
+# Bytes that occur in the timestamp column
+_TIMESTAMP_BYTES = frozenset(b"0123456789.")
+
+
+@dataclass
+class ArchivedLine:
+    """One line of run output (``number`` counts from 0 for each run)"""
+    number: int
+    timestamp: float
+    text: str
+
+
+def _segment_name(first_line: int) -> str:
+    return f"{first_line:012d}"
+
+
+class RunLog:
+    """
+    Appends the output of one run (created by :meth:`OutputArchive.open_run`)
+
+    Lines are written as they arrive and flushed after every batch, so a
+    reader on another thread sees them right away. A new segment is started
+    once the current one exceeds ``segment_bytes``.
+    """
+
+    def __init__(self, path: str, run_id: str, segment_bytes: int, index_interval: int):
+        self.path = path
+        self.run_id = run_id
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.lines = 0
+        self.closed = False
+        self._log: Optional[IO[bytes]] = None
+        self._index: Optional[IO[bytes]] = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        self._close_files()
+        base = os.path.join(self.path, _segment_name(self.lines))
+        self._log = open(base + ".log", "ab")
+        self._index = open(base + ".idx", "ab")
+        self._offset = 0
+
+    def write(self, lines: List[str], timestamp: Optional[float] = None):
+        """Append complete lines (all stamped with ``timestamp``, default now)"""
+        if not lines:
+            return
+        stamp = f"{time.time() if timestamp is None else timestamp:.3f}\t".encode()
+        with self._lock:
+            if self.closed:
+                return
+            for line in lines:
+                if self._log is None or self._offset >= self.segment_bytes:
+                    self._rotate()
+                record = stamp + line.encode("utf-8", errors="replace") + b"\n"
+                if self._offset == 0 or self.lines % self.index_interval == 0:
+                    self._index.write(_INDEX_RECORD.pack(self.lines, self._offset, float(stamp[:-1])))
+                self._log.write(record)
+                self._offset += len(record)
+                self.lines += 1
+            self._log.flush()
+            self._index.flush()
+
+    def _close_files(self):
+        for f in (self._log, self._index):
+            if f is not None:
+                f.close()
+        self._log = self._index = None
+
+    def close(self):
+        """Finish the run and record its line count in ``meta.json``"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._close_files()
+        _update_meta(self.path, ended=time.time(), lines=self.lines)
+
+
+class _Segment:
+    """A segment file plus its sparse index, read through mmap"""
+
+    def __init__(self, base: str, first_line: int):
+        self.base = base
+        self.first_line = first_line
+        with open(base + ".idx", "rb") as f:
+            raw = f.read()
+        # A record may be half-written while the run is still going
+        usable = len(raw) - len(raw) % _INDEX_RECORD.size
+        records = [_INDEX_RECORD.unpack_from(raw, i) for i in range(0, usable, _INDEX_RECORD.size)]
+        self.index_lines = [r[0] for r in records]
+        self.index_offsets = [r[1] for r in records]
+        self.index_times = [r[2] for r in records]
+
+    @property
+    def first_time(self) -> Optional[float]:
+        return self.index_times[0] if self.index_times else None
+
+    def open(self) -> Optional[mmap.mmap]:
+        """Read-only map of the segment (None if still empty)"""
+        with open(self.base + ".log", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return None
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    def seek_line(self, number: int) -> Tuple[int, int]:
+        """Closest indexed (line, offset) at or before ``number``"""
+        i = max(0, bisect.bisect_right(self.index_lines, number) - 1)
+        return self.index_lines[i], self.index_offsets[i]
+
+    def seek_time(self, timestamp: float) -> Tuple[int, int]:
+        """Indexed (line, offset) from which lines at or after ``timestamp`` can be found"""
+        i = max(0, bisect.bisect_left(self.index_times, timestamp) - 1)
+        return self.index_lines[i], self.index_offsets[i]
+
+
+def _parse(number: int, raw: bytes) -> ArchivedLine:
+    stamp, _, text = raw.rstrip(b"\n").partition(b"\t")
+    return ArchivedLine(number, float(stamp), text.decode("utf-8", errors="replace"))
+
+
+def _scan(mm: mmap.mmap, line: int, offset: int) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (line number, offset, raw record) from an indexed position"""
+    mm.seek(offset)
+    while True:
+        start = mm.tell()
+        raw = mm.readline()
+        if not raw.endswith(b"\n"):
+            return  # End of data, or a record still being written
+        yield line, start, raw
+        line += 1
+
+
+class RunReader:
+    """
+    Random access to an archived run
+
+    Segments are mapped one at a time and only the part between an index
+    entry and the requested lines is scanned, so reads stay fast and small
+    however long the run was. A reader can be used while the run is still
+    being written; call :meth:`refresh` to pick up new segments.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.run_id = os.path.basename(path)
+        self._segments: List[_Segment] = []
+        self.refresh()
+
+    def refresh(self):
+        names = sorted(n[:-4] for n in os.listdir(self.path) if n.endswith(".idx"))
+        self._segments = [_Segment(os.path.join(self.path, n), int(n)) for n in names]
+
+    @property
+    def meta(self) -> dict:
+        return _read_meta(self.path)
+
+    def line_count(self) -> int:
+        """Number of complete lines in the run"""
+        if not self._segments:
+            return 0
+        last = self._segments[-1]
+        if not last.index_lines:
+            return last.first_line
+        mm = last.open()
+        if mm is None:
+            return last.first_line
+        count = last.index_lines[-1]
+        with mm:
+            for number, _, _ in _scan(mm, count, last.index_offsets[-1]):
+                count = number + 1
+        return count
+
+    def _segment_for_line(self, number: int) -> int:
+        firsts = [s.first_line for s in self._segments]
+        return max(0, bisect.bisect_right(firsts, number) - 1)
+
+    def _iter_from(self, segment: int, line: int, offset: int) -> Iterator[ArchivedLine]:
+        for i in range(segment, len(self._segments)):
+            seg = self._segments[i]
+            if i != segment:
+                line, offset = seg.first_line, 0
+            mm = seg.open()
+            if mm is None:
+                continue
+            with mm:
+                for number, _, raw in _scan(mm, line, offset):
+                    yield _parse(number, raw)
+
+    def lines(self, start: int = 0, count: int = 100) -> List[ArchivedLine]:
+        """Lines ``start`` to ``start + count - 1`` (negative ``start`` counts from the end)"""
+        if not self._segments or count <= 0:
+            return []
+        if start < 0:
+            start = max(0, self.line_count() + start)
+        i = self._segment_for_line(start)
+        seg = self._segments[i]
+        if not seg.index_lines:
+            return []
+        line, offset = seg.seek_line(start)
+        result = []
+        for entry in self._iter_from(i, line, offset):
+            if entry.number >= start:
+                result.append(entry)
+                if len(result) >= count:
+                    break
+        return result
+
+    def tail(self, count: int = 100) -> List[ArchivedLine]:
+        """The last ``count`` lines"""
+        return self.lines(-count, count)
+
+    def between(self, start: float, end: float, limit: int = 1000) -> List[ArchivedLine]:
+        """Lines stamped within ``[start, end]`` (unix time), at most ``limit``"""
+        firsts = [s.first_time for s in self._segments if s.first_time is not None]
+        if not firsts:
+            return []
+        i = max(0, bisect.bisect_right(firsts, start) - 1)
+        line, offset = self._segments[i].seek_time(start)
+        result = []
+        for entry in self._iter_from(i, line, offset):
+            if entry.timestamp > end:
+                break
+            if entry.timestamp >= start:
+                result.append(entry)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def grep(self, pattern: str, regex: bool = False, ignore_case: bool = False,
+             limit: int = 1000) -> List[ArchivedLine]:
+        """
+        Lines containing ``pattern``
+
+        Plain text is searched in the mapped segments without splitting them
+        into lines; only regular expressions are matched line by line.
+
+        Args:
+            pattern: Text to look for (a regular expression if ``regex``)
+            regex: Treat ``pattern`` as a regular expression
+            ignore_case: Case-insensitive match
+            limit: Maximum number of lines returned
+
+        Returns:
+            Matching lines, oldest first
+        """
+        if not pattern:
+            return self.lines(0, limit)
+        needle = pattern.encode("utf-8")
+        if not regex and b"\n" not in needle and b"\t" not in needle and pattern.isascii():
+            flags = re.IGNORECASE if ignore_case else 0
+            if not _TIMESTAMP_BYTES.issuperset(needle):
+                # Cannot match inside the timestamp column, so every hit is a match
+                if ignore_case:
+                    literal = re.compile(re.escape(needle), flags)
+                    return self._collect(lambda mm: _find_starts(mm, literal.search), limit)
+                return self._collect(lambda mm: _find_starts(mm, mm.find, needle), limit)
+            # Digits also match timestamps: anchor to the text column
+            compiled = re.compile(rb"^[^\t\n]*\t[^\n]*?" + re.escape(needle), flags | re.MULTILINE)
+            return self._collect(lambda mm: (m.start() for m in compiled.finditer(mm)), limit)
+
+        flags = re.IGNORECASE if ignore_case else 0
+        compiled = re.compile(pattern if regex else re.escape(pattern), flags)
+        result = []
+        for entry in self._iter_from(0, 0, 0):
+            if compiled.search(entry.text):
+                result.append(entry)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def _collect(self, line_starts: Callable[[mmap.mmap], Iterator[int]],
+                 limit: int) -> List[ArchivedLine]:
+        """Lines at the offsets produced by ``line_starts`` for each mapped segment"""
+        result = []
+        for seg in self._segments:
+            mm = seg.open()
+            if mm is None or not seg.index_offsets:
+                continue
+            with mm:
+                line, pos = seg.first_line, 0
+                for start in line_starts(mm):
+                    end = mm.find(b"\n", start)
+                    if end == -1:
+                        break  # Record still being written
+                    # Count lines from the closest index entry, not from the segment start
+                    i = bisect.bisect_right(seg.index_offsets, start) - 1
+                    if seg.index_offsets[i] > pos:
+                        line, pos = seg.index_lines[i], seg.index_offsets[i]
+                    line += mm[pos:start].count(b"\n")
+                    pos = start
+                    result.append(_parse(line, mm[start:end + 1]))
+                    if len(result) >= limit:
+                        return result
+        return result
+
+
+def _find_starts(mm: mmap.mmap, search: Callable, needle: Optional[bytes] = None) -> Iterator[int]:
+    """
+    Start offsets of the lines with a hit, skipping to the next line after each one
+
+    ``search`` is ``mm.find`` (called with ``needle``) or the ``search``
+    method of a compiled pattern.
+    """
+    def find(pos: int) -> int:
+        if needle is not None:
+            return search(needle, pos)
+        match = search(mm, pos)
+        return -1 if match is None else match.start()
+
+    hit = find(0)
+    while hit != -1:
+        yield mm.rfind(b"\n", 0, hit) + 1
+        end = mm.find(b"\n", hit)
+        if end == -1:
+            return
+        hit = find(end + 1)
+
+
+class OutputArchive:
+    """
+    Directory of archived runs
+
+    :class:`PybricksManager` opens a run with :meth:`open_run` when a program
+    starts and writes its output lines as they arrive. The UI reads runs back
+    with :meth:`reader` (tail, grep, line and time ranges). Opening a run
+    prunes the oldest runs beyond ``max_runs`` or ``max_bytes``.
+    """
+
+    def __init__(self, directory: Optional[str] = None, segment_bytes: int = 4 * 1024 * 1024,
+                 index_interval: int = 256, max_runs: Optional[int] = 500,
+                 max_bytes: Optional[int] = 1024 * 1024 * 1024):
+        """
+        Args:
+            directory: Where runs are stored (default ``~/.cache/pybricks_manager/runs``,
+                override with ``PYBRICKS_RUN_ARCHIVE``)
+            segment_bytes: Segment size at which a new segment file is started
+            index_interval: Lines between index entries; a lookup scans at
+                most this many lines
+            max_runs: Runs kept; older ones are deleted (None for no limit)
+            max_bytes: Total size of the runs kept (None for no limit)
+        """
+        self.directory = directory or DEFAULT_ARCHIVE_DIR
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self._seq = 0
+        self._lock = threading.Lock()
+        # Runs being written by this process, never pruned
+        self._open: "weakref.WeakValueDictionary[str, RunLog]" = weakref.WeakValueDictionary()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def open_run(self, label: str = "") -> RunLog:
+        """Start a new run (``label`` is usually the hub address)"""
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = _LABEL_CHARS.sub("", label)
+        while True:
+            with self._lock:
+                self._seq += 1
+                run_id = f"{stamp}-{self._seq}" + (f"-{suffix}" if suffix else "")
+            path = os.path.join(self.directory, run_id)
+            try:
+                os.makedirs(path)
+                break
+            except FileExistsError:
+                continue  # Another session started a run in the same second
+        _update_meta(path, label=label, started=time.time(), ended=None, lines=None)
+        logger.info(f"Archiving output to {path}")
+        run = RunLog(path, run_id, self.segment_bytes, self.index_interval)
+        self._open[run_id] = run
+        self.prune()
+        return run
+
+    def prune(self) -> List[str]:
+        """
+        Delete the oldest runs until ``max_runs`` and ``max_bytes`` hold
+
+        Runs this archive is still writing are kept even if that means
+        staying over a limit.
+
+        Returns:
+            Ids of the deleted runs
+        """
+        if self.max_runs is None and self.max_bytes is None:
+            return []
+        runs = self.runs()
+        sizes = {run_id: _tree_size(os.path.join(self.directory, run_id)) for run_id in runs}
+        total = sum(sizes.values())
+        count = len(runs)
+        deleted = []
+        for run_id in reversed(runs):
+            over_count = self.max_runs is not None and count > self.max_runs
+            over_size = self.max_bytes is not None and total > self.max_bytes
+            if not over_count and not over_size:
+                break
+            active = self._open.get(run_id)
+            if active is not None and not active.closed:
+                continue
+            try:
+                shutil.rmtree(os.path.join(self.directory, run_id))
+            except OSError as e:
+                logger.warning(f"Could not delete archived run {run_id}: {e}")
+                continue
+            count -= 1
+            total -= sizes[run_id]
+            deleted.append(run_id)
+        if deleted:
+            logger.info(f"Pruned {len(deleted)} archived run(s), {count} left ({total} bytes)")
+        return deleted
+
+    def runs(self) -> List[str]:
+        """Run ids, newest first"""
+        try:
+            names = [e.name for e in os.scandir(self.directory) if e.is_dir()]
+        except OSError:
+            return []
+
+        def started(name: str):
+            # <date>-<time>-<seq>[-<label>]
+            parts = name.split("-")
+            seq = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+            return parts[:2], seq
+
+        return sorted(names, key=started, reverse=True)
+
+    def reader(self, run_id: str) -> RunReader:
+        path = os.path.join(self.directory, run_id)
+        if not os.path.isdir(path):
+            raise KeyError(f"Unknown run: {run_id}")
+        return RunReader(path)
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    try:
+        for entry in os.scandir(path):
+            if entry.is_file():
+                total += entry.stat().st_size
+    except OSError:
+        pass
+    return total
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_meta(path: str, **values):
+    meta = _read_meta(path)
+    meta.update(values)
+    tmp_path = os.path.join(path, "meta.json.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, "meta.json"))
+    except OSError as e:
+        logger.warning(f"Could not write run metadata: {e}")
@@ -0,0 +1,340 @@
+"""
+Benchmarks of PybricksManager against a simulated hub
+
+    python -m pybricks_manager bench -o results.json
+    python -m pybricks_manager bench --latency 30 --loss 0.05 --compare baseline.json
+
+Every benchmark drives a real :class:`PybricksManager` (scanner, pybricksdev
+hub, uploader, output buffer) connected to a :class:`SimulatedHub`, so no
+Bluetooth adapter is needed and results only move when the manager or the
+link profile change. Results are written as JSON and can be compared with
+those of another commit.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from .simhub import HubSimulator, LinkProfile, SimulatedHub
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the layout of the results file changes
+SCHEMA_VERSION = 1
+
+# Approximate program image sizes for the upload benchmark
+UPLOAD_SIZES = (1024, 4096, 16384, 65536)
+
+
+@dataclass
+class Measurement:
+    """Samples of one benchmark and their summary"""
+    name: str
+    unit: str
+    # "lower" for durations, "higher" for throughput
+    better: str = "lower"
+    samples: List[float] = field(default_factory=list)
+    # Extra facts about the run (sizes, line counts, ...)
+    info: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def median(self) -> Optional[float]:
+        return statistics.median(self.samples) if self.samples else None
+
+    def summary(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        return {
+            "unit": self.unit,
+            "better": self.better,
+            "n": len(samples),
+            "median": self.median,
+            "mean": statistics.fmean(samples) if samples else None,
+            "min": samples[0] if samples else None,
+            "max": samples[-1] if samples else None,
+            "p90": samples[min(len(samples) - 1, int(len(samples) * 0.9))] if samples else None,
+            "samples": self.samples,
+            **self.info,
+        }
+
+
+@dataclass
+class Comparison:
+    """Change of one benchmark's median between two result files"""
+    name: str
+    unit: str
+    before: Optional[float]
+    after: Optional[float]
+    # Relative change, positive when the benchmark got worse
+    worse_by: Optional[float]
+
+    def regressed(self, threshold: float) -> bool:
+        return self.worse_by is not None and self.worse_by > threshold
+
+
+def _script_of_size(size: int) -> str:
+    """A script whose program image is roughly ``size`` bytes"""
+    # Each line compiles to about 50 bytes of MPY (a unique 32 character
+    # string and the store to a unique name)
+    rng = random.Random(size)
+    lines = [f"v{i} = '{rng.getrandbits(128):032x}'" for i in range(max(1, size // 50))]
+    return "\n".join(lines) + "\nprint(len(v0))\n"
+
+
+async def _connect(manager, hub: SimulatedHub) -> float:
+    # The device cache would skip the scan that is part of a cold connect
+    manager.device_cache.discard(hub.address)
+    start = time.perf_counter()
+    await manager.connect(hub.address)
+    return time.perf_counter() - start
+
+
+async def bench_connect(manager, hub: SimulatedHub, repeat: int) -> Measurement:
+    """Scan-to-connect: from connect() with nothing cached to a usable hub"""
+    result = Measurement("scan_to_connect", "s")
+    for _ in range(repeat):
+        result.samples.append(await _connect(manager, hub))
+        await manager.disconnect()
+    return result
+
+
+async def bench_upload(manager, hub: SimulatedHub, repeat: int,
+                       sizes: Sequence[int] = UPLOAD_SIZES) -> List[Measurement]:
+    """Full program uploads by image size, checked against the hub RAM"""
+    results = []
+    for size in sizes:
+        script = _script_of_size(size)
+        result = Measurement(f"upload_{size // 1024}k", "B/s", better="higher")
+        for _ in range(repeat):
+            # Forget the image in hub RAM so every upload is a full one
+            manager._hub_image = None
+            length = await manager.upload_script(script)
+            image = manager._hub_image
+            if hub.program_size != length or bytes(hub.ram[:length]) != image:
+                raise RuntimeError(f"Hub RAM does not match the {length} byte image after upload")
+            stats = manager.last_upload
+            result.samples.append(stats.bytes_per_second)
+            result.info.update(bytes=length, packets=stats.packets)
+        results.append(result)
+    return results
+
+
+async def bench_start_stop(manager, hub: SimulatedHub, repeat: int) -> List[Measurement]:
+    """Run-start latency (to the running status and to the first line) and stop latency"""
+    from pybricksdev.ble.pybricks import StatusFlag
+
+    start_result = Measurement("run_start", "s")
+    output_result = Measurement("first_output", "s")
+    stop_result = Measurement("stop", "s")
+
+    async def program(hub: SimulatedHub):
+        await hub.print("ready")
+        await asyncio.Event().wait()
+
+    hub.program = program
+    await manager.upload_script("print('ready')")
+    for _ in range(repeat):
+        running = asyncio.Event()
+        first_line = asyncio.Event()
+
+        def handle_status(flags):
+            if flags & StatusFlag.USER_PROGRAM_RUNNING:
+                running.set()
+
+        def handle_output(lines: List[str]):
+            first_line.set()
+
+        manager.output_listeners.append(handle_output)
+        try:
+            with manager.hub.status_observable.subscribe(handle_status):
+                start = time.perf_counter()
+                await manager.start_script(wait=False)
+                await asyncio.wait_for(running.wait(), 5.0)
+                start_result.samples.append(time.perf_counter() - start)
+                await asyncio.wait_for(first_line.wait(), 5.0)
+                output_result.samples.append(time.perf_counter() - start)
+        finally:
+            manager.output_listeners.remove(handle_output)
+
+        start = time.perf_counter()
+        await manager.stop_script()
+        stop_result.samples.append(time.perf_counter() - start)
+    return [start_result, output_result, stop_result]
+
+
+async def bench_output(manager, hub: SimulatedHub, repeat: int,
+                       lines: int = 2000, width: int = 40) -> List[Measurement]:
+    """Output streaming: a program printing as fast as the link allows"""
+    text = "x" * (width - 6)
+
+    async def program(hub: SimulatedHub):
+        for i in range(lines):
+            await hub.print(f"{i:05d} {text}")
+
+    bytes_result = Measurement("output_throughput", "B/s", better="higher",
+                               info={"lines": lines, "width": width})
+    lines_result = Measurement("output_lines", "lines/s", better="higher")
+    hub.program = program
+    await manager.upload_script("print('stream')")
+    for _ in range(repeat):
+        received = []
+        done = asyncio.Event()
+
+        def handle_output(batch: List[str]):
+            received.extend(batch)
+            if len(received) >= lines:
+                done.set()
+
+        manager.output_listeners.append(handle_output)
+        try:
+            start = time.perf_counter()
+            await manager.start_script(wait=False)
+            await asyncio.wait_for(done.wait(), 60.0)
+            elapsed = time.perf_counter() - start
+        finally:
+            manager.output_listeners.remove(handle_output)
+        if received[:lines] != [f"{i:05d} {text}" for i in range(lines)]:
+            raise RuntimeError("Output lines were lost or reordered")
+        bytes_result.samples.append(lines * (width + 2) / elapsed)
+        lines_result.samples.append(lines / elapsed)
+        await manager.stop_script()
+    return [bytes_result, lines_result]
+
+
+async def _run_all(manager, hub: SimulatedHub, repeat: int, sizes: Sequence[int],
+                   output_lines: int) -> List[Measurement]:
+    results = [await bench_connect(manager, hub, repeat)]
+    await _connect(manager, hub)
+    try:
+        results += await bench_upload(manager, hub, repeat, sizes)
+        results += await bench_start_stop(manager, hub, repeat)
+        results += await bench_output(manager, hub, repeat, output_lines)
+    finally:
+        await manager.disconnect()
+        hub.reset()
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(link: Optional[LinkProfile] = None, repeat: int = 5,
+                   sizes: Sequence[int] = UPLOAD_SIZES, output_lines: int = 2000) -> Dict[str, Any]:
+    """
+    Run every benchmark against a simulated hub
+
+    Programs are compiled with a throwaway compile cache, so the user's
+    cache is neither used nor filled.
+
+    Args:
+        link: Simulated link timing (the :class:`LinkProfile` defaults)
+        repeat: Samples per benchmark
+        sizes: Approximate program image sizes for the upload benchmark
+        output_lines: Lines printed in the output streaming benchmark
+
+    Returns:
+        Results document (see :func:`save_results`)
+    """
+    from .compiler import CompileCache
+    from .manager import PybricksManager
+
+    link = link or LinkProfile()
+    simulator = HubSimulator()
+    hub = simulator.add_hub(link=link)
+    start = time.perf_counter()
+    with simulator, tempfile.TemporaryDirectory() as cache_dir:
+        manager = PybricksManager(compile_cache=CompileCache(cache_dir), auto_reconnect=False)
+        try:
+            results = manager.call(_run_all(manager, hub, repeat, sizes, output_lines))
+        finally:
+            manager.close()
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "link": asdict(link),
+        "repeat": repeat,
+        "elapsed": time.perf_counter() - start,
+        "link_packets": hub.link.packets,
+        "link_retransmissions": hub.link.retransmissions,
+        "results": {r.name: r.summary() for r in results},
+    }
+
+
+def save_results(document: Dict[str, Any], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    if document.get("schema") != SCHEMA_VERSION:
+        raise ValueError(f"{path}: unsupported results schema {document.get('schema')!r}")
+    return document
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Comparison]:
+    """
+    Compare the medians of two results documents
+
+    Benchmarks missing from either side are listed with None for that side.
+    """
+    before, after = baseline["results"], current["results"]
+    comparisons = []
+    for name in list(before) + [n for n in after if n not in before]:
+        old, new = before.get(name), after.get(name)
+        old_median = old["median"] if old else None
+        new_median = new["median"] if new else None
+        worse_by = None
+        if old_median and new_median is not None:
+            worse_by = (new_median - old_median) / old_median
+            if (new or old)["better"] == "higher":
+                worse_by = -worse_by
+        comparisons.append(Comparison(name, (new or old)["unit"], old_median, new_median, worse_by))
+    return comparisons
+
+
+def format_value(value: Optional[float], unit: str) -> str:
+    if value is None:
+        return "-"
+    if unit == "s":
+        return f"{value * 1000:.1f} ms"
+    if unit == "B/s":
+        return f"{value / 1024:.1f} KiB/s"
+    return f"{value:.0f} {unit}"
+
+
+def format_results(document: Dict[str, Any]) -> str:
+    rows = [f"{'benchmark':<20} {'median':>14} {'p90':>14} {'n':>4}"]
+    for name, r in document["results"].items():
+        rows.append(f"{name:<20} {format_value(r['median'], r['unit']):>14} "
+                    f"{format_value(r['p90'], r['unit']):>14} {r['n']:>4}")
+    return "\n".join(rows)
+
+
+def format_comparison(comparisons: List[Comparison], threshold: float) -> str:
+    rows = [f"{'benchmark':<20} {'before':>14} {'after':>14} {'change':>9}"]
+    for c in comparisons:
+        change = "" if c.worse_by is None else f"{(c.after - c.before) / c.before:+.1%}"
+        flag = "  REGRESSION" if c.regressed(threshold) else ""
+        rows.append(f"{c.name:<20} {format_value(c.before, c.unit):>14} "
+                    f"{format_value(c.after, c.unit):>14} {change:>9}{flag}")
+    return "\n".join(rows)
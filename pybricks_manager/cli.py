@@ -0,0 +1,414 @@
+"""
+Headless command line interface
+
+    python -m pybricks_manager scan
+    python -m pybricks_manager run examples/hello_world.py [-a ADDRESS]
+    python -m pybricks_manager run robot/main.py --project robot/
+    python -m pybricks_manager stop [-a ADDRESS]
+    python -m pybricks_manager watch [-a ADDRESS]
+    python -m pybricks_manager daemon
+    python -m pybricks_manager metrics
+    python -m pybricks_manager logs [RUN] [--grep TEXT]
+    python -m pybricks_manager bench [-o results.json] [--compare baseline.json]
+
+``run``, ``stop`` and ``watch`` connect to the hub themselves, or go through a
+running daemon with ``--daemon`` so that repeated calls (CI jobs, batch
+scripts) reuse one warm BLE connection. Only the standard library is imported
+until a command actually needs the BLE stack, which keeps ``--help`` and the
+daemon client fast.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_SOCKET = os.environ.get(
+    "PYBRICKS_MANAGER_SOCKET",
+    os.path.join(os.path.expanduser("~"), ".cache", "pybricks_manager", "daemon.sock"),
+)
+
+# Seconds to wait for a hub advertisement when no address is given
+SCAN_TIMEOUT = 10.0
+
+
+def _print_line(line: str):
+    print(line, flush=True)
+
+
+def _error(message: str) -> int:
+    print(f"error: {message}", file=sys.stderr)
+    return 1
+
+
+def _read_script(path: str) -> str:
+    if path == "-":
+        return sys.stdin.read()
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+# -- Daemon client ----------------------------------------------------------
+
+def daemon_request(message: Dict[str, Any], path: str = DEFAULT_SOCKET) -> Iterator[Dict[str, Any]]:
+    """
+    Send one request to a running daemon
+
+    Args:
+        message: Request with a ``cmd`` key (see :mod:`.daemon`)
+        path: Socket path
+
+    Yields:
+        Every reply message; the last one has an ``ok`` key
+    """
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as replies:
+            for raw in replies:
+                yield json.loads(raw)
+
+
+def _via_daemon(args, message: Dict[str, Any]) -> int:
+    try:
+        for reply in daemon_request(message, args.socket):
+            if "line" in reply:
+                _print_line(reply["line"])
+            elif not reply.get("ok"):
+                return _error(reply.get("error") or "request failed")
+            elif args.verbose:
+                print(json.dumps(reply), file=sys.stderr)
+    except (ConnectionError, FileNotFoundError) as e:
+        return _error(f"no daemon listening on {args.socket} ({e})")
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# -- Direct commands --------------------------------------------------------
+
+def _connected_manager(args, manager=None):
+    """A PybricksManager connected to the requested (or first found) hub"""
+    if manager is None:
+        from .manager import PybricksManager
+
+        manager = PybricksManager()
+    manager.output_callback = _print_line
+    address = args.address
+    if not address:
+        seen = manager.call(manager.scanner.wait_for(lambda d: d.is_pybricks, timeout=args.timeout))
+        if seen is None:
+            manager.close()
+            raise RuntimeError("No Pybricks hub found")
+        address = seen.address
+    try:
+        manager.call(manager.connect(address))
+    except Exception:
+        manager.close()
+        raise
+    return manager
+
+
+def cmd_scan(args) -> int:
+    from .manager import PybricksManager
+
+    manager = PybricksManager()
+    try:
+        manager.call(manager.scan_devices(timeout=args.timeout))
+        devices = manager.scanner.devices(pybricks_only=not args.all)
+    finally:
+        manager.close()
+
+    for d in devices:
+        rssi = "" if d.rssi is None else d.rssi
+        print(f"{d.address}\t{rssi}\t{d.name or ''}")
+    return 0 if devices else 1
+
+
+def cmd_run(args) -> int:
+    if args.project is not None:
+        if args.file == "-":
+            return _error("--project needs an entry file, not stdin")
+        entry = os.path.abspath(args.file)
+        directory = os.path.abspath(args.project or os.path.dirname(entry))
+        message = {"entry": entry, "project": directory}
+    else:
+        script = _read_script(args.file)
+        message = {"script": script}
+    if args.daemon:
+        if args.minify:
+            return _error("--minify is not supported with --daemon")
+        return _via_daemon(args, {"cmd": "run", "address": args.address,
+                                  "wait": not args.no_wait, **message})
+
+    from .manager import PybricksManager
+    from .minify import MinifyOptions
+
+    # Validate (and compile into the cache) before scanning or connecting
+    minify = None
+    if args.minify:
+        minify = MinifyOptions(strip_asserts=args.minify == "all", strip_debug=args.minify == "all")
+    manager = PybricksManager(minify=minify)
+    if args.project is not None:
+        from .project import Project
+
+        script = Project(entry, directory)
+        result = manager.call(manager.validate_project(script))
+    else:
+        result = manager.call(manager.validate_script(script.strip()))
+    for diagnostic in result.diagnostics:
+        where = os.path.join(directory, diagnostic.file) if diagnostic.file else args.file
+        print(f"{where}:{diagnostic.line}:{diagnostic.column}: {diagnostic.severity}: "
+              f"{diagnostic.message}", file=sys.stderr)
+    if result.reduction is not None:
+        print(f"{args.file}: minified {result.reduction}", file=sys.stderr)
+    if not result.ok:
+        manager.close()
+        return 1
+
+    manager = _connected_manager(args, manager)
+    job = None
+    try:
+        if args.no_wait and manager.can_download:
+            manager.call(manager.upload_script(script))
+            manager.call(manager.start_script(wait=False))
+        else:
+            job = manager.run_script(script)
+            job.wait()
+    except KeyboardInterrupt:
+        if job is not None:
+            # Stops the program; the job then ends as cancelled
+            job.cancel()
+            try:
+                job.wait(5.0)
+            except Exception:
+                pass
+        else:
+            manager.call(manager.stop_script())
+    finally:
+        manager.close()
+    return 0
+
+
+def cmd_stop(args) -> int:
+    if args.daemon:
+        return _via_daemon(args, {"cmd": "stop", "address": args.address})
+
+    manager = _connected_manager(args)
+    try:
+        manager.call(manager.stop_script())
+    finally:
+        manager.close()
+    return 0
+
+
+def cmd_watch(args) -> int:
+    if args.daemon:
+        return _via_daemon(args, {"cmd": "watch", "address": args.address})
+
+    import threading
+
+    manager = _connected_manager(args)
+    try:
+        # Output is printed from the manager loop until Ctrl-C
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+    return 0
+
+
+def cmd_daemon(args) -> int:
+    if args.stop:
+        return _via_daemon(args, {"cmd": "shutdown"})
+    if args.status:
+        for reply in daemon_request({"cmd": "status"}, args.socket):
+            print(json.dumps(reply.get("hubs", reply), indent=2))
+        return 0
+
+    from .daemon import Daemon
+    from .pool import HubPool
+
+    pool = None
+    if args.archive is not None:
+        from .archive import OutputArchive
+
+        pool = HubPool(archive=OutputArchive(args.archive or None))
+    Daemon(args.socket, pool=pool, scan_timeout=args.timeout).serve_forever()
+    return 0
+
+
+def cmd_metrics(args) -> int:
+    try:
+        replies = list(daemon_request({"cmd": "metrics"}, args.socket))
+    except (ConnectionError, FileNotFoundError) as e:
+        return _error(f"no daemon listening on {args.socket} ({e})")
+    reply = replies[-1]
+    if not reply.get("ok"):
+        return _error(reply.get("error") or "request failed")
+    if args.json:
+        print(json.dumps(reply["metrics"], indent=2))
+    else:
+        sys.stdout.write(reply["prometheus"])
+    return 0
+
+
+def cmd_logs(args) -> int:
+    from .archive import OutputArchive
+
+    archive = OutputArchive(args.archive)
+    runs = archive.runs()
+    if args.list:
+        for run_id in runs:
+            meta = archive.reader(run_id).meta
+            lines = "" if meta.get("lines") is None else meta["lines"]
+            print(f"{run_id}\t{lines}")
+        return 0
+    if not runs:
+        return _error(f"no runs archived in {archive.directory}")
+
+    reader = archive.reader(args.run or runs[0])
+    if args.grep:
+        entries = reader.grep(args.grep, regex=args.regex, ignore_case=args.ignore_case,
+                              limit=args.lines)
+    else:
+        entries = reader.tail(args.lines)
+    for entry in entries:
+        print(f"{entry.number}\t{entry.text}" if args.numbers else entry.text)
+    return 0
+
+
+def cmd_bench(args) -> int:
+    from . import bench
+    from .simhub import LinkProfile
+
+    baseline = bench.load_results(args.compare) if args.compare else None
+    link = LinkProfile(mtu=args.mtu, latency=args.latency / 1000, loss=args.loss, seed=args.seed)
+    document = bench.run_benchmarks(link, repeat=args.repeat)
+    if args.output:
+        bench.save_results(document, args.output)
+    if args.json:
+        print(json.dumps(document, indent=2))
+    else:
+        print(bench.format_results(document))
+    if baseline is None:
+        return 0
+
+    comparisons = bench.compare(baseline, document)
+    print(f"\nCompared with {baseline.get('commit') or args.compare}:")
+    if baseline.get("link") != document["link"]:
+        print("(the baseline was measured with a different link profile)")
+    print(bench.format_comparison(comparisons, args.threshold))
+    regressions = [c.name for c in comparisons if c.regressed(args.threshold)]
+    if regressions:
+        return _error(f"{len(regressions)} benchmark(s) regressed by more than "
+                      f"{args.threshold:.0%}: {', '.join(regressions)}")
+    return 0
+
+
+# -- Entry point ------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m pybricks_manager",
+        description="Run programs on Pybricks hubs without the Streamlit UI",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="show log messages")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_timeout(sub: argparse.ArgumentParser, default: float = SCAN_TIMEOUT):
+        sub.add_argument("-t", "--timeout", type=float, default=default,
+                         help="seconds to scan for a hub (default: %(default)s)")
+
+    def add_socket(sub: argparse.ArgumentParser):
+        sub.add_argument("--socket", default=DEFAULT_SOCKET,
+                         help="daemon socket path (default: $PYBRICKS_MANAGER_SOCKET or %(default)s)")
+
+    def add(name: str, func, summary: str, hub: bool = True) -> argparse.ArgumentParser:
+        sub = commands.add_parser(name, help=summary)
+        sub.set_defaults(func=func)
+        if hub:
+            add_timeout(sub)
+            add_socket(sub)
+            sub.add_argument("-a", "--address", help="hub Bluetooth address (default: first hub found)")
+            sub.add_argument("-d", "--daemon", action="store_true",
+                             help="send the command to a running daemon")
+        return sub
+
+    scan = add("scan", cmd_scan, "list hubs that are advertising", hub=False)
+    add_timeout(scan, 5.0)
+    scan.add_argument("--all", action="store_true", help="include non-Pybricks devices")
+
+    run = add("run", cmd_run, "download and run a program, printing its output")
+    run.add_argument("file", help="Python file to run ('-' for stdin)")
+    run.add_argument("--no-wait", action="store_true", help="return once the program has started")
+    run.add_argument("-p", "--project", nargs="?", const="", metavar="DIR",
+                     help="also upload the local modules the file imports from DIR "
+                          "(default: the file's directory)")
+    run.add_argument("--minify", nargs="?", const="safe", choices=("safe", "all"),
+                     help="strip docstrings, comments and whitespace before compiling; "
+                          "'all' also drops asserts and 'if DEBUG:' blocks")
+
+    add("stop", cmd_stop, "stop the running program")
+    add("watch", cmd_watch, "print hub output until Ctrl-C")
+
+    daemon = add("daemon", cmd_daemon, "keep hub connections open and serve requests on a Unix socket",
+                 hub=False)
+    add_timeout(daemon)
+    add_socket(daemon)
+    daemon.add_argument("--stop", action="store_true", help="shut down a running daemon")
+    daemon.add_argument("--status", action="store_true", help="show the hubs of a running daemon")
+    daemon.add_argument("--archive", nargs="?", const="", metavar="DIR",
+                        help="keep the output of every run on disk (default DIR: "
+                             "$PYBRICKS_RUN_ARCHIVE or ~/.cache/pybricks_manager/runs)")
+
+    logs = add("logs", cmd_logs, "show archived run output (latest run by default)", hub=False)
+    logs.add_argument("run", nargs="?", help="run id (see --list)")
+    logs.add_argument("--archive", metavar="DIR", help="archive directory (default: $PYBRICKS_RUN_ARCHIVE "
+                                                       "or ~/.cache/pybricks_manager/runs)")
+    logs.add_argument("--list", action="store_true", help="list archived runs, newest first")
+    logs.add_argument("-n", "--lines", type=int, default=50, help="lines to show (default: %(default)s)")
+    logs.add_argument("-g", "--grep", metavar="TEXT", help="show lines containing TEXT instead of the tail")
+    logs.add_argument("-E", "--regex", action="store_true", help="TEXT is a regular expression")
+    logs.add_argument("-i", "--ignore-case", action="store_true", help="case-insensitive --grep")
+    logs.add_argument("--numbers", action="store_true", help="prefix lines with their line number")
+
+    metrics = add("metrics", cmd_metrics, "print phase timings and counters of a running daemon",
+                  hub=False)
+    add_socket(metrics)
+    metrics.add_argument("--json", action="store_true",
+                         help="print a JSON snapshot instead of the Prometheus text format")
+
+    bench = add("bench", cmd_bench, "benchmark connect, upload, start, stop and output against a "
+                                    "simulated hub (no Bluetooth adapter needed)", hub=False)
+    bench.add_argument("-o", "--output", metavar="FILE", help="write the results as JSON to FILE")
+    bench.add_argument("--json", action="store_true", help="print the results as JSON")
+    bench.add_argument("--compare", metavar="FILE",
+                       help="compare with the results in FILE; exit with 1 on a regression")
+    bench.add_argument("--threshold", type=float, default=0.1,
+                       help="relative change of a median counted as a regression (default: %(default)s)")
+    bench.add_argument("-r", "--repeat", type=int, default=5, help="samples per benchmark (default: %(default)s)")
+    bench.add_argument("--mtu", type=int, default=185, help="simulated ATT MTU (default: %(default)s)")
+    bench.add_argument("--latency", type=float, default=15.0,
+                       help="simulated one-way latency in ms (default: %(default)s)")
+    bench.add_argument("--loss", type=float, default=0.0,
+                       help="probability that a packet is retransmitted (default: %(default)s)")
+    bench.add_argument("--seed", type=int, default=0, help="seed for simulated loss (default: %(default)s)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Configured before the manager module sets up INFO logging on import
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+    try:
+        return args.func(args)
+    except Exception as e:
+        return _error(str(e))
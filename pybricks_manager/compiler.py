@@ -0,0 +1,192 @@
+"""
+MicroPython compilation with an on-disk, content-addressed cache
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "PYBRICKS_MPY_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "pybricks_manager", "mpy"),
+)
+
+
+class CompileError(RuntimeError):
+    """mpy-cross rejected the script (message contains mpy-cross stderr)"""
+
+
+def compiler_version(abi: int) -> str:
+    """Version of the mpy-cross package used for the given MPY ABI"""
+    from importlib.metadata import version
+
+    return version(f"mpy-cross-v{abi}")
+
+
+def compile_source(source: str, abi: int = 6, file_name: str = "__main__.py") -> bytes:
+    """
+    Compile Python source to MPY in memory (blocking)
+
+    The source is piped to mpy-cross, so no file is written.
+
+    Args:
+        source: Python code
+        abi: MPY ABI major version (5 or 6)
+        file_name: Name reported in tracebacks on the hub
+
+    Returns:
+        Compiled MPY bytes
+
+    Raises:
+        CompileError: if mpy-cross reports an error
+    """
+    if abi == 6:
+        import mpy_cross_v6
+
+        proc, mpy = mpy_cross_v6.mpy_cross_compile(file_name, source)
+    elif abi == 5:
+        import mpy_cross_v5
+
+        proc, mpy = mpy_cross_v5.mpy_cross_compile(file_name, source, no_unicode=True)
+    else:
+        raise ValueError(f"Unsupported MPY ABI version: {abi}")
+
+    if proc.returncode != 0 or mpy is None:
+        raise CompileError(proc.stderr.decode(errors="replace").strip())
+
+    return mpy
+
+
+def pack_program(modules: Iterable[Tuple[str, bytes]]) -> bytes:
+    """
+    Pack compiled modules into a Pybricks multi-file program image
+
+    Each module is stored as size (uint32 little endian), zero-terminated
+    module name and MPY data. The first module is the one that runs.
+
+    Args:
+        modules: (module name, mpy bytes) pairs, entry point first
+    """
+    parts: List[bytes] = []
+    for name, mpy in modules:
+        parts.append(len(mpy).to_bytes(4, "little"))
+        parts.append(name.encode() + b"\x00")
+        parts.append(mpy)
+    return b"".join(parts)
+
+
+class CompileCache:
+    """
+    Size-capped cache of compiled MPY blobs on disk
+
+    Entries are keyed by a hash of the source, compiler version and ABI, so a
+    key never needs invalidating. Writes go to a temp file that is atomically
+    renamed into place, which makes the directory safe to share between
+    concurrent sessions and processes. File modification time is used as the
+    LRU clock; when the total size exceeds ``max_bytes`` the oldest entries
+    are removed.
+    """
+
+    SUFFIX = ".mpy"
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 32 * 1024 * 1024):
+        self.directory = directory or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(source: str, abi, compiler: str, extra: str = "") -> str:
+        """Content address for a compile job"""
+        h = hashlib.sha256()
+        for part in (compiler, str(abi), extra):
+            h.update(part.encode())
+            h.update(b"\x00")
+        h.update(source.encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached MPY bytes or None"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store MPY bytes (atomic) and evict old entries if over the size cap"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write compile cache entry: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.SUFFIX):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                # Already removed by another session
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove all cached entries"""
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,202 @@
+"""
+Long-running daemon that keeps hub connections warm behind a Unix socket
+
+Clients send one JSON request per connection and read JSON lines back::
+
+    {"cmd": "run", "address": "A4:C1:38:12:34:56", "script": "...", "wait": true}
+    {"cmd": "run", "entry": "/robot/main.py", "project": "/robot", "wait": true}
+
+    {"line": "Hello from SPIKE!"}
+    {"ok": true, "address": "A4:C1:38:12:34:56", "upload_time": 0.21, ...}
+
+Output lines are streamed as ``{"line": ...}`` while a command runs; the last
+message always has an ``ok`` key. Commands: ``status``, ``connect``, ``run``,
+``stop``, ``watch`` (streams output until the client disconnects),
+``metrics``, ``disconnect`` and ``shutdown``. A ``run`` with ``entry`` and ``project``
+paths builds a :class:`Project` from the daemon's file system; projects are
+kept between requests, so only edited modules are compiled again. Runs go
+through the hub's job queue; ``"policy": "replace"`` (or ``"preempt"``)
+instead of the default ``"queue"`` stops a program that is still running. The client
+side is in :mod:`.cli`.
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import socket
+from typing import Any, Dict, Optional, Tuple
+
+from .jobs import RunPolicy
+from .pool import HubPool, HubResult
+from .project import Project
+
+logger = logging.getLogger(__name__)
+
+# Seconds between output polls while streaming to a client
+OUTPUT_POLL_INTERVAL = 0.05
+
+
+class Daemon:
+    """
+    Unix socket front end for a :class:`HubPool`
+
+    The server runs on the pool's event loop, so requests call the pool
+    coroutines directly and every client shares the same connections.
+    """
+
+    def __init__(self, path: str, pool: Optional[HubPool] = None,
+                 scan_timeout: float = 10.0):
+        """
+        Args:
+            path: Socket path
+            pool: Pool holding the connections (a new one by default)
+            scan_timeout: Seconds to wait for a hub when a request has no address
+        """
+        self.path = path
+        self.pool = pool or HubPool()
+        self.scan_timeout = scan_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._projects: Dict[Tuple[str, str], Project] = {}
+
+    def serve_forever(self):
+        """Serve until a ``shutdown`` request or KeyboardInterrupt (blocking)"""
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("Daemon mode needs Unix domain sockets (not available on this platform)")
+        serving = self.pool.submit(self._serve())
+        try:
+            serving.result()
+        except KeyboardInterrupt:
+            self.pool.call(self._cmd_shutdown({}, None, None))
+            serving.result(timeout=5.0)
+        finally:
+            self.pool.close()
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            # Left behind by a daemon that did not exit cleanly
+            os.unlink(self.path)
+
+        self._server = await asyncio.start_unix_server(self._handle_client, self.path)
+        os.chmod(self.path, 0o600)
+        logger.info(f"Daemon listening on {self.path}")
+        try:
+            await self._stopped.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            logger.info("Daemon stopped")
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def send(message: Dict[str, Any]):
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            request = json.loads(await reader.readline() or b"{}")
+            handler = getattr(self, f"_cmd_{request.get('cmd')}", None)
+            if handler is None:
+                await send({"ok": False, "error": f"Unknown command: {request.get('cmd')}"})
+            else:
+                await send(await handler(request, send, reader))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Request failed: {e}")
+            try:
+                await send({"ok": False, "error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    # -- Helpers -------------------------------------------------------------
+
+    async def _resolve(self, address: Optional[str]) -> str:
+        """The requested hub, else the only connected one, else the first one heard"""
+        if address:
+            return address
+        connected = [a for a in self.pool.addresses if self.pool.manager(a).connected]
+        if len(connected) == 1:
+            return connected[0]
+        seen = await self.pool.scanner.wait_for(lambda d: d.is_pybricks, timeout=self.scan_timeout)
+        if seen is None:
+            raise RuntimeError("No Pybricks hub found")
+        return seen.address
+
+    async def _connect(self, address: Optional[str]) -> HubResult:
+        address = await self._resolve(address)
+        result = await self.pool.connect(address)
+        if not result.ok:
+            raise RuntimeError(f"Could not connect to {address}: {result.error}")
+        return result
+
+    async def _stream_output(self, address: str, send, until: asyncio.Future):
+        """Send output lines of a hub until ``until`` completes"""
+        output = self.pool.manager(address).output
+        cursor = output.cursor
+        while True:
+            done = until.done()
+            lines, cursor = output.read(cursor)
+            for line in lines:
+                await send({"line": line})
+            if done:
+                return
+            await asyncio.wait([until], timeout=OUTPUT_POLL_INTERVAL)
+
+    def _project(self, entry: str, directory: Optional[str]) -> Project:
+        """The project for an entry file, reused so its compiled modules stay warm"""
+        project = Project(entry, directory)
+        return self._projects.setdefault((project.entry, project.directory), project)
+
+    # -- Commands ------------------------------------------------------------
+
+    async def _cmd_status(self, request, send, reader) -> Dict[str, Any]:
+        return {"ok": True, "hubs": {a: s.value for a, s in self.pool.states().items()}}
+
+    async def _cmd_connect(self, request, send, reader) -> Dict[str, Any]:
+        return dataclasses.asdict(await self._connect(request.get("address")))
+
+    async def _cmd_run(self, request, send, reader) -> Dict[str, Any]:
+        address = (await self._connect(request.get("address"))).address
+        if request.get("entry"):
+            script = self._project(request["entry"], request.get("project"))
+        else:
+            script = request["script"]
+        job = asyncio.ensure_future(
+            self.pool.map_run({address: script}, wait=request.get("wait", True),
+                              policy=RunPolicy(request.get("policy", "queue")))
+        )
+        await self._stream_output(address, send, job)
+        return dataclasses.asdict(job.result()[address])
+
+    async def _cmd_stop(self, request, send, reader) -> Dict[str, Any]:
+        address = await self._resolve(request.get("address"))
+        return dataclasses.asdict(await self.pool.stop(address))
+
+    async def _cmd_watch(self, request, send, reader) -> Dict[str, Any]:
+        address = (await self._connect(request.get("address"))).address
+        # Ends when the client closes its side of the connection
+        closed = asyncio.ensure_future(reader.read())
+        await self._stream_output(address, send, closed)
+        return {"ok": True, "address": address}
+
+    async def _cmd_metrics(self, request, send, reader) -> Dict[str, Any]:
+        metrics = self.pool.metrics
+        return {"ok": True, "metrics": metrics.snapshot(), "prometheus": metrics.prometheus()}
+
+    async def _cmd_disconnect(self, request, send, reader) -> Dict[str, Any]:
+        address = await self._resolve(request.get("address"))
+        await self.pool.disconnect(address)
+        return {"ok": True, "address": address}
+
+    async def _cmd_shutdown(self, request, send, reader) -> Dict[str, Any]:
+        if self._stopped is not None:
+            self._stopped.set()
+        return {"ok": True}
+
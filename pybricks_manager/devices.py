@@ -0,0 +1,91 @@
+"""
+Cache of discovered Bluetooth devices
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+
+
+class DeviceCache:
+    """
+    LRU cache of ``BLEDevice`` objects keyed by Bluetooth address
+
+    Filled from scan results and advertisement callbacks so that
+    :meth:`PybricksManager.connect` can skip scanning for a hub that was seen
+    recently. Entries expire after ``ttl`` seconds because the OS may forget
+    the device (or the hub may have been switched off) in the meantime.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 32,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(address: str) -> str:
+        return address.strip().upper()
+
+    def put(self, device: "BLEDevice"):
+        """Add or refresh a device"""
+        key = self._key(device.address)
+        with self._lock:
+            self._entries[key] = (device, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, address: str) -> Optional["BLEDevice"]:
+        """
+        Look up a device by address
+
+        Args:
+            address: Bluetooth address (case-insensitive)
+
+        Returns:
+            The cached BLEDevice, or None on a miss or stale entry
+        """
+        key = self._key(address)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def discard(self, address: str):
+        """Remove a device, e.g. after connecting to it failed"""
+        with self._lock:
+            self._entries.pop(self._key(address), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __contains__(self, address: str) -> bool:
+        key = self._key(address)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._clock() - entry[1] <= self.ttl
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,419 @@
+"""
+Run handles and the per-hub job queue
+"""
+import asyncio
+import collections
+import enum
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+from .minify import MinifyOptions
+from .output import OutputBuffer
+from .project import Project
+
+if TYPE_CHECKING:
+    from .manager import PybricksManager
+
+logger = logging.getLogger(__name__)
+
+
+class JobState(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class RunPolicy(enum.Enum):
+    """What a new job does to the program that is running"""
+    # Wait behind running and queued jobs of the same or higher priority
+    QUEUE = "queue"
+    # Stop the running program and drop the queue; the new job runs next
+    REPLACE = "replace"
+    # Stop the running program if the new job has a higher priority
+    PREEMPT = "preempt"
+
+
+# Allowed state transitions per job
+_TRANSITIONS = {
+    JobState.QUEUED: {JobState.RUNNING, JobState.CANCELLED},
+    JobState.RUNNING: {JobState.DONE, JobState.FAILED, JobState.CANCELLED},
+    JobState.DONE: set(),
+    JobState.FAILED: set(),
+    JobState.CANCELLED: set(),
+}
+
+_FINISHED = (JobState.DONE, JobState.FAILED, JobState.CANCELLED)
+
+
+class JobCancelled(RuntimeError):
+    """The job was cancelled or replaced before it finished"""
+
+
+class Job:
+    """
+    Handle for one program run, returned by :meth:`PybricksManager.run_script`
+
+    The handle is usable from any thread: read ``state``, fetch output with
+    :meth:`read` or :meth:`follow`, :meth:`cancel` it, or block in
+    :meth:`wait`. On the manager loop, ``await job`` waits for the run and
+    raises its error, and ``async for line in job`` streams its output.
+    """
+
+    def __init__(self, queue: "JobQueue", job_id: int, script: Union[str, Project],
+                 priority: int, policy: RunPolicy, output_capacity: int,
+                 minify: Optional[MinifyOptions] = None):
+        self.id = job_id
+        self.script = script
+        self.priority = priority
+        self.policy = policy
+        # Build options of this run, fixed when it was submitted
+        self.minify = minify
+        self.state = JobState.QUEUED
+        self.error: Optional[BaseException] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # When the program was uploaded and started on the hub
+        self.program_started_at: Optional[float] = None
+        self.output = OutputBuffer(output_capacity)
+        self._queue = queue
+        self._finished = threading.Event()
+        self._changed = threading.Condition()
+        # Created lazily so they bind to the manager loop
+        self._done_future: Optional[asyncio.Future] = None
+        self._output_event: Optional[asyncio.Event] = None
+        self._started_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __repr__(self) -> str:
+        return f"<Job {self.id} {self.state.value} priority={self.priority}>"
+
+    # -- State ---------------------------------------------------------------
+
+    @property
+    def done(self) -> bool:
+        return self.state in _FINISHED
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        """Seconds the job has been running (or ran)"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def _set_state(self, state: JobState, error: Optional[BaseException] = None):
+        if state not in _TRANSITIONS[self.state]:
+            raise RuntimeError(f"Job {self.id} is {self.state.value}, cannot become {state.value}")
+        self.state = state
+        if state == JobState.RUNNING:
+            self.started_at = time.time()
+        elif state in _FINISHED:
+            self.finished_at = time.time()
+            self.error = error
+            if self._done_future is not None and not self._done_future.done():
+                self._done_future.set_result(None)
+            self._finished.set()
+            if self._started_event is not None:
+                self._started_event.set()
+        self._notify()
+        logger.info(f"Job {self.id}: {state.value}" + (f" ({error})" if error else ""))
+        self._queue._job_changed(self)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Status summary (JSON serialisable)"""
+        return {
+            "id": self.id,
+            "state": self.state.value,
+            "priority": self.priority,
+            "policy": self.policy.value,
+            "submitted_at": self.submitted_at,
+            "elapsed": self.elapsed,
+            "error": None if self.error is None else str(self.error),
+            "lines": self.output.cursor,
+        }
+
+    # -- Output --------------------------------------------------------------
+
+    def _feed(self, lines: List[str]):
+        for line in lines:
+            self.output.append(line)
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+        if self._output_event is not None:
+            self._output_event.set()
+
+    def read(self, cursor: int = 0):
+        """Output lines since ``cursor`` (see :meth:`OutputBuffer.read`)"""
+        return self.output.read(cursor)
+
+    def follow(self, timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        Yield output lines as they arrive until the job finishes (blocking)
+
+        Args:
+            timeout: Stop after this many seconds even if the job still runs
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        cursor = 0
+        while True:
+            lines, cursor = self.output.read(cursor)
+            if lines:
+                yield from lines
+                continue
+            if self.done:
+                return
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return
+            with self._changed:
+                # Checked under the lock so a notification cannot be missed
+                if self.output.cursor == cursor and not self.done:
+                    self._changed.wait(remaining)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """Stream output lines on the manager loop until the job finishes"""
+        if self._output_event is None:
+            self._output_event = asyncio.Event()
+        cursor = 0
+        while True:
+            self._output_event.clear()
+            lines, cursor = self.output.read(cursor)
+            for line in lines:
+                yield line
+            if self.done:
+                lines, cursor = self.output.read(cursor)
+                for line in lines:
+                    yield line
+                return
+            await self._output_event.wait()
+
+    # -- Waiting and cancelling ---------------------------------------------
+
+    async def result(self) -> "Job":
+        """
+        Wait on the manager loop until the job has finished
+
+        Returns:
+            The job itself
+
+        Raises:
+            JobCancelled: if the job was cancelled or replaced
+            Exception: whatever made the run fail
+        """
+        if not self.done:
+            if self._done_future is None:
+                self._done_future = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._done_future)
+        return self._outcome()
+
+    async def started(self) -> "Job":
+        """
+        Wait on the manager loop until the program runs on the hub
+
+        Returns early if the job finishes first (e.g. legacy firmware, which
+        uploads and runs in one step).
+
+        Raises:
+            Same as :meth:`result` if the job failed or was cancelled before
+            its program started
+        """
+        if self.program_started_at is None and not self.done:
+            if self._started_event is None:
+                self._started_event = asyncio.Event()
+            await self._started_event.wait()
+        if self.program_started_at is None:
+            return self._outcome()
+        return self
+
+    def _mark_started(self):
+        self.program_started_at = time.time()
+        if self._started_event is not None:
+            self._started_event.set()
+
+    def __await__(self):
+        return self.result().__await__()
+
+    def wait(self, timeout: Optional[float] = None) -> "Job":
+        """Block another thread until the job has finished (same results as :meth:`result`)"""
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"Job {self.id} still {self.state.value} after {timeout}s")
+        return self._outcome()
+
+    def _outcome(self) -> "Job":
+        if self.state == JobState.CANCELLED:
+            raise JobCancelled(f"Job {self.id} was cancelled")
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def cancel(self):
+        """Drop the job from the queue, or stop its program if it is running (thread-safe)"""
+        self._queue._call_soon(self._queue._cancel, self)
+
+
+class JobQueue:
+    """
+    Runs jobs on one hub, highest priority first
+
+    Jobs of equal priority run in submission order. While a program runs,
+    the next job is already compiled (into the compile cache), so queued
+    jobs start back to back. Finished jobs are kept in ``history``.
+    """
+
+    def __init__(self, manager: "PybricksManager", output_capacity: int = 10000,
+                 history: int = 50):
+        self.manager = manager
+        self.output_capacity = output_capacity
+        self.history = collections.deque(maxlen=history)
+        self.current: Optional[Job] = None
+        # Called on the manager loop whenever a job changes state
+        self.listeners: List[Callable[[Job], None]] = []
+        self._heap: List[tuple] = []
+        self._ids = itertools.count(1)
+        self._order = itertools.count()
+        self._worker: Optional[asyncio.Task] = None
+        manager.output_listeners.append(self._handle_output)
+
+    # -- Submitting ----------------------------------------------------------
+
+    def submit(self, script: Union[str, Project], priority: int = 0,
+               policy: RunPolicy = RunPolicy.QUEUE, minify: Optional[MinifyOptions] = None) -> Job:
+        """Queue a run and return its handle right away (thread-safe)"""
+        job = Job(self, next(self._ids), script, priority, policy, self.output_capacity, minify)
+        self._call_soon(self._enqueue, job)
+        return job
+
+    def _call_soon(self, func, *args):
+        if self.manager._loop_thread.in_loop_thread():
+            func(*args)
+        else:
+            self.manager.loop.call_soon_threadsafe(func, *args)
+
+    def _enqueue(self, job: Job):
+        current = self.current
+        if job.policy == RunPolicy.REPLACE:
+            for queued in self.queued():
+                self._cancel(queued)
+            if current is not None:
+                self._cancel(current)
+        elif job.policy == RunPolicy.PREEMPT and current is not None and job.priority > current.priority:
+            self._cancel(current)
+
+        heapq.heappush(self._heap, (-job.priority, next(self._order), job))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._work())
+
+    def queued(self) -> List[Job]:
+        """Jobs waiting to run, in the order they will run"""
+        return [entry[2] for entry in sorted(self._heap) if entry[2].state == JobState.QUEUED]
+
+    def jobs(self) -> List[Job]:
+        """Finished, running and queued jobs, oldest first"""
+        running = [self.current] if self.current is not None else []
+        return list(self.history) + running + self.queued()
+
+    # -- Cancelling ----------------------------------------------------------
+
+    def _cancel(self, job: Job):
+        if job.state == JobState.QUEUED:
+            job._set_state(JobState.CANCELLED)
+            self.history.append(job)
+        elif job.state == JobState.RUNNING and job._task is not None:
+            job._task.cancel()
+
+    def cancel_all(self):
+        """Cancel the running job and everything queued (thread-safe)"""
+        def cancel():
+            for job in self.queued():
+                self._cancel(job)
+            if self.current is not None:
+                self._cancel(self.current)
+        self._call_soon(cancel)
+
+    # -- Worker --------------------------------------------------------------
+
+    def _pop(self) -> Optional[Job]:
+        while self._heap:
+            job = heapq.heappop(self._heap)[2]
+            if job.state == JobState.QUEUED:
+                return job
+        return None
+
+    async def _work(self):
+        while True:
+            job = self._pop()
+            if job is None:
+                return
+            self.current = job
+            try:
+                await self._execute(job)
+            finally:
+                self.current = None
+                self.history.append(job)
+
+    async def _execute(self, job: Job):
+        job._set_state(JobState.RUNNING)
+        job._task = asyncio.ensure_future(self.manager._run(job.script, job.minify))
+        self._prefetch()
+        try:
+            await job._task
+        except asyncio.CancelledError:
+            if not job._task.cancelled():
+                raise  # The worker itself was cancelled
+            await self._stop_program()
+            job._set_state(JobState.CANCELLED)
+        except Exception as e:
+            job._set_state(JobState.FAILED, e)
+        else:
+            job._set_state(JobState.DONE)
+
+    def _prefetch(self):
+        """Compile the next job in the background while this one runs"""
+        queued = self.queued()
+        manager = self.manager
+        if not queued or not manager.connected or not manager.can_download:
+            return
+
+        async def compile_next(job: Job):
+            try:
+                # Untimed, so the compile histogram only holds compiles someone waited for
+                await manager._compile(job.script, job.minify)
+            except Exception as e:
+                # Reported again when the job runs
+                logger.debug(f"Prefetch compile failed: {e}")
+
+        asyncio.ensure_future(compile_next(queued[0]))
+
+    async def _stop_program(self):
+        """Stop a program whose job was cancelled mid-run"""
+        if not self.manager.connected:
+            return
+        try:
+            await self.manager.stop_script()
+        except Exception as e:
+            logger.warning(f"Could not stop cancelled program: {e}")
+
+    def _program_started(self):
+        """Called by the manager once the running job's program has started"""
+        if self.current is not None and self.current.state == JobState.RUNNING:
+            self.current._mark_started()
+
+    def _job_changed(self, job: Job):
+        for listener in list(self.listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"Job listener failed: {e}")
+
+    def _handle_output(self, lines: List[str]):
+        if self.current is not None:
+            self.current._feed(lines)
@@ -0,0 +1,329 @@
+"""
+Live mode - a resident agent on the hub that runs code sent over stdin
+"""
+import ast
+import asyncio
+import collections
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from .jobs import Job, JobState, RunPolicy
+from .minify import minify
+from .preflight import PreflightError
+
+if TYPE_CHECKING:
+    from .manager import PybricksManager
+
+logger = logging.getLogger(__name__)
+
+# Starts every line the agent prints about a request (0x1F, ASCII unit
+# separator, like the 0x1E telemetry frames never appears in printed text)
+MARKER = "\x1f"
+
+# Program uploaded once per live session. Each request is one stdin line
+# "<id> <kind> <first line - 1> <source as a Python string literal>"; the
+# source is padded back to its first line, so functions and tracebacks carry
+# the line numbers of the editor. The answer is one line
+# "<MARKER><id> ok|err <hub ms> <repr of the value or traceback>". Code runs
+# in a namespace whose __name__ is "__live__", so an
+# ``if __name__ == "__main__":`` block is skipped.
+AGENT_FILE = "__main__.py"
+AGENT_SOURCE = '''\
+from usys import stdin, print_exception
+from uio import StringIO
+from pybricks.tools import StopWatch
+
+clock = StopWatch()
+ns = {"__name__": "__live__"}
+print("\\x1f0 ok 0 'ready'")
+while True:
+    rid = "0"
+    try:
+        line = stdin.readline()
+        if not line.strip():
+            continue
+        rid, kind, offset, arg = line.split(" ", 3)
+        src = "\\n" * int(offset) + eval(arg)
+        clock.reset()
+        value = None
+        if kind == "e":
+            value = repr(eval(src, ns))
+        elif kind == "x":
+            exec(src, ns)
+        elif kind == "r":
+            ns = {"__name__": "__live__"}
+        print("\\x1f" + rid, "ok", clock.time(), repr(value))
+    except (Exception, KeyboardInterrupt) as e:
+        buf = StringIO()
+        print_exception(e, buf)
+        print("\\x1f" + rid, "err", clock.time(), repr(buf.getvalue()))
+'''
+
+class LiveError(RuntimeError):
+    """The agent is not running or did not answer (fall back to a normal run)"""
+
+
+@dataclass
+class LiveResult:
+    """Outcome of one request to the agent"""
+    request_id: int
+    ok: bool
+    # repr() of the value of an expression (None for statements)
+    value: Optional[str] = None
+    # Hub traceback (line numbers of the editor script for synced code)
+    error: Optional[str] = None
+    # Time spent executing on the hub and for the whole round trip
+    hub_ms: int = 0
+    elapsed: float = 0.0
+    # Bytes written to stdin and top-level statements sent
+    sent: int = 0
+    statements: int = 0
+
+
+class LiveSession:
+    """
+    Keeps code running in a persistent namespace on the hub
+
+    :meth:`start` runs a small agent program as a job, once. After that
+    :meth:`sync` sends only the top-level statements of a script that
+    changed since the last sync (an edited function, a new gain constant)
+    and :meth:`execute` runs a snippet, both over the hub's stdin, so an
+    edit takes a few BLE round trips instead of a stop, compile, upload and
+    start, and motor and sensor objects keep their state.
+
+    Any other run replaces the agent job and ends the session; the next
+    :meth:`sync` starts a new agent. When the agent cannot be started or
+    stops answering, requests raise :class:`LiveError` and callers fall back
+    to :meth:`PybricksManager.run_script`. Methods run on the manager loop.
+    """
+
+    def __init__(self, manager: "PybricksManager"):
+        self.manager = manager
+        self.job: Optional[Job] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ready: Optional[asyncio.Future] = None
+        # Source of every top-level statement the agent has executed
+        self._executed: collections.Counter = collections.Counter()
+        manager.output_listeners.append(self._handle_output)
+        manager.jobs.listeners.append(self._handle_job)
+
+    @property
+    def active(self) -> bool:
+        """True while the agent runs and has answered"""
+        return (self.job is not None and self.job.state == JobState.RUNNING
+                and self._ready is not None and self._ready.done() and not self._ready.exception())
+
+    # -- Agent ---------------------------------------------------------------
+
+    async def start(self, timeout: float = 15.0):
+        """
+        Run the agent, replacing whatever program is running (no-op if active)
+
+        Raises:
+            LiveError: if the agent did not report ready within ``timeout``
+                seconds (it is stopped again)
+        """
+        if self.active:
+            return
+        if not self.manager.connected:
+            raise LiveError("Not connected to hub")
+        self._executed.clear()
+        self._ready = asyncio.get_running_loop().create_future()
+        self.job = self.manager.run_script(AGENT_SOURCE, policy=RunPolicy.REPLACE)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except asyncio.TimeoutError:
+            self.job.cancel()
+            raise LiveError(f"Live agent did not start within {timeout:g}s")
+        except LiveError:
+            error = self.job.error
+            if isinstance(error, PreflightError):
+                raise error
+            raise LiveError(f"Live agent stopped: {error or self.job.state.value}")
+        logger.info(f"Live agent ready in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    async def stop(self):
+        """Stop the agent program"""
+        job = self.job
+        if job is not None and not job.done:
+            job.cancel()
+            try:
+                await job
+            except Exception:
+                pass
+
+    async def interrupt(self):
+        """Send Ctrl-C to stop a snippet that is still running (if the firmware handles it on stdin)"""
+        if self.active:
+            await self.manager.hub.write(b"\x03")
+
+    async def reset(self, timeout: float = 5.0) -> LiveResult:
+        """Clear the agent namespace; the next :meth:`sync` sends the whole script"""
+        result = await self._request("r", "", 0, timeout)
+        self._executed.clear()
+        return result
+
+    # -- Requests ------------------------------------------------------------
+
+    async def execute(self, code: str, timeout: float = 10.0) -> LiveResult:
+        """
+        Run a snippet in the agent namespace (starting the agent if needed)
+
+        A single expression returns its ``repr()`` in ``value``, like the REPL.
+
+        Raises:
+            PreflightError: if the snippet has errors (nothing is sent)
+            LiveError: if the agent is not available or did not answer
+                within ``timeout`` seconds
+        """
+        await self._check(code)
+        try:
+            ast.parse(code, mode="eval")
+            kind = "e"
+        except SyntaxError:
+            kind = "x"
+        if not self.active:
+            await self.start()
+        return await self._request(kind, code, 0, timeout)
+
+    async def sync(self, script: str, timeout: float = 10.0) -> LiveResult:
+        """
+        Bring the agent up to date with ``script`` (starting it if needed)
+
+        Top-level statements whose source the agent has already executed
+        are skipped; the others are sent in order as one request, at their
+        original line numbers so tracebacks point at the editor. A statement
+        that only changed because something it depends on changed is not
+        run again; :meth:`reset` starts from scratch.
+
+        Raises:
+            PreflightError: if the script has errors (nothing is sent)
+            LiveError: if the agent is not available or did not answer
+        """
+        await self._check(script)
+        if not self.active:
+            await self.start()
+
+        statements = _statements(script)
+        seen = collections.Counter()
+        changed = []
+        for lineno, source in statements:
+            seen[source] += 1
+            if seen[source] > self._executed[source]:
+                changed.append((lineno, source))
+        if not changed:
+            return LiveResult(0, True)
+
+        # Keep the gaps between changed statements so line numbers still match
+        first = end = changed[0][0]
+        code = ""
+        for lineno, source in changed:
+            code += "\n" * (lineno - end) + source
+            end = lineno + source.count("\n")
+        result = await self._request("x", code, first - 1, timeout)
+        result.statements = len(changed)
+        if result.ok:
+            self._executed = seen
+        logger.info(f"Live sync: {len(changed)} of {len(statements)} statement(s), "
+                    f"{result.sent} bytes, {result.elapsed * 1000:.0f} ms")
+        return result
+
+    async def _check(self, code: str):
+        result = await self.manager.preflight.check(code, compile=False)
+        if result.errors:
+            raise PreflightError(result.diagnostics)
+
+    async def _request(self, kind: str, code: str, line_offset: int, timeout: float) -> LiveResult:
+        if not self.active or not self.manager.hub:
+            raise LiveError("Live agent is not running")
+        if kind == "x":
+            # Same line numbers, fewer bytes over BLE
+            loop = asyncio.get_running_loop()
+            reduced = await loop.run_in_executor(None, minify, code)
+            code = reduced.source
+        request_id = next(self._ids)
+        message = f"{request_id} {kind} {line_offset} {ascii(code)}"
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        try:
+            await self.manager.hub.write_line(message)
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise LiveError(f"No answer from the live agent within {timeout:g}s "
+                            f"(still running? interrupt() or stop it)")
+        finally:
+            self._pending.pop(request_id, None)
+        result.elapsed = time.perf_counter() - start
+        result.sent = len(message) + 1
+        self.manager.metrics.observe("live", result.elapsed)
+        self.manager.metrics.inc("live_bytes_sent", result.sent)
+        return result
+
+    # -- Hub output ----------------------------------------------------------
+
+    def _handle_output(self, lines: List[str]):
+        for line in lines:
+            if line.startswith(MARKER):
+                self._handle_answer(line[len(MARKER):])
+
+    def _handle_answer(self, text: str):
+        try:
+            request_id, status, hub_ms, payload = text.split(" ", 3)
+            request_id = int(request_id)
+            payload = ast.literal_eval(payload)
+        except (ValueError, SyntaxError) as e:
+            logger.warning(f"Unreadable live agent answer {text!r}: {e}")
+            return
+
+        if request_id == 0 and status == "ok":
+            if self._ready is not None and not self._ready.done():
+                self._ready.set_result(None)
+            return
+        future = self._pending.get(request_id)
+        if status == "err":
+            # The agent's own frame says nothing about the user's code
+            payload = "".join(line for line in payload.splitlines(True)
+                              if not line.startswith(f'  File "{AGENT_FILE}"'))
+        result = LiveResult(request_id, status == "ok", hub_ms=int(hub_ms),
+                            value=payload if status == "ok" else None,
+                            error=payload if status != "ok" else None)
+        if future is None:
+            # E.g. a Ctrl-C while idle
+            logger.info(f"Live agent: {result.error or result.value}")
+        elif not future.done():
+            future.set_result(result)
+
+    def _handle_job(self, job: Job):
+        if job is not self.job or not job.done:
+            return
+        error = LiveError(f"Live agent stopped ({job.state.value})")
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_exception(error)
+            # Retrieved by start(), or not at all if nobody waits
+            self._ready.exception()
+        for future in list(self._pending.values()):
+            if not future.done():
+                future.set_exception(error)
+        self._executed.clear()
+
+
+def _statements(script: str) -> List[Tuple[int, str]]:
+    """
+    (first line, source) of each top-level statement, decorators included
+
+    Statements sharing a line (``a = 1; b = 2``) count as one.
+    """
+    lines = script.split("\n")
+    spans: List[List[int]] = []
+    for node in ast.parse(script).body:
+        first = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        if spans and first <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], node.end_lineno)
+        else:
+            spans.append([first, node.end_lineno])
+    return [(first, "\n".join(lines[first - 1:last])) for first, last in spans]
@@ -0,0 +1,134 @@
+"""
+Bounded store for structured debug log entries
+"""
+import collections
+import itertools
+import json
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Level names in order of severity
+LEVELS = ("DEBUG", "INFO", "SUCCESS", "WARN", "ERROR")
+
+
+class LogStore:
+    """
+    Fixed-capacity debug log
+
+    Details are serialised once when an entry is added, so rendering and
+    exporting never call ``json.dumps`` again. The oldest entries are dropped
+    when the store is full.
+    """
+
+    def __init__(self, capacity: int = 2000):
+        self.capacity = capacity
+        self._entries = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def add(self, level: str, message: str, details: Any = None) -> Dict[str, Any]:
+        """
+        Add an entry
+
+        Args:
+            level: One of LEVELS
+            message: Main log message
+            details: Optional dict/list/str with additional information
+
+        Returns:
+            The stored entry
+        """
+        if details is None or isinstance(details, str):
+            details_text = details
+        else:
+            # Compact, so the JSON Lines export can embed it as it is
+            details_text = json.dumps(details, separators=(",", ":"), default=str)
+
+        entry = {
+            "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3],  # HH:MM:SS.mmm
+            "level": level,
+            "message": message,
+            "details": details_text,
+            "structured": not isinstance(details, str),
+        }
+        with self._lock:
+            if len(self._entries) == self.capacity:
+                self.dropped += 1
+            self._entries.append(entry)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.dropped = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _snapshot(self, levels: Optional[Iterable[str]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            if levels is None:
+                return list(self._entries)
+            wanted = set(levels)
+            return [e for e in self._entries if e["level"] in wanted]
+
+    def tail(self, count: int, levels: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Newest ``count`` entries (oldest first), optionally filtered by level"""
+        if levels is None:
+            with self._lock:
+                start = max(0, len(self._entries) - count)
+                return list(itertools.islice(self._entries, start, None))
+        return self._snapshot(levels)[-count:]
+
+    def page(self, page: int, per_page: int,
+             levels: Optional[Iterable[str]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        One page of entries, newest page first
+
+        Args:
+            page: Page number starting at 0 (page 0 holds the newest entries)
+            per_page: Entries per page
+            levels: Only include these levels
+
+        Returns:
+            Tuple of (entries oldest first, total number of pages)
+        """
+        entries = self._snapshot(levels)
+        pages = max(1, -(-len(entries) // per_page))
+        end = len(entries) - page * per_page
+        return entries[max(0, end - per_page):max(0, end)], pages
+
+    def counts(self) -> Dict[str, int]:
+        """Number of stored entries per level"""
+        with self._lock:
+            return dict(collections.Counter(e["level"] for e in self._entries))
+
+    def iter_text(self, levels: Optional[Iterable[str]] = None) -> Iterator[str]:
+        """Plain-text export, one chunk per entry"""
+        yield "PYBRICKS IDE - DEBUG LOG\n"
+        yield "=" * 80 + "\n"
+        yield f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        yield "=" * 80 + "\n\n"
+        for entry in self._snapshot(levels):
+            text = f"[{entry['timestamp']}] {entry['level']}: {entry['message']}\n"
+            if entry["details"]:
+                text += f"  Details: {entry['details']}\n"
+            yield text + "\n"
+
+    def iter_jsonl(self, levels: Optional[Iterable[str]] = None) -> Iterator[str]:
+        """JSON Lines export, one line per entry"""
+        for entry in self._snapshot(levels):
+            head = json.dumps({
+                "timestamp": entry["timestamp"],
+                "level": entry["level"],
+                "message": entry["message"],
+            })
+            details = entry["details"]
+            if details is None:
+                details = "null"
+            elif not entry["structured"]:
+                details = json.dumps(details)
+            # Structured details are already JSON; splice them in unchanged
+            yield f'{head[:-1]}, "details": {details}}}\n'
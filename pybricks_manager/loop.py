@@ -0,0 +1,91 @@
+"""
+Background asyncio event loop running on a dedicated thread
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Optional
+
+
+class EventLoopThread:
+    """
+    Long-lived event loop on a daemon thread
+
+    BLE connections (bleak clients, pybricksdev hubs) are bound to the loop
+    they were created on, so the loop must outlive every UI action. Other
+    threads schedule coroutines with :meth:`submit` or :meth:`call`.
+    """
+
+    def __init__(self, name: str = "pybricks-manager-loop"):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def in_loop_thread(self) -> bool:
+        """True when called from the loop's own thread"""
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the loop (thread-safe)
+
+        Args:
+            coro: Coroutine to run, or another awaitable such as a
+                :class:`~pybricks_manager.jobs.Job`
+
+        Returns:
+            concurrent.futures.Future with the coroutine result
+        """
+        if self._loop.is_closed():
+            raise RuntimeError("Event loop has been closed")
+        if not asyncio.iscoroutine(coro):
+            coro = _wait_for(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def call(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the loop and wait for its result
+
+        Args:
+            coro: Coroutine to run
+            timeout: Maximum seconds to wait (None waits forever)
+
+        Returns:
+            The coroutine result. Exceptions raised by the coroutine propagate.
+        """
+        if self.in_loop_thread():
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            raise RuntimeError("call() cannot be used from the event loop thread, await the coroutine instead")
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the loop and join the thread"""
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._loop.is_closed()
+
+
+async def _wait_for(awaitable: Awaitable[Any]) -> Any:
+    return await awaitable
@@ -0,0 +1,724 @@
+"""
+Pybricks Hub Manager - Bluetooth LE communication with SPIKE Prime/Robot Inventor
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Hashable, Optional, List, Callable, Tuple, Union
+
+from .archive import OutputArchive, RunLog
+from .compiler import CompileCache, compiler_version, pack_program
+from .devices import DeviceCache
+from .jobs import Job, JobQueue, RunPolicy
+from .live import LiveSession
+from .loop import EventLoopThread
+from .metrics import Metrics, timed
+from .minify import MinifyOptions, minify as reduce_source
+from .output import OutputBuffer
+from .preflight import Preflight, PreflightError, PreflightResult
+from .project import Project
+from .scanner import DeviceScanner
+from .supervisor import ReconnectSupervisor
+from .telemetry import TelemetryDecoder, TelemetryStore
+from .upload import ProgramUploader, UploadStats, diff_ranges
+
+if TYPE_CHECKING:
+    from bleak import BleakClient
+    from pybricksdev.connections.pybricks import PybricksHub
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Above this fraction of changed bytes a delta upload falls back to a full upload
+DELTA_MAX_FRACTION = 0.5
+
+# Default of the per-call ``minify`` arguments: use PybricksManager.minify
+_OWN_MINIFY: Any = object()
+
+# Disable tqdm globally to prevent conflicts with Streamlit on Windows
+os.environ['TQDM_DISABLE'] = '1'
+
+class PybricksManager:
+    """Manages Bluetooth connection and script deployment to Pybricks hub"""
+    
+    def __init__(self, output_capacity: int = 10000,
+                 loop_thread: Optional[EventLoopThread] = None,
+                 device_cache: Optional[DeviceCache] = None,
+                 compile_cache: Optional[CompileCache] = None,
+                 scanner: Optional[DeviceScanner] = None,
+                 auto_reconnect: bool = True,
+                 preflight: Optional[Preflight] = None,
+                 metrics: Optional[Metrics] = None,
+                 archive: Optional[OutputArchive] = None,
+                 minify: Optional[MinifyOptions] = None):
+        """
+        Args:
+            output_capacity: Number of hub output lines kept in ``output``
+            loop_thread: Event loop to run on. By default the manager starts
+                its own; a HubPool passes a shared one.
+            device_cache: Shared device cache (a new one by default)
+            compile_cache: Shared compile cache (a new one by default)
+            scanner: Shared background scanner (a new one by default)
+            auto_reconnect: Reconnect automatically when the link drops
+                (see ``supervisor``)
+            preflight: Shared pre-flight worker pool (a new one by default)
+            metrics: Shared phase timings and counters (a new one by default)
+            archive: Where the output of every run is kept on disk (not
+                archived by default)
+            minify: Shrink scripts with these options before compiling
+                (see :func:`~pybricks_manager.minify.minify`; off by default).
+                Calls that take a ``minify`` argument can override it per run.
+        """
+        self.hub: Optional["PybricksHub"] = None
+        self.client: Optional["BleakClient"] = None
+        self.connected = False
+        self.output_callback: Optional[Callable[[str], None]] = None
+        # Called on the manager loop with every batch of complete output lines
+        self.output_listeners: List[Callable[[List[str]], None]] = []
+        self.telemetry_decoder = TelemetryDecoder(TelemetryStore)
+        # ``TLM ...`` text samples go to the telemetry store, not the output
+        self.output = OutputBuffer(output_capacity, consume=self.telemetry_decoder.feed_line)
+        self._stdout_subscription = None
+        self.device_cache = device_cache or DeviceCache()
+        self.compile_cache = compile_cache or CompileCache()
+        self.scanner = scanner or DeviceScanner(self.device_cache)
+        self.supervisor = ReconnectSupervisor(self)
+        self._owns_preflight = preflight is None
+        self.preflight = preflight or Preflight()
+        self.supervisor.enabled = auto_reconnect
+        self.metrics = metrics or Metrics()
+        self.jobs = JobQueue(self, output_capacity)
+        # Resident agent for hot-reloading code (started on first use)
+        self.live = LiveSession(self)
+        self.archive = archive
+        self.minify = minify
+        # Run currently written to the archive
+        self.run_log: Optional[RunLog] = None
+        # Set when a program is started, cleared by its first output
+        self._started_at: Optional[float] = None
+        self.last_upload: Optional[UploadStats] = None
+        # Shared by managers whose hubs use the same BLE adapter (see HubPool)
+        self.upload_slots: Optional[asyncio.Semaphore] = None
+        self._upload_window = 4
+        # Program image known to be in hub RAM (None after connect/reset)
+        self._hub_image: Optional[bytes] = None
+        
+        # Long-lived event loop on a dedicated thread. The hub and its bleak
+        # client are bound to this loop, so it must outlive every UI action.
+        self._owns_loop = loop_thread is None
+        self._loop_thread = loop_thread or EventLoopThread()
+    
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop that owns the hub connection"""
+        return self._loop_thread.loop
+    
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the manager's event loop (thread-safe)
+        
+        Args:
+            coro: Coroutine to run, e.g. ``manager.connect(address)``
+            
+        Returns:
+            concurrent.futures.Future with the coroutine result
+        """
+        return self._loop_thread.submit(coro)
+    
+    def call(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the manager's event loop and wait for its result
+        
+        Args:
+            coro: Coroutine to run
+            timeout: Maximum seconds to wait (None waits forever)
+            
+        Returns:
+            The coroutine result. Exceptions raised by the coroutine propagate.
+        """
+        return self._loop_thread.call(coro, timeout)
+    
+    def close(self, timeout: float = 5.0):
+        """Disconnect from the hub and stop the background event loop (if owned)"""
+        if self._loop_thread.closed:
+            return
+        
+        if self.hub or self.supervisor.active:
+            try:
+                self.call(self.disconnect(), timeout=timeout)
+            except Exception as e:
+                logger.error(f"Error during close: {e}")
+        
+        if self._owns_loop and self.scanner.running:
+            try:
+                self.call(self.scanner.close(), timeout=timeout)
+            except Exception as e:
+                logger.error(f"Error stopping scan: {e}")
+        
+        self._end_run()
+        if self._owns_preflight:
+            self.preflight.close()
+        if self._owns_loop:
+            self._loop_thread.stop(timeout)
+    
+    @timed("scan")
+    async def scan_devices(self, timeout: float = 5.0, settle: float = 0.5,
+                           holder: Hashable = None) -> List[dict]:
+        """
+        Scan for Pybricks-compatible Bluetooth devices
+        
+        Starts the background scanner, which keeps running and updating
+        ``scanner.devices()`` until :meth:`stop_scan` or :meth:`connect`
+        releases it. Returns early once a Pybricks hub has been heard.
+        
+        Args:
+            timeout: Maximum scan time in seconds
+            settle: Extra seconds to collect other hubs after the first one
+            holder: Who the scan is kept running for (default: this
+                manager); see :meth:`DeviceScanner.start`
+            
+        Returns:
+            List of device dictionaries with 'name', 'address', 'rssi' and
+            'last_seen' keys, strongest signal first
+        """
+        logger.info(f"Scanning for Pybricks devices (timeout: {timeout}s)...")
+        start = self.loop.time()
+        
+        try:
+            await self.scanner.start(self if holder is None else holder)
+            first = await self.scanner.wait_for(lambda d: d.is_pybricks, timeout=timeout)
+            if first is not None:
+                remaining = timeout - (self.loop.time() - start)
+                await asyncio.sleep(max(0.0, min(settle, remaining)))
+        except Exception as e:
+            logger.error(f"Error during device scan: {e}")
+            raise RuntimeError(f"Bluetooth scanning failed: {str(e)}")
+        
+        devices = [d.as_dict() for d in self.scanner.devices()]
+        for device in devices:
+            logger.info(f"Found device: {device['name']} ({device['address']}, RSSI {device['rssi']})")
+        if not devices:
+            logger.warning("No Pybricks devices found. Make sure hub is on and in range.")
+        return devices
+    
+    async def stop_scan(self, holder: Hashable = None):
+        """
+        Release the background scan started by :meth:`scan_devices`
+        
+        A scanner shared with other managers keeps running for them.
+        """
+        await self.scanner.stop(self if holder is None else holder)
+    
+    @timed("connect")
+    async def connect(self, device_address: str) -> bool:
+        """
+        Connect to a Pybricks hub
+        
+        Args:
+            device_address: Bluetooth address of the hub
+            
+        Returns:
+            True if connection successful, False otherwise
+        """
+        # A connect from the user takes over from an automatic reconnect
+        self.supervisor.cancel_reconnect()
+        try:
+            logger.info(f"Connecting to {device_address}...")
+            
+            # We need to find the BLEDevice object first because PybricksHub requires it.
+            # A recent scan usually has it cached already.
+            device = self.device_cache.get(device_address)
+            
+            if device:
+                logger.info("Using cached device object")
+            else:
+                # Returns as soon as the hub advertises
+                logger.info("Waiting for device advertisement...")
+                seen = await self.scanner.wait_for(device_address, timeout=10.0)
+                device = seen.device if seen else None
+            
+            if not device:
+                raise RuntimeError(f"Device {device_address} not found in scan")
+            
+            logger.info(f"Found device object: {device}")
+            
+            # Some adapters cannot connect while scanning; only our own scan
+            # is released, other users of a shared scanner keep theirs
+            await self.scanner.stop(self)
+            
+            # Use PybricksHub which handles BLE connections (v1.0.0a46).
+            # Imported here so the CLI starts without loading the BLE stack.
+            from pybricksdev.connections.pybricks import PybricksHub
+            
+            self.hub = PybricksHub()
+            self._hub_image = None
+            await self.hub.connect(device)
+            self._stdout_subscription = self.hub.stdout_observable.subscribe(self._handle_stdout)
+            
+            self.connected = True
+            self.supervisor.attach(device_address)
+            # Warm up the pre-flight worker while the user is still typing
+            self.preflight.start()
+            logger.info("Connected successfully!")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Connection failed: {e}")
+            self.connected = False
+            # The cached device object may be stale, rescan next time
+            self.device_cache.discard(device_address)
+            # Clean up hub instance on failure
+            self.hub = None
+            raise e # Re-raise to show specific error in UI
+    
+    async def disconnect(self):
+        """Disconnect from the hub (and cancel a pending reconnect)"""
+        self.supervisor.detach()
+        if self.hub:
+            try:
+                await self.hub.disconnect()
+                logger.info("Disconnected from hub")
+            except Exception as e:
+                logger.error(f"Error during disconnect: {e}")
+            finally:
+                self._dispose_stdout()
+                self._end_run()
+                self._hub_image = None
+                self.hub = None
+                self.connected = False
+    
+    def _link_lost(self):
+        """Called by the supervisor when the link dropped without disconnect()"""
+        self._dispose_stdout()
+        self._emit_output(self.output.flush())
+        self._hub_image = None
+        self.hub = None
+        self.connected = False
+    
+    def _handle_stdout(self, data: bytes):
+        """Called on the manager loop for every stdout packet from the hub"""
+        self.supervisor.touch()
+        if self._started_at is not None:
+            self.metrics.observe("first_output", time.perf_counter() - self._started_at)
+            self._started_at = None
+        text = self.telemetry_decoder.feed(data)
+        if text:
+            self._emit_output(self.output.feed(text))
+    
+    @property
+    def telemetry(self) -> Optional[TelemetryStore]:
+        """Telemetry samples received from the hub (None until the first one)"""
+        return self.telemetry_decoder.store
+    
+    def _emit_output(self, lines: List[str]):
+        if self.run_log is not None:
+            try:
+                self.run_log.write(lines)
+            except OSError as e:
+                logger.error(f"Could not archive output, archiving stopped for this run: {e}")
+                self._end_run()
+        for listener in self.output_listeners:
+            listener(lines)
+        if self.output_callback:
+            for line in lines:
+                self.output_callback(line)
+    
+    def _begin_run(self):
+        """Archive the output from here on as a new run (if archiving is enabled)"""
+        self._end_run()
+        if self.archive is not None:
+            try:
+                self.run_log = self.archive.open_run(self.supervisor.address or "")
+            except OSError as e:
+                logger.error(f"Could not start output archive: {e}")
+    
+    def _end_run(self):
+        if self.run_log is not None:
+            self.run_log.close()
+            self.run_log = None
+    
+    def _dispose_stdout(self):
+        if self._stdout_subscription:
+            self._stdout_subscription.dispose()
+            self._stdout_subscription = None
+    
+    def _program_abi(self) -> int:
+        """MPY ABI major version for programs downloaded to the connected hub"""
+        from pybricksdev.ble.pybricks import HubCapabilityFlag
+        
+        flags = self.hub._capability_flags
+        if not flags & (
+            HubCapabilityFlag.USER_PROG_MULTI_FILE_MPY6
+            | HubCapabilityFlag.USER_PROG_MULTI_FILE_MPY6_1_NATIVE
+        ):
+            raise RuntimeError("Hub is not compatible with any of the supported file formats")
+        return 6
+    
+    def _minify_options(self, minify: Optional[MinifyOptions]) -> Optional[MinifyOptions]:
+        return self.minify if minify is _OWN_MINIFY else minify
+    
+    def _cache_lookup(self, script: str, abi: int, file_name: str,
+                      minify: Optional[MinifyOptions]) -> Tuple[str, Optional[bytes]]:
+        """Compile cache key and cached MPY, if any (blocking, runs in an executor)"""
+        # The file name ends up in the MPY; single scripts keep their old keys
+        extra = "" if file_name == "__main__.py" else file_name
+        if minify is not None:
+            extra += minify.key()
+        key = CompileCache.key(script, abi, compiler_version(abi), extra)
+        return key, self.compile_cache.get(key)
+    
+    async def validate_script(self, script: str, abi: int = 6, file_name: str = "__main__.py",
+                              local_modules: Tuple[str, ...] = (),
+                              minify: Optional[MinifyOptions] = _OWN_MINIFY) -> PreflightResult:
+        """
+        Check and compile a script without touching the hub
+        
+        Parsing, the Pybricks API check and mpy-cross run in the pre-flight
+        worker process. Only scripts without errors are stored in the compile
+        cache, so a cache hit skips the checks.
+        
+        Args:
+            script: Python code
+            abi: MPY ABI major version
+            file_name: Name reported in diagnostics and hub tracebacks
+            local_modules: Modules provided by the project (see :class:`Project`)
+            minify: Minify options for this script (default: ``self.minify``;
+                None for none)
+            
+        Returns:
+            PreflightResult; ``mpy`` is set if the script can be uploaded
+        """
+        minify = self._minify_options(minify)
+        loop = asyncio.get_running_loop()
+        key, mpy = await loop.run_in_executor(None, self._cache_lookup, script, abi, file_name, minify)
+        if mpy is not None:
+            logger.info(f"Compile cache hit for {file_name} ({len(mpy)} bytes)")
+            return PreflightResult(mpy=mpy)
+        
+        result = await self.preflight.check(script, abi, file_name, local_modules,
+                                            minify_options=minify)
+        if result.reduction is not None:
+            logger.info(f"Minified {file_name}: {result.reduction}")
+            self.metrics.inc("minify_saved_bytes", result.reduction.saved)
+        if result.ok:
+            await loop.run_in_executor(None, self.compile_cache.put, key, result.mpy)
+            logger.info(f"Compiled {file_name} ({len(result.mpy)} bytes) in {result.elapsed * 1000:.0f} ms")
+        else:
+            logger.warning(f"Pre-flight found {len(result.errors)} error(s) in {file_name}")
+        return result
+    
+    async def validate_project(self, project: Project, abi: int = 6,
+                               minify: Optional[MinifyOptions] = _OWN_MINIFY) -> PreflightResult:
+        """
+        Check and compile the modules of a project that changed since the last build
+        
+        Unchanged modules are reused from the project without touching the
+        compile cache; changed ones go through :meth:`validate_script`.
+        Diagnostics carry the file they belong to. ``minify`` is as for
+        :meth:`validate_script`.
+        
+        Returns:
+            PreflightResult; ``mpy`` is the packed program image if every
+            module passed
+        """
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        modules = await loop.run_in_executor(None, project.modules)
+        local = tuple(sorted(project.local_names(modules)))
+        minify = self._minify_options(minify)
+        variant = minify.key() if minify is not None else ""
+        stale = project.stale(modules, abi, variant)
+        
+        results = await asyncio.gather(
+            *(self.validate_script(m.source, abi, m.file_name, local, minify) for m in stale)
+        )
+        diagnostics = []
+        for module, result in zip(stale, results):
+            for diagnostic in result.diagnostics:
+                diagnostic.file = module.file_name
+            diagnostics.extend(result.diagnostics)
+            if result.ok:
+                project.store(module, abi, result.mpy, variant)
+        
+        outcome = PreflightResult(diagnostics, elapsed=time.monotonic() - start)
+        if not outcome.errors:
+            outcome.mpy = project.pack(modules, [m.name for m in stale], start)
+            stats = project.last_build
+            logger.info(f"Built project: {stats.modules} module(s), {stats.compiled} compiled, "
+                        f"{stats.size} bytes in {stats.elapsed * 1000:.0f} ms")
+        return outcome
+    
+    @timed("compile")
+    async def compile_script(self, script: Union[str, Project],
+                             minify: Optional[MinifyOptions] = _OWN_MINIFY) -> bytes:
+        """
+        Compile a script or project into a program image for the connected hub
+        
+        Args:
+            script: Python code or a :class:`Project`
+            minify: Minify options (default: ``self.minify``; None for none)
+            
+        Returns:
+            Multi-file program image ready for download_user_program()
+            
+        Raises:
+            PreflightError: if the script has errors (nothing is sent to the hub)
+        """
+        return await self._compile(script, minify)
+    
+    async def _compile(self, script: Union[str, Project],
+                       minify: Optional[MinifyOptions] = _OWN_MINIFY) -> bytes:
+        """compile_script() without timing it (background compiles stay out of the metrics)"""
+        if isinstance(script, Project):
+            result = await self.validate_project(script, self._program_abi(), minify)
+            if not result.ok:
+                raise PreflightError(result.diagnostics)
+            return result.mpy
+        
+        result = await self.validate_script(str(script).strip(), self._program_abi(), minify=minify)
+        if not result.ok:
+            raise PreflightError(result.diagnostics)
+        return pack_program([("__main__", result.mpy)])
+    
+    @property
+    def can_download(self) -> bool:
+        """True if the connected hub accepts programs without running them (profile >= 1.2.0)"""
+        return bool(self.hub) and not self.hub._mpy_abi_version
+    
+    async def upload_script(self, script: Union[str, Project],
+                            minify: Optional[MinifyOptions] = _OWN_MINIFY) -> int:
+        """
+        Compile a script and download it to the hub without starting it
+        
+        Args:
+            script: Python code or a :class:`Project`
+            minify: Minify options (default: ``self.minify``; None for none)
+            
+        Returns:
+            Size of the downloaded program image in bytes
+        """
+        if not self.connected or not self.hub:
+            raise RuntimeError("Not connected to hub")
+        if not self.can_download:
+            raise RuntimeError("Hub firmware does not support downloading without running, use run_script()")
+        
+        program = await self.compile_script(script, minify)
+        if len(program) > self.hub._max_user_program_size:
+            raise ValueError(
+                f"Program is too big ({len(program)} bytes). "
+                f"Hub has limit of {self.hub._max_user_program_size} bytes."
+            )
+        
+        uploader = self._make_uploader()
+        ranges = self._delta_ranges(program, uploader.payload_size)
+        
+        # Until the upload completes the hub RAM content is unknown
+        self._hub_image = None
+        async with self.upload_slots or contextlib.AsyncExitStack():
+            with self.metrics.phase("upload"):
+                self.last_upload = await uploader.upload(program, ranges)
+        self.metrics.inc("bytes_sent", self.last_upload.bytes_sent)
+        self.metrics.inc("packets", self.last_upload.packets)
+        self.metrics.inc("upload_retries", self.last_upload.retries)
+        self._hub_image = program
+        self._upload_window = self.last_upload.window
+        return len(program)
+    
+    def _delta_ranges(self, program: bytes, chunk_size: int) -> Optional[List[Tuple[int, int]]]:
+        """
+        Changed ranges relative to the image already in hub RAM
+        
+        Returns:
+            Ranges to send, or None for a full upload (nothing known about
+            the hub RAM, or so much changed that a delta does not pay off)
+        """
+        if self._hub_image is None:
+            return None
+        
+        ranges = diff_ranges(self._hub_image, program, chunk_size)
+        changed = sum(end - start for start, end in ranges)
+        if changed > len(program) * DELTA_MAX_FRACTION:
+            logger.info("Program layout changed, sending full image")
+            return None
+        
+        logger.info(f"Delta upload: {changed} of {len(program)} bytes changed")
+        return ranges
+    
+    def _make_uploader(self) -> ProgramUploader:
+        """Uploader sized to the hub capabilities and the negotiated MTU"""
+        from pybricksdev.ble.pybricks import PYBRICKS_COMMAND_EVENT_UUID
+        
+        client = self.hub.client
+        char = client.services.get_characteristic(PYBRICKS_COMMAND_EVENT_UUID)
+        write_size = self.hub._max_write_size
+        if char is not None:
+            write_size = min(write_size, char.max_write_without_response_size)
+        
+        async def write(data: bytes, response: bool):
+            await client.write_gatt_char(char or PYBRICKS_COMMAND_EVENT_UUID, data, response)
+        
+        return ProgramUploader(write, write_size, initial_window=self._upload_window)
+    
+    async def start_script(self, wait: bool = True):
+        """
+        Start the program that was downloaded with upload_script()
+        
+        Args:
+            wait: If True, return only after the program has stopped
+        """
+        if not self.connected or not self.hub:
+            raise RuntimeError("Not connected to hub")
+        
+        # Output is captured through stdout_observable into self.output
+        self.output.clear()
+        self.telemetry_decoder.reset()
+        self._begin_run()
+        self._started_at = time.perf_counter()
+        with self.metrics.phase("start"):
+            await self.hub.start_user_program()
+        self.jobs._program_started()
+        if wait:
+            try:
+                with self.metrics.phase("execute"):
+                    await self.hub._wait_for_user_program_stop()
+                logger.info("Script execution finished")
+            finally:
+                self._started_at = None
+                self._emit_output(self.output.flush())
+    
+    def run_script(self, script: Union[str, Project], priority: int = 0,
+                   policy: RunPolicy = RunPolicy.QUEUE,
+                   minify: Optional[MinifyOptions] = _OWN_MINIFY) -> Job:
+        """
+        Queue a script to run on the hub and return its handle right away
+        
+        Can be called from any thread. ``await manager.run_script(code)`` on
+        the manager loop still waits until the program has finished.
+        
+        Args:
+            script: Python code to execute, or a :class:`Project`
+            priority: Jobs with a higher priority run first
+            policy: What to do with the program that is running (see
+                :class:`RunPolicy`)
+            minify: Minify options for this run only (default:
+                ``self.minify``; None for none). Sessions sharing a manager
+                pass their own instead of changing ``self.minify``.
+            
+        Returns:
+            Job with the status, output and result of the run
+        """
+        return self.jobs.submit(script, priority, policy, self._minify_options(minify))
+    
+    @timed("run")
+    async def _run(self, script: Union[str, Project], minify: Optional[MinifyOptions] = _OWN_MINIFY):
+        """Upload and execute a script, returning once it has stopped (run by the job queue)"""
+        minify = self._minify_options(minify)
+        if not self.connected or not self.hub:
+            raise RuntimeError("Not connected to hub")
+        
+        if isinstance(script, Project):
+            if not self.can_download:
+                raise RuntimeError("Hub firmware does not support multi-file programs")
+            script_code = script
+        else:
+            # Sanitize script
+            script_code = str(script).strip()
+        
+        if not self.can_download:
+            # Pybricks profile < 1.2.0 only supports pybricksdev's file based
+            # download, which compiles again; validate first so errors still
+            # never reach the hub
+            result = await self.validate_script(script_code, self.hub._mpy_abi_version, minify=minify)
+            if not result.ok:
+                raise PreflightError(result.diagnostics)
+            if minify is not None:
+                # pybricksdev compiles the file itself; give it the reduced source
+                loop = asyncio.get_running_loop()
+                reduction = await loop.run_in_executor(None, reduce_source, script_code, minify)
+                script_code = reduction.source
+            await self._run_legacy(script_code)
+            return
+        
+        try:
+            size = await self.upload_script(script_code, minify)
+            logger.info(f"Running script ({size} bytes)...")
+            await self.start_script(wait=True)
+        except Exception as e:
+            logger.error(f"Error running script: {e}")
+            raise
+    
+    async def _run_legacy(self, script_code: str):
+        """Run a script on firmware without in-memory program download"""
+        import tempfile
+        
+        # Write script to temp file with explicit UTF-8 encoding
+        fd, script_path = tempfile.mkstemp(suffix='.py', text=True)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', errors='replace') as f:
+                f.write(script_code)
+            
+            logger.info(f"Running script from {script_path}...")
+            
+            # The hub's own line handler (unbounded list) stays disabled
+            self.output.clear()
+            self.telemetry_decoder.reset()
+            self._begin_run()
+            async with self.upload_slots or contextlib.AsyncExitStack():
+                await self.hub.run(script_path, wait=True, print_output=False, line_handler=False)
+            logger.info("Script execution finished")
+            
+        except Exception as e:
+            logger.error(f"Error running script: {e}")
+            raise
+        finally:
+            self._emit_output(self.output.flush())
+            # Clean up temp file
+            if os.path.exists(script_path):
+                try:
+                    os.unlink(script_path)
+                except:
+                    pass
+    
+    @timed("stop")
+    async def stop_script(self, timeout: float = 2.0):
+        """
+        Stop the currently running script
+        
+        Sends the stop-user-program command over the existing connection and
+        waits for the hub status to report that no program is running.
+        
+        Args:
+            timeout: Maximum seconds to wait for the hub to become idle
+        """
+        if not self.connected or not self.hub:
+            raise RuntimeError("Not connected to hub")
+        
+        try:
+            logger.info("Stopping script execution...")
+            await self.hub.stop_user_program()
+            await self._wait_until_idle(timeout)
+            logger.info("Script stopped")
+        except asyncio.TimeoutError:
+            logger.error(f"Hub still reports a running program after {timeout}s")
+            raise RuntimeError("Timed out waiting for the script to stop")
+        except Exception as e:
+            logger.error(f"Error stopping script: {e}")
+            raise
+    
+    async def _wait_until_idle(self, timeout: float):
+        """Wait until the hub status flags report no user program running"""
+        from pybricksdev.ble.pybricks import StatusFlag
+        
+        idle = asyncio.Event()
+        
+        def handle_status(flags: "StatusFlag"):
+            if not flags & StatusFlag.USER_PROGRAM_RUNNING:
+                idle.set()
+        
+        # status_observable replays the current flags on subscribe
+        with self.hub.status_observable.subscribe(handle_status):
+            await asyncio.wait_for(idle.wait(), timeout)
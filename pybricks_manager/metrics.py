@@ -0,0 +1,227 @@
+"""
+Per-phase latency histograms and counters, with a Prometheus text exporter
+"""
+import bisect
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from a cache-hit compile to a slow BLE connect
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Phases timed by PybricksManager, in the order they happen
+PHASES = ("scan", "connect", "compile", "upload", "start", "first_output", "execute", "run", "stop", "live")
+
+_HELP = {
+    "bytes_sent": "Program bytes written to hub RAM",
+    "packets": "Upload packets written",
+    "upload_retries": "Upload windows resent after a failed write",
+    "reconnects": "Successful automatic reconnects",
+    "phase_errors": "Phases that raised an exception",
+    "minify_saved_bytes": "Source bytes removed by the minifier before compiling",
+    "live_bytes_sent": "Bytes of live mode requests written to hub stdin",
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.last = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by interpolating inside its bucket (like PromQL)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                estimate = lower + (upper - lower) * (rank - seen) / n
+                return min(max(estimate, self.min), self.max)
+            seen += n
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "last": self.last,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class _Timer:
+    """Context manager that records the time spent inside it"""
+
+    __slots__ = ("_metrics", "_phase", "_start")
+
+    def __init__(self, metrics: "Metrics", phase: str):
+        self._metrics = metrics
+        self._phase = phase
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics.observe(self._phase, time.perf_counter() - self._start)
+        if exc_type is not None:
+            self._metrics.inc("phase_errors", phase=self._phase)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Latency histograms per phase and event counters
+
+    Shared by every manager of a :class:`HubPool`. With ``enabled`` False,
+    :meth:`phase` returns a shared no-op context manager and :meth:`inc` /
+    :meth:`observe` return immediately, so the instrumentation can stay in
+    place.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name: str):
+        """Time the enclosed block as phase ``name`` (failures are counted too)"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, phase: str, seconds: float):
+        """Record one duration for a phase"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(phase)
+            if histogram is None:
+                histogram = self._histograms[phase] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, counter: str, amount: float = 1, **labels: str):
+        """Add to a counter, e.g. ``inc("bytes_sent", 512)``"""
+        if not self.enabled:
+            return
+        key = (counter, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current values as plain data (JSON serialisable)
+
+        Returns:
+            Dict with ``phases`` (name -> count, sum, mean, min, max, last,
+            p50 and p95 in seconds) and ``counters`` (name, or
+            ``name{label="value"}`` for labelled counters -> value)
+        """
+        with self._lock:
+            phases = sorted(self._histograms, key=_phase_order)
+            return {
+                "phases": {name: self._histograms[name].snapshot() for name in phases},
+                "counters": {_series(name, labels): value
+                             for (name, labels), value in sorted(self._counters.items())},
+            }
+
+    def prometheus(self, prefix: str = "pybricks_manager") -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            if self._histograms:
+                metric = f"{prefix}_phase_seconds"
+                lines.append(f"# HELP {metric} Duration of PybricksManager phases in seconds")
+                lines.append(f"# TYPE {metric} histogram")
+                for name in sorted(self._histograms, key=_phase_order):
+                    histogram = self._histograms[name]
+                    cumulative = 0
+                    for bound, n in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f'{metric}_bucket{{phase="{name}",le="{le}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{phase="{name}"}} {histogram.sum!r}')
+                    lines.append(f'{metric}_count{{phase="{name}"}} {histogram.count}')
+
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# HELP {metric} {_HELP.get(name, name.replace('_', ' ').capitalize())}")
+                lines.append(f"# TYPE {metric} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{_series(metric, labels)} {_number(value)}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def timed(phase: str) -> Callable:
+    """Decorator timing a coroutine method as ``phase`` in ``self.metrics``"""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with self.metrics.phase(phase):
+                return await func(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _phase_order(name: str):
+    return (PHASES.index(name) if name in PHASES else len(PHASES), name)
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{inner}}}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
@@ -0,0 +1,365 @@
+"""
+Size-reducing source transform that keeps every statement on its line
+"""
+import ast
+import io
+import itertools
+import logging
+import tokenize
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Operators that two adjacent tokens could merge into if written without a space
+_MERGING = {"**", "//", "<<", ">>", "==", "!=", "<=", ">=", "->", ":=", "+=", "-=",
+            "*=", "/=", "%=", "&=", "|=", "^=", "@=", ".."}
+
+# Tokens that carry no code
+_SKIPPED = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.ENCODING,
+            tokenize.ENDMARKER, tokenize.INDENT, tokenize.DEDENT}
+
+# Statements that cannot follow ``;``
+_COMPOUND = tuple(getattr(ast, name) for name in (
+    "FunctionDef", "AsyncFunctionDef", "ClassDef", "If", "For", "AsyncFor", "While",
+    "With", "AsyncWith", "Try", "TryStar", "Match") if hasattr(ast, name))
+
+_FSTRING_START = getattr(tokenize, "FSTRING_START", None)
+_FSTRING_END = getattr(tokenize, "FSTRING_END", None)
+
+
+@dataclass(frozen=True)
+class MinifyOptions:
+    """
+    What :func:`minify` removes
+
+    Docstrings, comments and whitespace never change what a program does.
+    ``strip_asserts`` and ``strip_debug`` do, so they are off by default.
+    ``intern_strings`` only pays off where the source itself is uploaded:
+    MPY files already store each string once, and a global lookup is slower
+    on the hub than a constant.
+    """
+    strip_docstrings: bool = True
+    strip_comments: bool = True
+    compact: bool = True
+    strip_asserts: bool = False
+    # Remove ``if DEBUG:`` / ``if __debug__:`` blocks (``else`` branches stay)
+    strip_debug: bool = False
+    debug_names: Tuple[str, ...] = ("DEBUG", "__debug__")
+    intern_strings: bool = False
+
+    def key(self) -> str:
+        """Identifies the options in compile cache keys"""
+        return repr(self)
+
+
+@dataclass
+class MinifyResult:
+    """Output of :func:`minify` (sizes in UTF-8 bytes)"""
+    source: str
+    original_size: int
+    size: int
+    # What was removed: docstrings, comments, asserts, debug_blocks, interned
+    removed: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def saved(self) -> int:
+        return self.original_size - self.size
+
+    @property
+    def ratio(self) -> float:
+        """Fraction of the original size that was saved"""
+        return self.saved / self.original_size if self.original_size else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.original_size} -> {self.size} bytes (-{self.ratio:.0%})"
+
+
+def minify(source: str, options: MinifyOptions = MinifyOptions(),
+           tree: Optional[ast.Module] = None) -> MinifyResult:
+    """
+    Shrink a script without moving any statement to another line
+
+    Removed statements leave empty lines (or ``pass`` where a block would
+    otherwise be empty) and multi-line statements keep their line breaks, so
+    line N of the result is line N of ``source`` and hub tracebacks point
+    to the lines shown in the editor.
+
+    Args:
+        source: Python code that parses
+        options: What to remove
+        tree: ``ast.parse(source)``, if the caller already has it
+
+    Returns:
+        MinifyResult; ``source`` is the original if the transform did not
+        produce valid code (logged as a warning)
+
+    Raises:
+        SyntaxError: if ``source`` does not parse
+    """
+    source = source.replace("\r\n", "\n")
+    if tree is None:
+        tree = ast.parse(source)
+    original_size = len(source.encode("utf-8"))
+    removed = {"docstrings": 0, "comments": 0, "asserts": 0, "debug_blocks": 0, "interned": 0}
+
+    lines = source.split("\n")
+    _drop_statements(tree, lines, options, removed)
+    text = "\n".join(lines)
+
+    strings, definitions = _intern_candidates(tree, lines, removed) if options.intern_strings else ({}, "")
+    if options.compact or options.strip_comments or strings:
+        text = _rewrite_tokens(text, options, strings, removed)
+    if definitions:
+        row = definitions[0]
+        out = text.split("\n")
+        indent = len(out[row]) - len(out[row].lstrip())
+        out[row] = out[row][:indent] + definitions[1] + ";" + out[row][indent:]
+        text = "\n".join(out)
+
+    try:
+        ast.parse(text)
+    except SyntaxError as e:
+        logger.warning(f"Minified script does not parse ({e}), uploading it unchanged")
+        return MinifyResult(source, original_size, original_size)
+    return MinifyResult(text, original_size, len(text.encode("utf-8")), removed)
+
+
+# -- Statements -------------------------------------------------------------
+
+def _column(line: str, offset: int) -> int:
+    """Character column of an AST offset (which counts UTF-8 bytes)"""
+    return len(line.encode("utf-8")[:offset].decode("utf-8", errors="ignore"))
+
+
+def _whole_lines(node: ast.stmt, lines: List[str]) -> bool:
+    """True if no other code shares the lines of ``node`` (e.g. after ``;``)"""
+    if lines[node.lineno - 1][:_column(lines[node.lineno - 1], node.col_offset)].strip():
+        return False
+    last = lines[node.end_lineno - 1]
+    tail = last[_column(last, node.end_col_offset):].strip()
+    return not tail or tail.startswith("#")
+
+
+def _is_debug_test(test: ast.expr, names: Tuple[str, ...]) -> bool:
+    return isinstance(test, ast.Name) and test.id in names
+
+
+def _drop_statements(tree: ast.Module, lines: List[str], options: MinifyOptions,
+                     removed: Dict[str, int]):
+    """Blank the lines of removed statements in ``lines`` (in place)"""
+    blank: Set[int] = set()
+    for node in ast.walk(tree):
+        for attr in ("body", "orelse", "finalbody"):
+            block = getattr(node, attr, None)
+            if not isinstance(block, list) or not block or not isinstance(block[0], ast.stmt):
+                continue
+            # Inside a statement that is already gone
+            if block[0].lineno - 1 in blank:
+                continue
+            # ``elif`` chains are nested If nodes in orelse; leave their headers alone
+            if attr == "orelse" and isinstance(block[0], ast.If) \
+                    and lines[block[0].lineno - 1].lstrip().startswith("elif"):
+                continue
+
+            dropped = []
+            for stmt in block:
+                kind = _removable(stmt, options)
+                if kind is None or not _whole_lines(stmt, lines):
+                    continue
+                if kind == "debug_blocks" and stmt.orelse:
+                    # Keep the else branch: ``if 0:pass`` on the header line
+                    body_end = stmt.body[-1].end_lineno
+                    if stmt.body[0].lineno == stmt.lineno or not _whole_lines(stmt.body[-1], lines):
+                        continue
+                    indent = " " * stmt.col_offset
+                    lines[stmt.lineno - 1] = indent + "if 0:pass"
+                    for i in range(stmt.lineno, body_end):
+                        lines[i] = ""
+                        blank.add(i)
+                    removed[kind] += 1
+                    continue
+                dropped.append((stmt, kind))
+
+            for stmt, kind in dropped:
+                for i in range(stmt.lineno - 1, stmt.end_lineno):
+                    lines[i] = ""
+                    blank.add(i)
+                removed[kind] += 1
+            if dropped and len(dropped) == len(block):
+                first = block[0]
+                lines[first.lineno - 1] = " " * first.col_offset + "pass"
+
+
+def _removable(stmt: ast.stmt, options: MinifyOptions) -> Optional[str]:
+    """Counter name if ``stmt`` is removed with these options"""
+    if options.strip_docstrings and isinstance(stmt, ast.Expr) \
+            and isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str):
+        return "docstrings"
+    if options.strip_asserts and isinstance(stmt, ast.Assert):
+        return "asserts"
+    if options.strip_debug and isinstance(stmt, ast.If) and _is_debug_test(stmt.test, options.debug_names):
+        return "debug_blocks"
+    return None
+
+
+# -- String interning -------------------------------------------------------
+
+def _intern_candidates(tree: ast.Module, lines: List[str],
+                       removed: Dict[str, int]) -> Tuple[Dict[Tuple[int, int], str], Optional[Tuple[int, str]]]:
+    """
+    String literals worth replacing by a module-level name
+
+    Returns:
+        (token position -> name, (row of the first module statement,
+        ``name=literal;...`` definitions)); the definitions are None if
+        nothing is interned
+    """
+    excluded: Set[int] = set()
+    for node in ast.walk(tree):
+        # f-string parts and match patterns must stay literals
+        if isinstance(node, ast.JoinedStr) or type(node).__name__.startswith("Match"):
+            excluded.update(id(child) for child in ast.walk(node))
+
+    uses: Dict[str, List[Tuple[int, int]]] = {}
+    literal: Dict[str, str] = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Constant) or not isinstance(node.value, str) or id(node) in excluded:
+            continue
+        if node.lineno != node.end_lineno:
+            continue
+        line = lines[node.lineno - 1]
+        start = _column(line, node.col_offset)
+        text = line[start:_column(line, node.end_col_offset)]
+        if len(text) < 2 or text[0] not in "\"'" or text[1] == text[0] or not text.endswith(text[0]):
+            continue  # Prefixed, triple-quoted, empty or implicitly concatenated
+        uses.setdefault(node.value, []).append((node.lineno, start))
+        literal.setdefault(node.value, text)
+
+    # The definitions go in front of the first module-level simple statement
+    # that comes before every use
+    anchor = next((stmt for stmt in tree.body
+                   if not isinstance(stmt, _COMPOUND)
+                   and not (isinstance(stmt, ast.ImportFrom) and stmt.module == "__future__")
+                   and lines[stmt.lineno - 1].strip()), None)
+    if anchor is None:
+        return {}, None
+
+    taken = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+    taken.update(n.arg for n in ast.walk(tree) if isinstance(n, ast.arg))
+    names = (f"_S{i}" for i in itertools.count() if f"_S{i}" not in taken)
+    positions: Dict[Tuple[int, int], str] = {}
+    definitions = []
+    for value, places in sorted(uses.items(), key=lambda item: -len(item[1])):
+        text = literal[value]
+        # Each use saves the literal minus a short name; the definition costs
+        # ``name=literal;``
+        if len(places) * (len(text) - 3) <= len(text) + 5:
+            continue
+        if min(places) <= (anchor.lineno, anchor.col_offset):
+            continue
+        name = next(names)
+        definitions.append(f"{name}={text}")
+        for place in places:
+            positions[place] = name
+        removed["interned"] += len(places)
+    if not definitions:
+        return {}, None
+    return positions, (anchor.lineno - 1, ";".join(definitions))
+
+
+# -- Tokens -----------------------------------------------------------------
+
+def _word(char: str) -> bool:
+    return char.isalnum() or char == "_" or ord(char) > 127
+
+
+def _needs_space(prev: tokenize.TokenInfo, text: str, current: tokenize.TokenInfo) -> bool:
+    last, first = prev.string[-1], text[0]
+    if _word(last) and (_word(first) or (first == "." and current.type == tokenize.NUMBER)):
+        return True
+    if prev.type == tokenize.NUMBER and first == ".":
+        return True
+    if last in "'\"" and first == last:
+        return True  # ``'' ''`` must not become a triple quote
+    return (last + first) in _MERGING
+
+
+def _rewrite_tokens(text: str, options: MinifyOptions, strings: Dict[Tuple[int, int], str],
+                    removed: Dict[str, int]) -> str:
+    """Drop comments and redundant whitespace, keeping every token on its row"""
+    starts = [0]
+    for line in text.split("\n"):
+        starts.append(starts[-1] + len(line) + 1)
+
+    out: List[str] = []
+    row = 1
+    depth = 0
+    brackets = 0
+    prev: Optional[tokenize.TokenInfo] = None
+    line_start = True
+    tokens = tokenize.generate_tokens(io.StringIO(text).readline)
+    for tok in tokens:
+        if tok.type == tokenize.COMMENT:
+            if options.strip_comments:
+                removed["comments"] += 1
+                continue
+        elif tok.type == tokenize.INDENT:
+            depth += 1
+            continue
+        elif tok.type == tokenize.DEDENT:
+            depth -= 1
+            continue
+        elif tok.type in (tokenize.NEWLINE, tokenize.NL):
+            if tok.type == tokenize.NEWLINE:
+                line_start = True
+            continue
+        elif tok.type in _SKIPPED:
+            continue
+
+        value = tok.string
+        end = tok.end
+        if tok.type == _FSTRING_START:
+            # Copy the whole f-string verbatim (its spacing is part of the value)
+            nesting = 1
+            while nesting:
+                inner = next(tokens)
+                nesting += (inner.type == _FSTRING_START) - (inner.type == _FSTRING_END)
+            end = inner.end
+            value = text[starts[tok.start[0] - 1] + tok.start[1]:starts[end[0] - 1] + end[1]]
+        elif tok.type == tokenize.STRING and tok.start in strings:
+            value = strings[tok.start]
+
+        if tok.start[0] > row:
+            # Keep the line break; outside brackets a continuation needs a backslash
+            joiner = "\n" if line_start or brackets else "\\\n"
+            out.append(joiner * (tok.start[0] - row))
+            row = tok.start[0]
+            prev = None
+        if prev is None:
+            if not options.compact:
+                out.append(text[starts[row - 1]:starts[row - 1] + tok.start[1]])
+            elif line_start:
+                out.append(" " * depth)
+        elif not options.compact:
+            gap_start = starts[prev.end[0] - 1] + prev.end[1]
+            out.append(text[gap_start:starts[tok.start[0] - 1] + tok.start[1]])
+        elif _needs_space(prev, value, tok):
+            out.append(" ")
+
+        out.append(value)
+        if tok.type == tokenize.OP and value in "([{":
+            brackets += 1
+        elif tok.type == tokenize.OP and value in ")]}":
+            brackets -= 1
+        row = end[0]
+        if tok.type == tokenize.STRING and value != tok.string:
+            # An interned literal is now a name: ``_S0 in x``, not ``_S0in x``
+            prev = tok._replace(type=tokenize.NAME, string=value)
+        else:
+            prev = tok if tok.type != _FSTRING_START else tok._replace(string=value)
+        line_start = False
+
+    lines_in = text.count("\n") + 1
+    lines_out = "".join(out).count("\n") + 1
+    return "".join(out) + "\n" * (lines_in - lines_out)
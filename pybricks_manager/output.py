@@ -0,0 +1,128 @@
+"""
+Bounded buffer for hub stdout
+"""
+import codecs
+import collections
+import itertools
+import threading
+from typing import Callable, List, Optional, Tuple
+
+
+class OutputBuffer:
+    """
+    Fixed-capacity ring buffer of hub output lines
+
+    Raw stdout packets are fed in from the manager's event loop and split into
+    lines. Readers on other threads (e.g. the Streamlit script) keep a cursor
+    and only fetch lines appended since their last read. When the buffer is
+    full the oldest lines are dropped, so memory stays bounded no matter how
+    long a program prints.
+    """
+
+    def __init__(self, capacity: int = 10000, consume: Optional[Callable[[str], bool]] = None):
+        """
+        Args:
+            capacity: Lines kept before the oldest are dropped
+            consume: Called with every complete line; lines for which it
+                returns True (e.g. telemetry samples) are not kept or returned
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.consume = consume
+        self._lines = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._next_seq = 0
+        self._dropped = 0
+        self._partial = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        Add raw stdout bytes from the hub
+
+        Packets may split lines (and multi-byte characters) at any point, so
+        incomplete data is held back until the rest arrives.
+
+        Args:
+            data: Payload of one stdout notification
+
+        Returns:
+            Complete lines found in this packet (without line endings),
+            minus the consumed ones
+        """
+        text = self._partial + self._decoder.decode(bytes(data))
+        *lines, self._partial = text.split("\n")
+        lines = self._keep([line.rstrip("\r") for line in lines])
+        if lines:
+            self._extend(lines)
+        return lines
+
+    def flush(self) -> List[str]:
+        """Emit any pending partial line (e.g. when a program ends without a newline)"""
+        text = self._partial + self._decoder.decode(b"", final=True)
+        self._partial = ""
+        self._decoder.reset()
+        if not text:
+            return []
+        lines = self._keep([text.rstrip("\r")])
+        if lines:
+            self._extend(lines)
+        return lines
+
+    def _keep(self, lines: List[str]) -> List[str]:
+        if self.consume is None:
+            return lines
+        return [line for line in lines if not self.consume(line)]
+
+    def append(self, line: str):
+        """Add a single complete line"""
+        self._extend([line])
+
+    def _extend(self, lines: List[str]):
+        with self._lock:
+            self._dropped += max(0, len(self._lines) + len(lines) - self.capacity)
+            self._lines.extend(lines)
+            self._next_seq += len(lines)
+
+    def read(self, cursor: int = 0) -> Tuple[List[str], int]:
+        """
+        Get lines appended since ``cursor``
+
+        Args:
+            cursor: Value returned by the previous call (0 for everything)
+
+        Returns:
+            Tuple of (new lines, next cursor). Lines that were already evicted
+            from the buffer are skipped.
+        """
+        with self._lock:
+            first_seq = self._next_seq - len(self._lines)
+            start = max(cursor, first_seq)
+            if start >= self._next_seq:
+                return [], self._next_seq
+            lines = list(itertools.islice(self._lines, start - first_seq, None))
+            return lines, self._next_seq
+
+    def clear(self):
+        """Drop buffered lines. Existing cursors remain valid."""
+        with self._lock:
+            self._lines.clear()
+        self._partial = ""
+        self._decoder.reset()
+
+    @property
+    def cursor(self) -> int:
+        """Cursor pointing past the newest line"""
+        with self._lock:
+            return self._next_seq
+
+    @property
+    def dropped(self) -> int:
+        """Number of lines evicted because the buffer was full"""
+        with self._lock:
+            return self._dropped
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._lines)
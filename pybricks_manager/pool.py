@@ -0,0 +1,340 @@
+"""
+HubPool - concurrent connections to several Pybricks hubs on one event loop
+"""
+import asyncio
+import enum
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Union
+
+from .archive import OutputArchive
+from .compiler import CompileCache
+from .devices import DeviceCache
+from .jobs import Job, RunPolicy
+from .loop import EventLoopThread
+from .manager import PybricksManager
+from .metrics import Metrics
+from .preflight import Preflight
+from .project import Project
+from .scanner import DeviceScanner
+from .supervisor import LinkEvent, LinkState
+
+logger = logging.getLogger(__name__)
+
+
+class HubState(enum.Enum):
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    IDLE = "idle"
+    UPLOADING = "uploading"
+    RUNNING = "running"
+    ERROR = "error"
+
+
+# Pool state for link events reported by a manager's reconnect supervisor
+_LINK_STATES = {
+    LinkState.LOST: HubState.DISCONNECTED,
+    LinkState.RECONNECTING: HubState.CONNECTING,
+    LinkState.FAILED: HubState.ERROR,
+}
+
+# Allowed state transitions per hub
+_TRANSITIONS = {
+    HubState.DISCONNECTED: {HubState.CONNECTING},
+    HubState.CONNECTING: {HubState.IDLE, HubState.ERROR, HubState.DISCONNECTED},
+    HubState.IDLE: {HubState.UPLOADING, HubState.RUNNING, HubState.DISCONNECTED},
+    HubState.UPLOADING: {HubState.RUNNING, HubState.IDLE, HubState.ERROR, HubState.DISCONNECTED},
+    HubState.RUNNING: {HubState.UPLOADING, HubState.IDLE, HubState.ERROR, HubState.DISCONNECTED},
+    HubState.ERROR: {HubState.CONNECTING, HubState.IDLE, HubState.DISCONNECTED},
+}
+
+
+@dataclass
+class HubResult:
+    """Outcome of a pool operation on one hub (times in seconds)"""
+    address: str
+    ok: bool
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    upload_time: float = 0.0
+    run_time: float = 0.0
+    program_size: int = 0
+    # Job of the run on the hub's manager (see PybricksManager.jobs)
+    job_id: Optional[int] = None
+
+
+class HubPool:
+    """
+    Manages connections to several hubs at once
+
+    Every hub gets its own :class:`PybricksManager`, but all of them share one
+    background event loop, one device scanner and cache, one compile cache,
+    one pre-flight worker and one set of metrics. Connecting and uploading
+    are limited to ``max_concurrency`` hubs at a time because most BLE
+    adapters cannot handle many simultaneous connection attempts or write
+    streams; running programs are not limited.
+    """
+
+    def __init__(self, max_concurrency: int = 3, output_capacity: int = 10000,
+                 archive: Optional[OutputArchive] = None):
+        """
+        Args:
+            max_concurrency: Hubs connecting or uploading at the same time
+            output_capacity: Output lines kept in memory per hub
+            archive: Where the output of every run is kept on disk (runs
+                are labelled with the hub address; not archived by default)
+        """
+        self.max_concurrency = max_concurrency
+        self.output_capacity = output_capacity
+        self.device_cache = DeviceCache()
+        self.compile_cache = CompileCache()
+        self.scanner = DeviceScanner(self.device_cache)
+        self.preflight = Preflight()
+        self.metrics = Metrics()
+        self.archive = archive
+        self.managers: Dict[str, PybricksManager] = {}
+        self._states: Dict[str, HubState] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop_thread = EventLoopThread("pybricks-pool-loop")
+
+    # -- Thread-safe entry points (same as PybricksManager) ------------------
+
+    def submit(self, coro: Awaitable[Any]):
+        """Schedule a coroutine on the pool's event loop (thread-safe)"""
+        return self._loop_thread.submit(coro)
+
+    def call(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the pool's event loop and wait for its result"""
+        return self._loop_thread.call(coro, timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Disconnect all hubs and stop the event loop"""
+        if self._loop_thread.closed:
+            return
+        try:
+            self.call(self.disconnect_all(), timeout=timeout)
+        except Exception as e:
+            logger.error(f"Error during close: {e}")
+        try:
+            self.call(self.scanner.close(), timeout=timeout)
+        except Exception as e:
+            logger.error(f"Error stopping scan: {e}")
+        self.preflight.close()
+        self._loop_thread.stop(timeout)
+
+    # -- State ---------------------------------------------------------------
+
+    @staticmethod
+    def _key(address: str) -> str:
+        return address.strip().upper()
+
+    @property
+    def addresses(self) -> List[str]:
+        return list(self.managers)
+
+    def state(self, address: str) -> HubState:
+        return self._states.get(self._key(address), HubState.DISCONNECTED)
+
+    def states(self) -> Dict[str, HubState]:
+        return dict(self._states)
+
+    def manager(self, address: str) -> PybricksManager:
+        return self.managers[self._key(address)]
+
+    def _set_state(self, address: str, state: HubState):
+        current = self._states.get(address, HubState.DISCONNECTED)
+        if state != current and state not in _TRANSITIONS[current]:
+            raise RuntimeError(f"Hub {address} is {current.value}, cannot become {state.value}")
+        self._states[address] = state
+        logger.debug(f"Hub {address}: {current.value} -> {state.value}")
+
+    def _handle_link_event(self, key: str, event: LinkEvent):
+        """Follow automatic reconnects of a hub"""
+        if event.state in _LINK_STATES:
+            self._states[key] = _LINK_STATES[event.state]
+        elif event.state == LinkState.CONNECTED and event.previous == LinkState.RECONNECTING:
+            self._states[key] = HubState.IDLE
+        logger.debug(f"Hub {key}: link {event.state.value} -> {self._states.get(key, HubState.DISCONNECTED).value}")
+
+    def _adapter_slots(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the pool loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    # -- Connections ---------------------------------------------------------
+
+    async def connect(self, address: str) -> HubResult:
+        """
+        Connect to one hub (no-op if already connected)
+
+        Returns:
+            HubResult with the connect time in ``elapsed``
+        """
+        key = self._key(address)
+        manager = self.managers.get(key)
+        if manager and manager.connected:
+            return HubResult(key, True)
+
+        start = time.monotonic()
+        try:
+            self._set_state(key, HubState.CONNECTING)
+            if manager is None:
+                manager = PybricksManager(
+                    self.output_capacity,
+                    loop_thread=self._loop_thread,
+                    device_cache=self.device_cache,
+                    compile_cache=self.compile_cache,
+                    scanner=self.scanner,
+                    preflight=self.preflight,
+                    metrics=self.metrics,
+                    archive=self.archive,
+                )
+                manager.supervisor.listeners.append(
+                    lambda event, key=key: self._handle_link_event(key, event)
+                )
+                manager.upload_slots = self._adapter_slots()
+                self.managers[key] = manager
+            async with self._adapter_slots():
+                await manager.connect(address)
+            self._set_state(key, HubState.IDLE)
+            return HubResult(key, True, elapsed=time.monotonic() - start)
+        except Exception as e:
+            self._states[key] = HubState.ERROR
+            return HubResult(key, False, error=str(e), elapsed=time.monotonic() - start)
+
+    async def connect_all(self, addresses: Iterable[str]) -> Dict[str, HubResult]:
+        """Connect to several hubs in parallel"""
+        results = await asyncio.gather(*(self.connect(a) for a in addresses))
+        return {r.address: r for r in results}
+
+    async def disconnect(self, address: str):
+        key = self._key(address)
+        manager = self.managers.pop(key, None)
+        if manager:
+            await manager.disconnect()
+        self._states[key] = HubState.DISCONNECTED
+
+    async def disconnect_all(self):
+        await asyncio.gather(*(self.disconnect(a) for a in list(self.managers)))
+
+    # -- Deployment ----------------------------------------------------------
+
+    async def _run_one(self, key: str, script: Union[str, Project], wait: bool,
+                       policy: RunPolicy) -> HubResult:
+        manager = self.managers.get(key)
+        if manager is None or not manager.connected:
+            return HubResult(key, False, error="Not connected")
+
+        try:
+            self._set_state(key, HubState.UPLOADING)
+        except RuntimeError as e:
+            return HubResult(key, False, error=str(e))
+
+        # Through the hub's job queue, so a pool run never uploads over a job
+        # that is running on the same manager; uploads take an adapter slot
+        start = time.monotonic()
+        upload_done = start
+        job = manager.run_script(script, policy=policy)
+        try:
+            await job.started()
+            upload_done = time.monotonic()
+            if not job.done:
+                self._set_state(key, HubState.RUNNING)
+            if wait:
+                await job
+            if job.done:
+                self._set_state(key, HubState.IDLE)
+            else:
+                asyncio.ensure_future(self._watch_job(key, manager, job))
+        except Exception as e:
+            logger.error(f"Run failed on {key}: {e}")
+            self._states[key] = HubState.IDLE if manager.connected else HubState.ERROR
+            return HubResult(key, False, error=str(e), elapsed=time.monotonic() - start,
+                             upload_time=upload_done - start, job_id=job.id)
+
+        end = time.monotonic()
+        size = len(manager._hub_image) if manager._hub_image is not None else 0
+        return HubResult(key, True, elapsed=end - start, upload_time=upload_done - start,
+                         run_time=end - upload_done, program_size=size, job_id=job.id)
+
+    async def _watch_job(self, key: str, manager: PybricksManager, job: Job):
+        """Return a hub to IDLE once a job started with wait=False ends"""
+        try:
+            await job
+        except Exception as e:
+            logger.debug(f"Job {job.id} on {key} ended: {e}")
+        # A later pool run may have taken the hub over in the meantime
+        if self._states.get(key) == HubState.RUNNING and manager.jobs.current is None:
+            self._set_state(key, HubState.IDLE if manager.connected else HubState.ERROR)
+
+    async def map_run(self, scripts: Dict[str, Union[str, Project]], wait: bool = True,
+                      policy: RunPolicy = RunPolicy.QUEUE) -> Dict[str, HubResult]:
+        """
+        Upload and start a different script on each hub in parallel
+
+        Each run is a job on the hub's :class:`JobQueue`, so it waits behind
+        (or replaces, depending on ``policy``) whatever that hub is running.
+
+        Args:
+            scripts: Mapping of hub address to Python code or a :class:`Project`
+            wait: If True, return after all programs have stopped; otherwise
+                return as soon as all programs have started
+            policy: What to do with a program already running on a hub
+
+        Returns:
+            Per-hub results with upload and run timings
+        """
+        jobs = {self._key(a): s for a, s in scripts.items()}
+
+        # Compile each distinct script once up front; the hubs then hit the
+        # shared compile cache instead of running mpy-cross in parallel
+        first_for_script = {}
+        for key, script in jobs.items():
+            manager = self.managers.get(key)
+            if manager and manager.connected and manager.can_download:
+                first_for_script.setdefault(script, manager)
+        await asyncio.gather(
+            *(m._compile(s) for s, m in first_for_script.items()),
+            return_exceptions=True,
+        )
+
+        results = await asyncio.gather(*(self._run_one(k, s, wait, policy) for k, s in jobs.items()))
+        return {r.address: r for r in results}
+
+    async def broadcast_run(self, script: Union[str, Project], addresses: Optional[Iterable[str]] = None,
+                            wait: bool = True, policy: RunPolicy = RunPolicy.QUEUE) -> Dict[str, HubResult]:
+        """
+        Upload and start the same script on all (or the given) hubs in parallel
+
+        Args:
+            script: Python code or a :class:`Project`
+            addresses: Hubs to deploy to (default: every connected hub)
+            wait: See :meth:`map_run`
+            policy: See :meth:`map_run`
+        """
+        targets = list(addresses) if addresses is not None else self.addresses
+        return await self.map_run({a: script for a in targets}, wait=wait, policy=policy)
+
+    async def stop(self, address: str) -> HubResult:
+        """Stop the running program on one hub"""
+        key = self._key(address)
+        manager = self.managers.get(key)
+        if manager is None or not manager.connected:
+            return HubResult(key, False, error="Not connected")
+
+        start = time.monotonic()
+        try:
+            await manager.stop_script()
+            if self._states.get(key) == HubState.RUNNING:
+                self._set_state(key, HubState.IDLE)
+            return HubResult(key, True, elapsed=time.monotonic() - start)
+        except Exception as e:
+            return HubResult(key, False, error=str(e), elapsed=time.monotonic() - start)
+
+    async def stop_all(self) -> Dict[str, HubResult]:
+        """Stop running programs on every connected hub"""
+        keys = [k for k, m in self.managers.items() if m.connected]
+        results = await asyncio.gather(*(self.stop(k) for k in keys))
+        return {r.address: r for r in results}
@@ -0,0 +1,246 @@
+"""
+Pre-flight validation of scripts before they are uploaded
+
+Every script is parsed, checked against the Pybricks API index in
+:mod:`.pybricks_api` and compiled with mpy-cross in a worker process, so a
+typo is reported with its line number before any BLE traffic and without
+blocking the event loop. A script that passes comes back compiled, ready to
+be packed and uploaded.
+"""
+import ast
+import asyncio
+import concurrent.futures
+import difflib
+import logging
+import re
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from .compiler import CompileError, compile_source
+from .minify import MinifyOptions, MinifyResult, minify
+from .pybricks_api import BUILTIN_MODULES, PYBRICKS_MODULES, UNCHECKED_MODULES
+
+logger = logging.getLogger(__name__)
+
+_MPY_CROSS_LINE = re.compile(r'line (\d+)')
+
+
+@dataclass
+class Diagnostic:
+    """One problem found in a script (``line`` is 1-based, 0 if unknown)"""
+    line: int
+    column: int
+    message: str
+    severity: str = "error"
+    stage: str = "api"
+    # Project file the problem is in (None for a single script)
+    file: Optional[str] = None
+
+    def __str__(self) -> str:
+        where = f"line {self.line}" if self.line else "script"
+        if self.file:
+            where = f"{self.file}, {where}"
+        return f"{where}: {self.message}"
+
+
+@dataclass
+class PreflightResult:
+    """Outcome of :func:`check_source` (``elapsed`` in seconds)"""
+    diagnostics: List[Diagnostic] = field(default_factory=list)
+    mpy: Optional[bytes] = None
+    elapsed: float = 0.0
+    # Set if the script was minified before compiling
+    reduction: Optional[MinifyResult] = None
+
+    @property
+    def errors(self) -> List[Diagnostic]:
+        return [d for d in self.diagnostics if d.severity == "error"]
+
+    @property
+    def warnings(self) -> List[Diagnostic]:
+        return [d for d in self.diagnostics if d.severity == "warning"]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and self.mpy is not None
+
+
+class PreflightError(CompileError):
+    """A script failed pre-flight validation (``diagnostics`` has the details)"""
+
+    def __init__(self, diagnostics: List[Diagnostic]):
+        self.diagnostics = diagnostics
+        super().__init__("\n".join(str(d) for d in diagnostics if d.severity == "error"))
+
+
+# -- Checks -----------------------------------------------------------------
+
+def _suggest(name: str, choices: Iterable[str]) -> str:
+    close = difflib.get_close_matches(name, list(choices), n=1)
+    return f" (did you mean '{close[0]}'?)" if close else ""
+
+
+class _ApiChecker(ast.NodeVisitor):
+    """Checks imports and enum members against the Pybricks API index"""
+
+    def __init__(self, local_modules: Iterable[str]):
+        self.local_modules = set(local_modules)
+        self.diagnostics: List[Diagnostic] = []
+        # Local name -> members of the Pybricks enum it is bound to
+        self.enums: Dict[str, frozenset] = {}
+
+    def _report(self, node: ast.AST, message: str, severity: str = "error"):
+        self.diagnostics.append(Diagnostic(
+            getattr(node, "lineno", 0), getattr(node, "col_offset", 0) + 1, message, severity,
+        ))
+
+    def _check_module(self, node: ast.AST, module: str) -> bool:
+        """True if names imported from ``module`` can be checked"""
+        top = module.split(".")[0]
+        if module in PYBRICKS_MODULES:
+            return True
+        if module in UNCHECKED_MODULES:
+            return False
+        if top == "pybricks":
+            known = list(PYBRICKS_MODULES) + list(UNCHECKED_MODULES)
+            self._report(node, f"Unknown module '{module}'{_suggest(module, known)}")
+        elif top not in BUILTIN_MODULES and top not in self.local_modules:
+            self._report(node, f"Module '{module}' is not available on the hub", "warning")
+        return False
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self._check_module(node, alias.name)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.level or not node.module:
+            return  # Relative imports only make sense in a project
+        if not self._check_module(node, node.module):
+            return
+
+        names = PYBRICKS_MODULES[node.module]
+        for alias in node.names:
+            if alias.name == "*":
+                self.enums.update({n: m for n, m in names.items() if m is not None})
+            elif alias.name not in names:
+                self._report(node, f"'{alias.name}' is not in {node.module}"
+                                   f"{_suggest(alias.name, names)}")
+            elif names[alias.name] is not None:
+                self.enums[alias.asname or alias.name] = names[alias.name]
+
+    def visit_Attribute(self, node: ast.Attribute):
+        value = node.value
+        if isinstance(value, ast.Name) and value.id in self.enums and isinstance(node.ctx, ast.Load):
+            members = self.enums[value.id]
+            if node.attr not in members:
+                self._report(node, f"{value.id} has no member '{node.attr}'"
+                                   f"{_suggest(node.attr, members)}")
+        self.generic_visit(node)
+
+    def visit_Assign(self, node: ast.Assign):
+        # Rebinding a name (e.g. ``Port = ...``) ends the enum check for it
+        self.generic_visit(node)
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self.enums.pop(target.id, None)
+
+
+def check_source(source: str, abi: int = 6, file_name: str = "__main__.py",
+                 local_modules: Iterable[str] = (), compile: bool = True,
+                 minify_options: Optional[MinifyOptions] = None) -> PreflightResult:
+    """
+    Parse, API-check and compile a script (blocking; runs in a worker process)
+
+    Args:
+        source: Python code
+        abi: MPY ABI major version for mpy-cross
+        file_name: Name reported in diagnostics and hub tracebacks
+        local_modules: Top-level module names provided by the project, which
+            are not reported as unavailable on the hub
+        compile: Also run mpy-cross when the checks pass
+        minify_options: Compile the script reduced by :func:`minify`
+            (diagnostics still refer to ``source``)
+
+    Returns:
+        PreflightResult with diagnostics and, if there were no errors, the
+        compiled MPY bytes
+    """
+    start = time.perf_counter()
+    result = PreflightResult()
+
+    try:
+        tree = ast.parse(source, file_name)
+    except SyntaxError as e:
+        result.diagnostics.append(Diagnostic(e.lineno or 0, e.offset or 0, e.msg, stage="syntax"))
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    checker = _ApiChecker(local_modules)
+    checker.visit(tree)
+    result.diagnostics.extend(checker.diagnostics)
+
+    if compile and not result.errors:
+        program = source
+        if minify_options is not None:
+            result.reduction = minify(source, minify_options, tree)
+            program = result.reduction.source
+        try:
+            result.mpy = compile_source(program, abi, file_name)
+        except CompileError as e:
+            match = _MPY_CROSS_LINE.search(str(e))
+            message = str(e).strip().splitlines()[-1] if str(e).strip() else "mpy-cross failed"
+            result.diagnostics.append(Diagnostic(
+                int(match.group(1)) if match else 0, 0, message, stage="compile",
+            ))
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+# -- Worker pool ------------------------------------------------------------
+
+class Preflight:
+    """
+    Runs :func:`check_source` in a process pool
+
+    The pool is created on first use (or by :meth:`start`, to have a warm
+    worker before the first check). If worker processes cannot be started the
+    checks fall back to a thread.
+    """
+
+    def __init__(self, max_workers: int = 1):
+        self.max_workers = max_workers
+        self._executor: Optional[concurrent.futures.Executor] = None
+
+    def _pool(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+        return self._executor
+
+    def start(self):
+        """Start the worker process in the background"""
+        try:
+            self._pool().submit(int)
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"Pre-flight worker unavailable, checking in a thread: {e}")
+            self._executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    async def check(self, source: str, abi: int = 6, file_name: str = "__main__.py",
+                    local_modules: Iterable[str] = (), compile: bool = True,
+                    minify_options: Optional[MinifyOptions] = None) -> PreflightResult:
+        """Run :func:`check_source` without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        args = (source, abi, file_name, tuple(local_modules), compile, minify_options)
+        try:
+            return await loop.run_in_executor(self._pool(), check_source, *args)
+        except BrokenProcessPool as e:
+            logger.warning(f"Pre-flight worker died, checking in a thread: {e}")
+            self._executor = concurrent.futures.ThreadPoolExecutor(1)
+            return await loop.run_in_executor(self._executor, check_source, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,281 @@
+"""
+Multi-file projects - import graph resolution and program image layout
+"""
+import ast
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import tokenize
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .compiler import pack_program
+
+logger = logging.getLogger(__name__)
+
+# First module of the image, run by the firmware: a fixed launcher that
+# imports the entry script, so the script itself can move like any module
+ENTRY_MODULE = "__main__"
+SCRIPT_MODULE = "__entry__"
+LAUNCHER_SOURCE = f"import {SCRIPT_MODULE}\n"
+
+
+@dataclass
+class ModuleSource:
+    """One module of a project (``file_name`` is relative to the project directory)"""
+    name: str
+    path: str
+    file_name: str
+    source: str
+    imports: List[str] = field(default_factory=list)
+
+    def digest(self, abi: int, variant: str = "") -> str:
+        """Identifies the compiled output of this module (``variant``: build options)"""
+        h = hashlib.sha256(f"{self.name}\x00{self.file_name}\x00{abi}\x00{variant}".encode())
+        h.update(self.source.encode("utf-8"))
+        return h.hexdigest()
+
+
+@dataclass
+class BuildStats:
+    """Result of the last :meth:`Project.pack` (``elapsed`` in seconds)"""
+    modules: int = 0
+    compiled: int = 0
+    reused: int = 0
+    size: int = 0
+    elapsed: float = 0.0
+    changed: List[str] = field(default_factory=list)
+
+
+class Project:
+    """
+    An entry script plus the local modules it imports
+
+    The import graph is resolved from the entry file against ``directory``;
+    imports that do not resolve to a file there (``pybricks``, MicroPython
+    built-ins) are left to the hub. Files are only re-read and re-parsed when
+    their size or modification time changed, and compiled modules are kept
+    per module, so rebuilding after an edit only compiles what was edited.
+
+    The firmware runs the first module of the program image as
+    ``__main__``. That module is a one-line launcher that never changes; the
+    entry script is compiled as module ``__entry__`` (with ``__name__``
+    reading ``"__main__"``) and is laid out like every other module, ordered
+    from least to most recently changed. After an edit the unchanged modules
+    keep their offsets and the delta upload only sends the tail of the image.
+    """
+
+    def __init__(self, entry: str, directory: Optional[str] = None):
+        """
+        Args:
+            entry: Path of the script that runs on the hub
+            directory: Directory imports are resolved in (default: the
+                directory of ``entry``)
+        """
+        self.entry = os.path.abspath(entry)
+        self.directory = os.path.abspath(directory or os.path.dirname(self.entry))
+        self.last_build: Optional[BuildStats] = None
+        # path -> ((mtime_ns, size), source, raw imports)
+        self._files: Dict[str, Tuple[Tuple[int, int], str, List[Tuple[str, int, List[str]]]]] = {}
+        # module name -> (digest, mpy) of the last compiled version
+        self._compiled: Dict[str, Tuple[str, bytes]] = {}
+        # Library module order in the last image
+        self._layout: List[str] = []
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"Project({self.entry!r}, {self.directory!r})"
+
+    # -- Import graph --------------------------------------------------------
+
+    def _read(self, path: str) -> Tuple[str, List[Tuple[str, int, List[str]]]]:
+        """Source and imports of a file, re-parsed only if it changed"""
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._files.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+        try:
+            tree = ast.parse(source, path)
+        except SyntaxError:
+            # Reported with its line number by the pre-flight check
+            imports = []
+        else:
+            imports = _imports(tree)
+        self._files[path] = (stamp, source, imports)
+        return source, imports
+
+    def _find(self, name: str) -> Optional[str]:
+        """File that provides module ``name`` in the project directory"""
+        base = os.path.join(self.directory, *name.split("."))
+        for path in (base + ".py", os.path.join(base, "__init__.py")):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _candidates(self, module: str, name: str, level: int, names: List[str]) -> List[str]:
+        """Module names an import statement in ``module`` may refer to"""
+        if level:
+            if module in (ENTRY_MODULE, SCRIPT_MODULE):
+                return []
+            package = module.split(".")
+            is_package = os.path.basename(self._find(module) or "") == "__init__.py"
+            package = package[:len(package) - level + (1 if is_package else 0)]
+            if not package and level > 1:
+                return []
+            name = ".".join(package + ([name] if name else []))
+        if not name:
+            return []
+
+        parts = name.split(".")
+        found = [".".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        # ``from package import module`` imports a submodule
+        found.extend(f"{name}.{n}" for n in names if n != "*")
+        return found
+
+    def modules(self) -> List[ModuleSource]:
+        """
+        Resolve the import graph (blocking)
+
+        Returns:
+            The launcher, the entry script and every local module it
+            imports, directly or indirectly
+
+        Raises:
+            FileNotFoundError: if the entry file does not exist
+        """
+        with self._lock:
+            source, imports = self._read(self.entry)
+            launcher = ModuleSource(ENTRY_MODULE, self.entry, f"{ENTRY_MODULE}.py", LAUNCHER_SOURCE,
+                                    [SCRIPT_MODULE])
+            entry = ModuleSource(SCRIPT_MODULE, self.entry, self._relative(self.entry), _as_main(source))
+            found: Dict[str, ModuleSource] = {ENTRY_MODULE: launcher, SCRIPT_MODULE: entry}
+            pending = [(entry, imports)]
+            while pending:
+                module, imports = pending.pop()
+                for name, level, names in imports:
+                    for candidate in self._candidates(module.name, name, level, names):
+                        if candidate in found:
+                            if candidate not in module.imports:
+                                module.imports.append(candidate)
+                            continue
+                        path = self._find(candidate)
+                        if path is None or path == self.entry:
+                            continue
+                        source, sub_imports = self._read(path)
+                        dep = ModuleSource(candidate, path, self._relative(path), source)
+                        found[candidate] = dep
+                        module.imports.append(candidate)
+                        pending.append((dep, sub_imports))
+
+            # Forget files that are no longer part of the project
+            paths = {m.path for m in found.values()}
+            for path in list(self._files):
+                if path not in paths:
+                    del self._files[path]
+            return list(found.values())
+
+    def _relative(self, path: str) -> str:
+        rel = os.path.relpath(path, self.directory)
+        return os.path.basename(path) if rel.startswith("..") else rel.replace(os.sep, "/")
+
+    def local_names(self, modules: Iterable[ModuleSource]) -> Set[str]:
+        """Top-level names of the project's modules (not reported as missing on the hub)"""
+        return {m.name.split(".")[0] for m in modules if m.name != ENTRY_MODULE}
+
+    # -- Compiled modules and image -----------------------------------------
+
+    def stale(self, modules: Iterable[ModuleSource], abi: int, variant: str = "") -> List[ModuleSource]:
+        """Modules whose source (or build options) changed since they were last compiled"""
+        with self._lock:
+            return [m for m in modules
+                    if self._compiled.get(m.name, (None,))[0] != m.digest(abi, variant)]
+
+    def store(self, module: ModuleSource, abi: int, mpy: bytes, variant: str = ""):
+        """Remember the compiled output of a module"""
+        with self._lock:
+            self._compiled[module.name] = (module.digest(abi, variant), mpy)
+
+    def pack(self, modules: List[ModuleSource], changed: Iterable[str] = (),
+             start: Optional[float] = None) -> bytes:
+        """
+        Pack the compiled modules into one program image
+
+        Args:
+            modules: Result of :meth:`modules`, all compiled with :meth:`store`
+            changed: Names of the modules compiled for this build; they are
+                moved to the end of the image (the launcher stays first)
+            start: ``time.monotonic()`` at the start of the build, for ``last_build``
+
+        Returns:
+            Multi-file program image
+        """
+        changed = set(changed)
+        with self._lock:
+            names = {m.name for m in modules} - {ENTRY_MODULE}
+            kept = [n for n in self._layout if n in names and n not in changed]
+            layout = kept + sorted(names - set(kept))
+            self._layout = layout
+            image = pack_program(
+                (name, self._compiled[name][1]) for name in [ENTRY_MODULE] + layout
+            )
+            for name in set(self._compiled) - names - {ENTRY_MODULE}:
+                del self._compiled[name]
+
+        self.last_build = BuildStats(
+            modules=len(modules),
+            compiled=len(changed),
+            reused=len(modules) - len(changed),
+            size=len(image),
+            elapsed=0.0 if start is None else time.monotonic() - start,
+            changed=sorted(changed),
+        )
+        return image
+
+
+def _as_main(source: str) -> str:
+    """
+    Entry script source with ``__name__`` replaced by ``"__main__"``
+
+    The script is imported by the launcher, so its real ``__name__`` is
+    ``__entry__``; this keeps ``if __name__ == "__main__":`` blocks running.
+    Lines do not move, so hub tracebacks still match the file.
+    """
+    if "__name__" not in source:
+        return source
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    except (tokenize.TokenError, SyntaxError):
+        # Reported by the pre-flight check
+        return source
+    lines = source.splitlines(keepends=True)
+    for i in reversed(range(len(tokens))):
+        tok = tokens[i]
+        if tok.type != tokenize.NAME or tok.string != "__name__":
+            continue
+        before = tokens[i - 1] if i else None
+        after = tokens[i + 1] if i + 1 < len(tokens) else None
+        # Leave attributes (``f.__name__``) and assignments alone
+        if before is not None and before.string == "." or after is not None and after.string == "=":
+            continue
+        row, col = tok.start
+        line = lines[row - 1]
+        lines[row - 1] = line[:col] + '"__main__"' + line[col + len(tok.string):]
+    return "".join(lines)
+
+
+def _imports(tree: ast.AST) -> List[Tuple[str, int, List[str]]]:
+    """(module, relative level, imported names) of every import in a module"""
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            found.extend((alias.name, 0, []) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            found.append((node.module or "", node.level, [alias.name for alias in node.names]))
+    return found
@@ -0,0 +1,138 @@
+"""
+Index of the Pybricks API used by the pre-flight checker
+
+Maps each ``pybricks`` module to the names it exports. For enum-like classes
+the members are listed too, so typos such as ``Port.G`` or
+``Color.PURPLE`` are caught before uploading. A name mapped to ``None`` is
+known but its attributes are not checked.
+
+Based on the Pybricks v3.x API (pybricks.com/ev3-micropython and
+docs.pybricks.com).
+"""
+from typing import Dict, FrozenSet, Optional
+
+_PORTS = frozenset("ABCDEF") | frozenset({"S1", "S2", "S3", "S4"})
+
+PYBRICKS_MODULES: Dict[str, Dict[str, Optional[FrozenSet[str]]]] = {
+    "pybricks": {
+        "version": None,
+    },
+    "pybricks.hubs": {
+        "PrimeHub": None,
+        "InventorHub": None,
+        "EssentialHub": None,
+        "TechnicHub": None,
+        "CityHub": None,
+        "MoveHub": None,
+        "ThisHub": None,
+        "EV3Brick": None,
+    },
+    "pybricks.pupdevices": {
+        "Motor": None,
+        "DCMotor": None,
+        "ColorSensor": None,
+        "ColorDistanceSensor": None,
+        "ColorLightMatrix": None,
+        "ForceSensor": None,
+        "UltrasonicSensor": None,
+        "TiltSensor": None,
+        "InfraredSensor": None,
+        "Light": None,
+        "PFMotor": None,
+        "Remote": None,
+    },
+    "pybricks.parameters": {
+        "Port": _PORTS,
+        "Direction": frozenset({"CLOCKWISE", "COUNTERCLOCKWISE"}),
+        "Stop": frozenset({"COAST", "COAST_SMART", "BRAKE", "HOLD", "NONE"}),
+        "Color": frozenset({
+            "BLACK", "GRAY", "WHITE", "RED", "ORANGE", "BROWN", "YELLOW",
+            "GREEN", "CYAN", "BLUE", "VIOLET", "MAGENTA", "NONE",
+        }),
+        "Button": frozenset({
+            "LEFT", "RIGHT", "CENTER", "UP", "DOWN", "BLUETOOTH", "BEACON",
+            "LEFT_PLUS", "LEFT_MINUS", "RIGHT_PLUS", "RIGHT_MINUS",
+            "LEFT_UP", "LEFT_DOWN", "RIGHT_UP", "RIGHT_DOWN",
+        }),
+        "Side": frozenset({"TOP", "BOTTOM", "FRONT", "BACK", "LEFT", "RIGHT"}),
+        "Axis": frozenset({"X", "Y", "Z"}),
+        "Icon": None,
+    },
+    "pybricks.tools": {
+        "wait": None,
+        "StopWatch": None,
+        "DataLog": None,
+        "multitask": None,
+        "run_task": None,
+        "hub_menu": None,
+        "read_input_byte": None,
+        "vector": None,
+        "Matrix": None,
+        "cross": None,
+        "AppData": None,
+        "print": None,
+    },
+    "pybricks.robotics": {
+        "DriveBase": None,
+        "GyroDriveBase": None,
+        "Car": None,
+    },
+    "pybricks.geometry": {
+        "Matrix": None,
+        "vector": None,
+        "Axis": frozenset({"X", "Y", "Z"}),
+    },
+    "pybricks.iodevices": {
+        "PUPDevice": None,
+        "LUMPDevice": None,
+        "DCMotor": None,
+        "AnalogSensor": None,
+        "I2CDevice": None,
+        "UARTDevice": None,
+        "Ev3devSensor": None,
+        "LWP3Device": None,
+        "XboxController": None,
+    },
+    "pybricks.ev3devices": {
+        "Motor": None,
+        "TouchSensor": None,
+        "ColorSensor": None,
+        "InfraredSensor": None,
+        "UltrasonicSensor": None,
+        "GyroSensor": None,
+    },
+    "pybricks.nxtdevices": {
+        "TouchSensor": None,
+        "LightSensor": None,
+        "ColorSensor": None,
+        "UltrasonicSensor": None,
+        "SoundSensor": None,
+        "TemperatureSensor": None,
+        "EnergyMeter": None,
+        "VernierAdapter": None,
+    },
+    "pybricks.media.ev3dev": {
+        "Font": None,
+        "Image": None,
+        "ImageFile": None,
+        "SoundFile": None,
+    },
+    "pybricks.messaging": {
+        "BluetoothMailboxServer": None,
+        "BluetoothMailboxClient": None,
+        "Mailbox": None,
+        "LogicMailbox": None,
+        "NumericMailbox": None,
+        "TextMailbox": None,
+    },
+}
+
+# Modules whose contents change between firmware versions; any name is accepted
+UNCHECKED_MODULES = frozenset({"pybricks.experimental"})
+
+# MicroPython modules available in Pybricks firmware (with and without the u prefix)
+BUILTIN_MODULES = frozenset({
+    "micropython", "gc", "math", "umath", "random", "urandom", "struct", "ustruct",
+    "sys", "usys", "io", "uio", "json", "ujson", "select", "uselect", "errno",
+    "uerrno", "array", "uarray", "builtins", "ubuiltins", "time", "utime",
+})
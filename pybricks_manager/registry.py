@@ -0,0 +1,350 @@
+"""
+HubRegistry - hub connections shared by several sessions of one process
+"""
+import collections
+import contextlib
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .archive import OutputArchive
+from .compiler import CompileCache
+from .devices import DeviceCache
+from .jobs import Job
+from .loop import EventLoopThread
+from .manager import PybricksManager
+from .metrics import Metrics
+from .preflight import Preflight
+from .scanner import DeviceScanner
+from .supervisor import LinkEvent
+
+logger = logging.getLogger(__name__)
+
+
+class ControlError(RuntimeError):
+    """Another session controls the hub, or a control operation is still in progress"""
+
+
+@dataclass
+class HubEvent:
+    """Status change of a shared hub, as seen by every subscriber"""
+    seq: int
+    # "connected", "disconnected", "link", "job" or "control"
+    kind: str
+    timestamp: float
+    message: str
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class Subscription:
+    """
+    One session's view of a shared hub
+
+    Output and events are pulled with a private cursor, so subscribers never
+    wait for each other. A subscriber that falls more than ``backlog`` lines
+    behind skips ahead to the newest ``backlog`` lines (counted in
+    ``skipped``) instead of replaying everything it missed.
+    """
+
+    def __init__(self, hub: "SharedHub", sub_id: int, name: str, backlog: int):
+        self.hub = hub
+        self.id = sub_id
+        self.name = name
+        self.backlog = backlog
+        self.skipped = 0
+        self.closed = False
+        self.last_seen = time.monotonic()
+        # New subscribers start with the recent output and only new events
+        self.cursor = max(0, hub.manager.output.cursor - backlog)
+        self.event_seq = hub.event_seq
+
+    def __repr__(self) -> str:
+        return f"<Subscription {self.label} to {self.hub.address}>"
+
+    @property
+    def label(self) -> str:
+        return self.name or f"#{self.id}"
+
+    @property
+    def controlling(self) -> bool:
+        return self.hub.controller is self
+
+    def touch(self):
+        """Mark the subscriber as alive (keeps its control lease)"""
+        self.last_seen = time.monotonic()
+
+    def read(self) -> List[str]:
+        """Output lines since the last read (at most ``backlog``)"""
+        self.touch()
+        output = self.hub.manager.output
+        start = max(self.cursor, output.cursor - self.backlog)
+        if start > self.cursor:
+            self.skipped += start - self.cursor
+        lines, self.cursor = output.read(start)
+        return lines
+
+    def events(self) -> List[HubEvent]:
+        """Status events since the last call, oldest first"""
+        self.touch()
+        events, self.event_seq = self.hub.events_since(self.event_seq)
+        return events
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class SharedHub:
+    """
+    One hub connection with any number of subscribers
+
+    All subscribers read the same output buffer, so extra viewers cost no
+    BLE traffic. Control operations (connect, run, stop, ...) go through
+    :meth:`control`: the first subscriber to use it becomes the controller
+    and keeps the role until it calls :meth:`release`, unsubscribes or is not
+    seen for ``lease_timeout`` seconds; the operations themselves are
+    serialised by a lock.
+    """
+
+    def __init__(self, address: str, manager: PybricksManager,
+                 lease_timeout: float = 60.0, history: int = 200):
+        self.address = address
+        self.manager = manager
+        self.lease_timeout = lease_timeout
+        self.controller: Optional[Subscription] = None
+        self._subscribers: Dict[int, Subscription] = {}
+        self._ids = itertools.count(1)
+        self._events = collections.deque(maxlen=history)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._control_lock = threading.RLock()
+        manager.supervisor.listeners.append(self._handle_link_event)
+        manager.jobs.listeners.append(self._handle_job)
+
+    def __repr__(self) -> str:
+        return f"<SharedHub {self.address} subscribers={len(self._subscribers)}>"
+
+    # -- Subscribers ---------------------------------------------------------
+
+    def subscribe(self, name: str = "", backlog: int = 2000) -> Subscription:
+        """
+        Add a subscriber
+
+        Args:
+            name: Shown in control events (e.g. a session id)
+            backlog: Most output lines one :meth:`Subscription.read` returns
+        """
+        subscription = Subscription(self, next(self._ids), name, backlog)
+        with self._lock:
+            self._subscribers[subscription.id] = subscription
+        logger.info(f"Hub {self.address}: {subscription.label} subscribed")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscription.closed = True
+            self._subscribers.pop(subscription.id, None)
+        self.release(subscription)
+
+    def subscribers(self, active_within: Optional[float] = None) -> List[Subscription]:
+        """
+        Current subscribers
+
+        Args:
+            active_within: Only those seen in the last this many seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [s for s in self._subscribers.values()
+                    if active_within is None or now - s.last_seen <= active_within]
+
+    # -- Control -------------------------------------------------------------
+
+    def _expired(self, subscription: Subscription) -> bool:
+        return subscription.closed or time.monotonic() - subscription.last_seen > self.lease_timeout
+
+    def claim(self, subscription: Subscription, force: bool = False):
+        """
+        Make ``subscription`` the controller
+
+        Raises:
+            ControlError: if another live subscriber is in control and
+                ``force`` is False
+        """
+        subscription.touch()
+        with self._lock:
+            holder = self.controller
+            if holder is subscription:
+                return
+            if holder is not None and not force and not self._expired(holder):
+                raise ControlError(f"Hub {self.address} is controlled by {holder.label}")
+            self.controller = subscription
+        self._publish("control", f"{subscription.label} took control",
+                      controller=subscription.label,
+                      previous=None if holder is None else holder.label)
+
+    def release(self, subscription: Subscription):
+        """Give up control (no-op if ``subscription`` is not the controller)"""
+        with self._lock:
+            if self.controller is not subscription:
+                return
+            self.controller = None
+        self._publish("control", f"{subscription.label} released control", controller=None)
+
+    @contextlib.contextmanager
+    def control(self, subscription: Subscription, timeout: float = 10.0) -> Iterator[PybricksManager]:
+        """
+        Run a control operation on the hub as ``subscription``
+
+        Example::
+
+            with hub.control(subscription) as manager:
+                job = manager.run_script(code)
+
+        Raises:
+            ControlError: if another subscriber is in control, or another
+                operation did not finish within ``timeout`` seconds
+        """
+        self.claim(subscription)
+        if not self._control_lock.acquire(timeout=timeout):
+            raise ControlError(f"Hub {self.address} is busy")
+        try:
+            yield self.manager
+        finally:
+            self._control_lock.release()
+
+    def connect(self, subscription: Subscription) -> bool:
+        """Connect the hub unless it already is (blocking; joining a connected hub needs no control)"""
+        if self.manager.connected:
+            return True
+        with self.control(subscription, timeout=60.0) as manager:
+            if manager.connected:
+                return True
+            connected = manager.call(manager.connect(self.address))
+        if connected:
+            self._publish("connected", f"{subscription.label} connected the hub")
+        return connected
+
+    def disconnect(self, subscription: Subscription):
+        """Disconnect the hub for every subscriber (blocking)"""
+        with self.control(subscription) as manager:
+            manager.call(manager.disconnect())
+        self._publish("disconnected", f"{subscription.label} disconnected the hub")
+
+    # -- Status events -------------------------------------------------------
+
+    @property
+    def event_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def events_since(self, seq: int = 0) -> Tuple[List[HubEvent], int]:
+        """
+        Events recorded after ``seq``
+
+        Returns:
+            Tuple of (events oldest first, seq to pass next time)
+        """
+        with self._lock:
+            return [e for e in self._events if e.seq > seq], self._seq
+
+    def _publish(self, kind: str, message: str, **data: Any):
+        with self._lock:
+            self._seq += 1
+            self._events.append(HubEvent(self._seq, kind, time.time(), message, data))
+        logger.debug(f"Hub {self.address}: {message}")
+
+    def _handle_link_event(self, event: LinkEvent):
+        self._publish("link", f"Link {event.previous.value} -> {event.state.value}",
+                      state=event.state.value, attempt=event.attempt)
+
+    def _handle_job(self, job: Job):
+        self._publish("job", f"Job {job.id} {job.state.value}",
+                      job=job.id, state=job.state.value,
+                      error=None if job.error is None else str(job.error))
+
+
+class HubRegistry:
+    """
+    Shared hub connections for every session of a process
+
+    A hub only accepts one BLE connection, so sessions that want the same
+    hub (e.g. an operator and observers in several browser tabs) share its
+    :class:`SharedHub` instead of connecting themselves. All managers run on
+    one background event loop and share the scanner, caches, pre-flight
+    worker and metrics, like :class:`HubPool`. In Streamlit, create the
+    registry in a ``st.cache_resource`` function so every session gets the
+    same one.
+    """
+
+    def __init__(self, output_capacity: int = 10000, archive: Optional[OutputArchive] = None,
+                 lease_timeout: float = 60.0):
+        """
+        Args:
+            output_capacity: Output lines kept in memory per hub
+            archive: Where the output of every run is kept on disk (not
+                archived by default)
+            lease_timeout: Seconds after which a silent controller loses
+                control (see :meth:`SharedHub.control`)
+        """
+        self.output_capacity = output_capacity
+        self.lease_timeout = lease_timeout
+        self.device_cache = DeviceCache()
+        self.compile_cache = CompileCache()
+        self.scanner = DeviceScanner(self.device_cache)
+        self.preflight = Preflight()
+        self.metrics = Metrics()
+        self.archive = archive
+        self._hubs: Dict[str, SharedHub] = {}
+        self._lock = threading.Lock()
+        self._loop_thread = EventLoopThread("pybricks-registry-loop")
+        # For sessions that have not picked a hub yet: scanning and checks
+        self.detached = self._new_manager()
+
+    def _new_manager(self) -> PybricksManager:
+        return PybricksManager(
+            self.output_capacity,
+            loop_thread=self._loop_thread,
+            device_cache=self.device_cache,
+            compile_cache=self.compile_cache,
+            scanner=self.scanner,
+            preflight=self.preflight,
+            metrics=self.metrics,
+            archive=self.archive,
+        )
+
+    def hub(self, address: str) -> SharedHub:
+        """Shared hub for ``address``, created (not connected) on first use"""
+        key = address.strip().upper()
+        with self._lock:
+            hub = self._hubs.get(key)
+            if hub is None:
+                hub = self._hubs[key] = SharedHub(key, self._new_manager(), self.lease_timeout)
+            return hub
+
+    def hubs(self) -> List[SharedHub]:
+        with self._lock:
+            return list(self._hubs.values())
+
+    def subscribe(self, address: str, name: str = "", backlog: int = 2000) -> Subscription:
+        """Subscribe to the hub at ``address`` (does not connect it)"""
+        return self.hub(address).subscribe(name, backlog)
+
+    def close(self, timeout: float = 10.0):
+        """Disconnect all hubs and stop the event loop"""
+        if self._loop_thread.closed:
+            return
+        for hub in self.hubs():
+            if hub.manager.connected:
+                try:
+                    self._loop_thread.call(hub.manager.disconnect(), timeout)
+                except Exception as e:
+                    logger.error(f"Error disconnecting {hub.address}: {e}")
+        try:
+            self._loop_thread.call(self.scanner.close(), timeout)
+        except Exception as e:
+            logger.error(f"Error stopping scan: {e}")
+        self.preflight.close()
+        self._loop_thread.stop(timeout)
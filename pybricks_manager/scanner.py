@@ -0,0 +1,250 @@
+"""
+Background BLE scanner with a live table of advertising devices
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, Optional, Set, Tuple, Union
+
+from .devices import DeviceCache
+
+if TYPE_CHECKING:
+    from bleak import BleakScanner
+    from bleak.backends.device import BLEDevice
+
+logger = logging.getLogger(__name__)
+
+# Same as pybricksdev.ble.pybricks.PYBRICKS_SERVICE_UUID (not imported so the
+# device table works without loading bleak)
+PYBRICKS_SERVICE_UUID = "c5f50001-8280-46da-89f4-6d8051e4aeef"
+
+
+@dataclass
+class SeenDevice:
+    """Latest advertisement of one device (``last_seen`` from the scanner clock)"""
+    address: str
+    name: Optional[str]
+    rssi: Optional[int]
+    last_seen: float
+    service_uuids: List[str] = field(default_factory=list)
+    device: Optional["BLEDevice"] = field(default=None, repr=False, compare=False)
+
+    @property
+    def is_pybricks(self) -> bool:
+        """Advertises the Pybricks service (or has a Pybricks name)"""
+        return PYBRICKS_SERVICE_UUID in self.service_uuids or "Pybricks" in (self.name or "")
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name or "Unknown",
+            "address": self.address,
+            "rssi": self.rssi,
+            "last_seen": self.last_seen,
+        }
+
+
+DeviceMatch = Union[str, Callable[[SeenDevice], bool]]
+
+
+class DeviceScanner:
+    """
+    Continuous scan fed by advertisement callbacks
+
+    Every advertisement updates a table of devices, which can be read at any
+    time without starting a new scan; entries expire ``ttl`` seconds after a
+    device was last heard. :meth:`wait_for` returns as soon as a matching
+    advertisement arrives instead of waiting for a full scan.
+
+    The scanner runs while any holder that called :meth:`start` has not
+    called :meth:`stop` yet, or while a :meth:`wait_for` call needs it, so
+    managers sharing a scanner do not end each other's scans. Callbacks
+    arrive on the event loop; the table may be read from any thread.
+    """
+
+    def __init__(self, device_cache: Optional[DeviceCache] = None, ttl: float = 10.0,
+                 max_size: int = 256, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            device_cache: Cache that every seen device is also put into
+            ttl: Seconds after which a silent device leaves the table
+            max_size: Upper bound for the table size
+            clock: Time source (monotonic seconds)
+        """
+        self.device_cache = device_cache
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._table: Dict[str, SeenDevice] = {}
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[Callable[[SeenDevice], bool], asyncio.Future]] = []
+        self._scanner: Optional["BleakScanner"] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        # Whoever asked for a background scan (see start())
+        self._holders: Set[Hashable] = set()
+        self._users = 0
+        self.advertisements = 0
+
+    @staticmethod
+    def _key(address: str) -> str:
+        return address.strip().upper()
+
+    # -- Scanning ------------------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._scanner is not None
+
+    @property
+    def holders(self) -> int:
+        """Number of holders keeping the background scan running"""
+        return len(self._holders)
+
+    async def start(self, holder: Hashable = None):
+        """
+        Keep scanning in the background until ``holder`` calls :meth:`stop`
+
+        Args:
+            holder: Identifies the user of the scan (e.g. a manager or a
+                session); starting twice with the same holder counts once
+        """
+        self._holders.add(holder)
+        await self._ensure_running()
+
+    async def stop(self, holder: Hashable = None):
+        """
+        Release the background scan of ``holder``
+
+        The scan only stops once no other holder and no pending
+        :meth:`wait_for` needs it.
+        """
+        self._holders.discard(holder)
+        await self._stop_if_unused()
+
+    async def close(self):
+        """Stop scanning regardless of holders (when the owner shuts down)"""
+        self._holders.clear()
+        await self._stop_if_unused()
+
+    async def _ensure_running(self):
+        # Created lazily so it binds to the running loop
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._scanner is not None:
+                return
+            from bleak import BleakScanner
+            
+            scanner = BleakScanner(detection_callback=self._handle_advertisement)
+            await scanner.start()
+            self._scanner = scanner
+            logger.info("Background scan started")
+
+    async def _stop_if_unused(self):
+        if self._scanner is None or self._holders or self._users:
+            return
+        scanner, self._scanner = self._scanner, None
+        try:
+            await scanner.stop()
+        except Exception as e:
+            logger.warning(f"Error stopping scanner: {e}")
+        logger.info("Background scan stopped")
+
+    def _handle_advertisement(self, device: "BLEDevice", advertisement_data):
+        now = self._clock()
+        seen = SeenDevice(
+            address=self._key(device.address),
+            name=device.name or advertisement_data.local_name,
+            rssi=advertisement_data.rssi,
+            last_seen=now,
+            service_uuids=list(advertisement_data.service_uuids),
+            device=device,
+        )
+        self.advertisements += 1
+
+        with self._lock:
+            self._table[seen.address] = seen
+            if len(self._table) > self.max_size:
+                self._prune(now)
+        if self.device_cache is not None:
+            self.device_cache.put(device)
+
+        for match, future in self._waiters:
+            if not future.done() and match(seen):
+                future.set_result(seen)
+
+    def _prune(self, now: float):
+        # Caller holds the lock
+        for key in [k for k, d in self._table.items() if now - d.last_seen > self.ttl]:
+            del self._table[key]
+        while len(self._table) > self.max_size:
+            oldest = min(self._table.values(), key=lambda d: d.last_seen)
+            del self._table[oldest.address]
+
+    # -- Table ---------------------------------------------------------------
+
+    def devices(self, pybricks_only: bool = True) -> List[SeenDevice]:
+        """
+        Devices heard within the last ``ttl`` seconds
+
+        Args:
+            pybricks_only: Only devices advertising the Pybricks service
+
+        Returns:
+            List of SeenDevice, strongest signal first
+        """
+        with self._lock:
+            self._prune(self._clock())
+            found = [d for d in self._table.values() if d.is_pybricks or not pybricks_only]
+        return sorted(found, key=lambda d: d.rssi if d.rssi is not None else -999, reverse=True)
+
+    def get(self, address: str) -> Optional[SeenDevice]:
+        """Table entry for an address, or None if unknown or expired"""
+        with self._lock:
+            seen = self._table.get(self._key(address))
+        if seen is None or self._clock() - seen.last_seen > self.ttl:
+            return None
+        return seen
+
+    def clear(self):
+        with self._lock:
+            self._table.clear()
+
+    # -- Waiting -------------------------------------------------------------
+
+    def _matcher(self, target: DeviceMatch) -> Callable[[SeenDevice], bool]:
+        if callable(target):
+            return target
+        wanted = self._key(target)
+        return lambda d: d.address == wanted
+
+    async def wait_for(self, target: DeviceMatch, timeout: float = 10.0) -> Optional[SeenDevice]:
+        """
+        Wait until a matching device advertises
+
+        Args:
+            target: Bluetooth address, or a predicate called with each SeenDevice
+            timeout: Maximum seconds to wait
+
+        Returns:
+            The matching SeenDevice, or None on timeout
+        """
+        match = self._matcher(target)
+        for seen in self.devices(pybricks_only=False):
+            if match(seen):
+                return seen
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (match, future)
+        self._waiters.append(waiter)
+        self._users += 1
+        try:
+            await self._ensure_running()
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.remove(waiter)
+            self._users -= 1
+            await self._stop_if_unused()
@@ -0,0 +1,527 @@
+"""
+Simulated Pybricks hub - the Pybricks GATT service in-process, for tests and benchmarks
+"""
+import asyncio
+import itertools
+import logging
+import random
+import struct
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Pybricks protocol constants (mirrors pybricksdev.ble.pybricks, which is not
+# imported here so a simulation can be set up before the BLE stack is loaded)
+PYBRICKS_SERVICE_UUID = "c5f50001-8280-46da-89f4-6d8051e4aeef"
+PYBRICKS_COMMAND_EVENT_UUID = "c5f50002-8280-46da-89f4-6d8051e4aeef"
+PYBRICKS_HUB_CAPABILITIES_UUID = "c5f50003-8280-46da-89f4-6d8051e4aeef"
+NUS_TX_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+FW_REV_UUID = "00002a26-0000-1000-8000-00805f9b34fb"
+SW_REV_UUID = "00002a28-0000-1000-8000-00805f9b34fb"
+PNP_ID_UUID = "00002a50-0000-1000-8000-00805f9b34fb"
+
+CMD_STOP_USER_PROGRAM = 0
+CMD_START_USER_PROGRAM = 1
+CMD_WRITE_USER_PROGRAM_META = 3
+CMD_WRITE_USER_RAM = 4
+CMD_WRITE_STDIN = 6
+
+EVENT_STATUS_REPORT = 0
+EVENT_WRITE_STDOUT = 1
+
+STATUS_USER_PROGRAM_RUNNING = 1 << 6
+# HubCapabilityFlag.USER_PROG_MULTI_FILE_MPY6
+CAPABILITY_MULTI_FILE_MPY6 = 1 << 1
+LEGO_CID = 0x0397
+# HubKind.TECHNIC_LARGE (SPIKE Prime)
+HUB_KIND_PRIME = 0x81
+
+# Signature of a simulated user program
+Program = Callable[["SimulatedHub"], Awaitable[None]]
+
+
+@dataclass
+class LinkProfile:
+    """
+    Timing of the simulated BLE link
+
+    Packets in both directions share the link one at a time, each taking
+    ``packet_time`` on air, and arrive ``latency`` seconds after their slot.
+    A lost packet is retransmitted by the link layer in the next slot, as on
+    a real BLE connection, so loss shows up as extra time, never as missing
+    data.
+    """
+    # ATT MTU; writes and notifications carry at most mtu - 3 bytes
+    mtu: int = 185
+    # One-way delay in seconds (about one connection interval)
+    latency: float = 0.015
+    # Time one packet occupies the link (several packets per connection event)
+    packet_time: float = 0.0025
+    # Probability that a packet needs to be sent again
+    loss: float = 0.0
+    # Time to establish the connection, before the GATT reads
+    connect_time: float = 0.05
+    # Seconds between advertisements while not connected
+    advertising_interval: float = 0.1
+    # Seed for loss and advertising phase, so runs can be repeated
+    seed: int = 0
+
+    @property
+    def payload_size(self) -> int:
+        return self.mtu - 3
+
+
+class SimulatedError(Exception):
+    """ATT error or link failure reported by the simulated hub (like BleakError)"""
+
+
+class _Link:
+    """Serialises packets on the simulated link"""
+
+    def __init__(self, profile: LinkProfile):
+        self.profile = profile
+        self.random = random.Random(profile.seed)
+        self.free_at = 0.0
+        self.packets = 0
+        self.retransmissions = 0
+
+    def reserve(self) -> float:
+        """Reserve the next slot; returns the loop time at which the packet has been sent"""
+        start = max(asyncio.get_running_loop().time(), self.free_at)
+        attempts = 1
+        while self.profile.loss and self.random.random() < self.profile.loss:
+            attempts += 1
+        self.free_at = start + attempts * self.profile.packet_time
+        self.packets += 1
+        self.retransmissions += attempts - 1
+        return self.free_at
+
+
+class SimulatedHub:
+    """
+    A hub running Pybricks firmware, as seen over its GATT service
+
+    Handles the command characteristic (program meta and RAM writes, start,
+    stop, stdin) and sends status and stdout notifications. Uploaded bytes
+    land in ``ram`` so the result of an upload can be checked. Compiled code
+    cannot run here; instead :attr:`program` is a coroutine function that
+    plays the program's part, printing with :meth:`print` until it returns
+    or is stopped::
+
+        async def blink(hub):
+            for i in range(10):
+                await hub.print(f"tick {i}")
+                await asyncio.sleep(0.1)
+
+        hub.program = blink
+    """
+
+    def __init__(self, name: str = "Pybricks Hub", address: str = "SIM:00:00:00:00:01",
+                 link: Optional[LinkProfile] = None, max_write_size: int = 158,
+                 max_program_size: int = 256 * 1024, firmware: str = "3.3.0",
+                 rssi: int = -50, stdout_buffer: int = 1024):
+        """
+        Args:
+            name: Advertised name
+            address: Bluetooth address reported by the simulated scanner
+            link: Link timing (defaults of :class:`LinkProfile`)
+            max_write_size: Largest command write accepted (hub capabilities)
+            max_program_size: Size of the program RAM
+            firmware: Firmware version string
+            rssi: Advertised signal strength
+            stdout_buffer: Bytes of stdout the firmware buffers before
+                ``print()`` blocks
+        """
+        self.name = name
+        self.address = address
+        self.link_profile = link or LinkProfile()
+        self.max_write_size = max_write_size
+        self.max_program_size = max_program_size
+        self.firmware = firmware
+        self.rssi = rssi
+        self.stdout_buffer = stdout_buffer
+        self.program: Program = idle
+        self.ram = bytearray(max_program_size)
+        self.program_size = 0
+        self.status = 0
+        self.stdin = bytearray()
+        # Commands received, by command byte, and commands rejected
+        self.commands: Dict[int, int] = {}
+        self.errors = 0
+        self.connection: Optional["SimulatedClient"] = None
+        self.link = _Link(self.link_profile)
+        self._notify: Dict[str, Callable[[Any, bytearray], None]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stdout = bytearray()
+        self._stdout_ready: Optional[asyncio.Event] = None
+        self._stdout_space: Optional[asyncio.Event] = None
+        self._sender: Optional[asyncio.Task] = None
+
+    def __repr__(self) -> str:
+        return f"<SimulatedHub {self.name} {self.address}>"
+
+    @property
+    def connected(self) -> bool:
+        return self.connection is not None
+
+    @property
+    def running(self) -> bool:
+        return bool(self.status & STATUS_USER_PROGRAM_RUNNING)
+
+    def device(self):
+        """BLEDevice for this hub, as a scan would report it"""
+        from bleak.backends.device import BLEDevice
+
+        return BLEDevice(self.address, self.name, self, self.rssi)
+
+    def advertisement(self):
+        from bleak.backends.scanner import AdvertisementData
+
+        return AdvertisementData(
+            local_name=self.name, manufacturer_data={}, service_data={},
+            service_uuids=[PYBRICKS_SERVICE_UUID], tx_power=None, rssi=self.rssi,
+            platform_data=(),
+        )
+
+    # -- GATT server ---------------------------------------------------------
+
+    def read(self, uuid: str) -> bytes:
+        if uuid == FW_REV_UUID:
+            return self.firmware.encode()
+        if uuid == SW_REV_UUID:
+            return b"1.3.0"
+        if uuid == PNP_ID_UUID:
+            return struct.pack("<BHHH", 1, LEGO_CID, HUB_KIND_PRIME, 0)
+        if uuid == PYBRICKS_HUB_CAPABILITIES_UUID:
+            return struct.pack("<HII", self.max_write_size, CAPABILITY_MULTI_FILE_MPY6,
+                               self.max_program_size)
+        raise SimulatedError(f"Characteristic {uuid} not found")
+
+    def subscribe(self, uuid: str, callback: Callable[[Any, bytearray], None]):
+        self._notify[uuid] = callback
+        if uuid == PYBRICKS_COMMAND_EVENT_UUID:
+            self._send_status()
+
+    def handle_command(self, data: bytes) -> Optional[str]:
+        """
+        Process one write to the command characteristic
+
+        Returns:
+            None, or the reason the command was rejected (an ATT error)
+        """
+        if len(data) > self.max_write_size:
+            return "invalid length"
+        command = data[0]
+        self.commands[command] = self.commands.get(command, 0) + 1
+        error = None
+        if command == CMD_WRITE_USER_RAM:
+            (offset,) = struct.unpack_from("<I", data, 1)
+            payload = data[5:]
+            if self.running:
+                error = "busy"
+            elif offset + len(payload) > len(self.ram):
+                error = "value not allowed"
+            else:
+                self.ram[offset:offset + len(payload)] = payload
+        elif command == CMD_WRITE_USER_PROGRAM_META:
+            (size,) = struct.unpack_from("<I", data, 1)
+            if self.running:
+                error = "busy"
+            elif size > len(self.ram):
+                error = "value not allowed"
+            else:
+                self.program_size = size
+        elif command == CMD_START_USER_PROGRAM:
+            if self.running:
+                error = "busy"
+            elif not self.program_size:
+                error = "value not allowed"
+            else:
+                self._start()
+        elif command == CMD_STOP_USER_PROGRAM:
+            if self._task is not None:
+                self._task.cancel()
+        elif command == CMD_WRITE_STDIN:
+            self.stdin.extend(data[1:])
+        else:
+            error = "invalid command"
+        if error:
+            self.errors += 1
+            logger.debug(f"{self.name}: command {command} rejected ({error})")
+        return error
+
+    # -- User program --------------------------------------------------------
+
+    def _start(self):
+        self.status |= STATUS_USER_PROGRAM_RUNNING
+        self._send_status()
+        self._task = asyncio.ensure_future(self._run_program())
+
+    async def _run_program(self):
+        try:
+            await self.program(self)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"{self.name}: simulated program raised {e!r}")
+        # Like the firmware, the status does not wait for stdout to drain
+        self.status &= ~STATUS_USER_PROGRAM_RUNNING
+        self._task = None
+        self._send_status()
+
+    async def print(self, *values: Any, sep: str = " ", end: str = "\n"):
+        """Write to stdout like ``print()`` on the hub (blocks while the buffer is full)"""
+        await self.write_stdout((sep.join(str(v) for v in values) + end).replace("\n", "\r\n").encode())
+
+    async def write_stdout(self, data: bytes):
+        if self._sender is None:
+            self._stdout_ready = asyncio.Event()
+            self._stdout_space = asyncio.Event()
+            self._sender = asyncio.ensure_future(self._send_stdout())
+        view = memoryview(data)
+        while view:
+            while len(self._stdout) >= self.stdout_buffer:
+                self._stdout_space.clear()
+                await self._stdout_space.wait()
+            room = self.stdout_buffer - len(self._stdout)
+            self._stdout.extend(view[:room])
+            view = view[room:]
+            self._stdout_ready.set()
+
+    async def _send_stdout(self):
+        # Sends whatever has been printed, as full notifications when it can
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._stdout_ready.wait()
+            if not self._stdout:
+                self._stdout_ready.clear()
+                continue
+            size = self.link_profile.payload_size - 1
+            chunk = bytes(self._stdout[:size])
+            del self._stdout[:size]
+            self._stdout_space.set()
+            sent = self.link.reserve()
+            self._deliver(sent, bytes([EVENT_WRITE_STDOUT]) + chunk)
+            await asyncio.sleep(max(0.0, sent - loop.time()))
+
+    def _send_status(self):
+        self._deliver(self.link.reserve(), struct.pack("<BI", EVENT_STATUS_REPORT, self.status))
+
+    def _deliver(self, sent: float, data: bytes):
+        callback = self._notify.get(PYBRICKS_COMMAND_EVENT_UUID)
+        if callback is None or self.connection is None:
+            return
+        connection = self.connection
+
+        def notify():
+            if self.connection is connection:
+                callback(PYBRICKS_COMMAND_EVENT_UUID, bytearray(data))
+
+        loop = asyncio.get_running_loop()
+        loop.call_at(sent + self.link_profile.latency, notify)
+
+    def reset(self):
+        """Stop the program and the stdout sender (e.g. when the simulation ends)"""
+        for task in (self._task, self._sender):
+            if task is not None:
+                task.cancel()
+        self._task = self._sender = None
+        self._stdout.clear()
+        self.status = 0
+
+
+async def idle(hub: SimulatedHub):
+    """Default program: runs until stopped"""
+    await asyncio.Event().wait()
+
+
+class _Characteristic:
+    def __init__(self, uuid: str, max_write_without_response_size: int):
+        self.uuid = uuid
+        self.max_write_without_response_size = max_write_without_response_size
+
+
+class _Services:
+    def __init__(self, hub: SimulatedHub):
+        self._hub = hub
+
+    def get_characteristic(self, uuid: str) -> Optional[_Characteristic]:
+        if uuid in (PYBRICKS_COMMAND_EVENT_UUID, PYBRICKS_HUB_CAPABILITIES_UUID):
+            return _Characteristic(uuid, self._hub.link_profile.payload_size)
+        return None
+
+
+class SimulatedClient:
+    """Stands in for ``bleak.BleakClient``, connected to a :class:`SimulatedHub`"""
+
+    def __init__(self, device, disconnected_callback: Optional[Callable[["SimulatedClient"], None]] = None,
+                 **kwargs):
+        hub = getattr(device, "details", None)
+        if not isinstance(hub, SimulatedHub):
+            raise SimulatedError(f"{device} is not a simulated hub")
+        self.hub = hub
+        self.address = hub.address
+        self.services = _Services(hub)
+        self._disconnected_callback = disconnected_callback
+        self._connected = False
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @property
+    def mtu_size(self) -> int:
+        return self.hub.link_profile.mtu
+
+    async def _round_trip(self):
+        await asyncio.sleep(2 * self.hub.link_profile.latency)
+
+    async def connect(self, **kwargs) -> bool:
+        if self.hub.connection is not None:
+            raise SimulatedError(f"{self.hub.name} is already connected")
+        await asyncio.sleep(self.hub.link_profile.connect_time)
+        self.hub.connection = self
+        self._connected = True
+        return True
+
+    async def disconnect(self) -> bool:
+        if self._connected:
+            await asyncio.sleep(self.hub.link_profile.latency)
+            self._drop()
+        return True
+
+    def _drop(self):
+        self._connected = False
+        if self.hub.connection is self:
+            self.hub.connection = None
+            self.hub._notify.clear()
+        if self._disconnected_callback is not None:
+            self._disconnected_callback(self)
+
+    def _check(self):
+        if not self._connected:
+            raise SimulatedError("Not connected")
+
+    async def read_gatt_char(self, char: Union[str, _Characteristic], **kwargs) -> bytearray:
+        self._check()
+        await self._round_trip()
+        return bytearray(self.hub.read(getattr(char, "uuid", char)))
+
+    async def start_notify(self, char: Union[str, _Characteristic], callback, **kwargs):
+        self._check()
+        await self._round_trip()
+        self.hub.subscribe(getattr(char, "uuid", char), callback)
+
+    async def stop_notify(self, char: Union[str, _Characteristic]):
+        self.hub._notify.pop(getattr(char, "uuid", char), None)
+
+    async def write_gatt_char(self, char: Union[str, _Characteristic], data: bytes,
+                              response: bool = False):
+        """
+        Write without response returns once the packet is on the link; with
+        response it also waits for the hub to process it and answer.
+        """
+        self._check()
+        uuid = getattr(char, "uuid", char)
+        data = bytes(data)
+        if uuid != PYBRICKS_COMMAND_EVENT_UUID:
+            raise SimulatedError(f"Characteristic {uuid} is not writable")
+        if len(data) > self.hub.link_profile.payload_size:
+            raise SimulatedError(f"Write of {len(data)} bytes exceeds the MTU")
+
+        loop = asyncio.get_running_loop()
+        sent = self.hub.link.reserve()
+        arrival = sent + self.hub.link_profile.latency
+        if not response:
+            loop.call_at(arrival, self.hub.handle_command, data)
+            await asyncio.sleep(max(0.0, sent - loop.time()))
+            return
+        await asyncio.sleep(max(0.0, arrival - loop.time()))
+        error = self.hub.handle_command(data)
+        await asyncio.sleep(self.hub.link_profile.latency)
+        if error:
+            raise SimulatedError(f"ATT error: {error}")
+
+
+class SimulatedScanner:
+    """Stands in for ``bleak.BleakScanner``; advertises the hubs of a :class:`HubSimulator`"""
+
+    def __init__(self, simulator: "HubSimulator", detection_callback=None, **kwargs):
+        self.simulator = simulator
+        self.detection_callback = detection_callback
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self._tasks = [asyncio.ensure_future(self._advertise(hub)) for hub in self.simulator.hubs]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _advertise(self, hub: SimulatedHub):
+        interval = hub.link_profile.advertising_interval
+        # Scanning starts at a random point of the advertising cycle
+        await asyncio.sleep(hub.link.random.uniform(0, interval))
+        while True:
+            # Pybricks hubs stop advertising while connected
+            if not hub.connected and self.detection_callback is not None:
+                self.detection_callback(hub.device(), hub.advertisement())
+            await asyncio.sleep(interval)
+
+
+class HubSimulator:
+    """
+    Simulated hubs standing in for the Bluetooth adapter
+
+    While active (``with simulator:``), ``bleak.BleakScanner`` and the
+    ``BleakClient`` used by pybricksdev are replaced by simulated ones, so
+    :class:`PybricksManager` finds, connects to and talks with the hubs of
+    this simulator through its normal code paths, without a Bluetooth
+    adapter. Only one simulator can be active at a time.
+
+    Example::
+
+        simulator = HubSimulator()
+        hub = simulator.add_hub(link=LinkProfile(latency=0.03, loss=0.05))
+        with simulator:
+            manager = PybricksManager()
+            manager.call(manager.connect(hub.address))
+    """
+
+    _active: Optional["HubSimulator"] = None
+
+    def __init__(self):
+        self.hubs: List[SimulatedHub] = []
+        self._addresses = itertools.count(1)
+        self._saved: List[tuple] = []
+
+    def add_hub(self, name: Optional[str] = None, address: Optional[str] = None, **kwargs) -> SimulatedHub:
+        """Add a hub (see :class:`SimulatedHub` for the arguments)"""
+        n = next(self._addresses)
+        hub = SimulatedHub(name or f"Pybricks Hub {n}", address or f"SIM:00:00:00:00:{n:02X}", **kwargs)
+        self.hubs.append(hub)
+        return hub
+
+    def scanner(self, detection_callback=None, **kwargs) -> SimulatedScanner:
+        return SimulatedScanner(self, detection_callback, **kwargs)
+
+    def __enter__(self) -> "HubSimulator":
+        import bleak
+        import pybricksdev.connections.pybricks as pybricks_connection
+
+        if HubSimulator._active is not None:
+            raise RuntimeError("Another HubSimulator is already active")
+        self._saved = [(bleak, "BleakScanner", bleak.BleakScanner),
+                       (pybricks_connection, "BleakClient", pybricks_connection.BleakClient)]
+        bleak.BleakScanner = self.scanner
+        pybricks_connection.BleakClient = SimulatedClient
+        HubSimulator._active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        for module, name, value in self._saved:
+            setattr(module, name, value)
+        self._saved = []
+        HubSimulator._active = None
@@ -0,0 +1,251 @@
+"""
+Connection supervisor - link health monitoring and automatic reconnect
+"""
+import asyncio
+import collections
+import enum
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .manager import PybricksManager
+
+logger = logging.getLogger(__name__)
+
+
+class LinkState(enum.Enum):
+    DISCONNECTED = "disconnected"
+    CONNECTED = "connected"
+    LOST = "lost"
+    RECONNECTING = "reconnecting"
+    FAILED = "failed"
+
+
+@dataclass
+class LinkEvent:
+    """One connection state transition (``timestamp`` is wall-clock time)"""
+    seq: int
+    state: LinkState
+    previous: LinkState
+    timestamp: float
+    address: Optional[str] = None
+    attempt: int = 0
+    delay: float = 0.0
+    error: Optional[str] = None
+
+
+class ReconnectSupervisor:
+    """
+    Watches the link of a :class:`PybricksManager` and reconnects when it drops
+
+    The supervisor subscribes to the hub's connection state and counts every
+    notification (stdout data and status reports) as a sign of life. When the
+    link drops without :meth:`PybricksManager.disconnect` being called, it
+    reconnects to the same address with jittered exponential backoff; output
+    streaming resumes because ``connect()`` subscribes to stdout again. A
+    periodic health check also catches a dead client whose disconnect
+    callback never fired.
+
+    Every state change is recorded as a :class:`LinkEvent` and passed to the
+    listeners, which run on the manager's event loop.
+    """
+
+    def __init__(self, manager: "PybricksManager", max_attempts: Optional[int] = 10,
+                 base_delay: float = 0.5, max_delay: float = 30.0, jitter: float = 0.5,
+                 check_interval: float = 2.0, history: int = 100):
+        """
+        Args:
+            manager: Manager to supervise
+            max_attempts: Reconnect attempts before giving up (None retries forever)
+            base_delay: Delay before the first attempt in seconds, doubled per attempt
+            max_delay: Upper bound for the delay
+            jitter: Fraction of each delay that is randomised, so several hubs
+                dropping at once do not retry in lockstep
+            check_interval: Seconds between health checks while connected
+            history: Number of events kept in ``events``
+        """
+        self.manager = manager
+        self.enabled = True
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.check_interval = check_interval
+        self.listeners: List[Callable[[LinkEvent], None]] = []
+        self.events = collections.deque(maxlen=history)
+        self.state = LinkState.DISCONNECTED
+        self.address: Optional[str] = None
+        self.last_notification: Optional[float] = None
+        self.heartbeats = 0
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+        self.lost_at: Optional[float] = None
+        self.last_recovery: Optional[float] = None
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._monitor: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._random = random.Random()
+
+    # -- Events --------------------------------------------------------------
+
+    def _set_state(self, state: LinkState, **info):
+        if state == self.state and state != LinkState.RECONNECTING:
+            return
+        with self._lock:
+            self._seq += 1
+            event = LinkEvent(self._seq, state, self.state, time.time(), self.address, **info)
+            self.events.append(event)
+        self.state = state
+        logger.info(f"Link {self.address}: {event.previous.value} -> {state.value}")
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Link listener failed: {e}")
+
+    def events_since(self, seq: int = 0) -> Tuple[List[LinkEvent], int]:
+        """
+        Events recorded after ``seq``
+
+        Returns:
+            Tuple of (events oldest first, seq to pass next time)
+        """
+        with self._lock:
+            return [e for e in self.events if e.seq > seq], self._seq
+
+    def touch(self):
+        """Record a notification from the hub"""
+        self.last_notification = time.monotonic()
+
+    # -- Attach / detach -----------------------------------------------------
+
+    @property
+    def active(self) -> bool:
+        """True while attached to a hub or trying to reconnect"""
+        return bool(self._subscriptions) or self.reconnecting
+
+    @property
+    def reconnecting(self) -> bool:
+        return self._reconnect_task is not None and not self._reconnect_task.done()
+
+    def attach(self, address: str):
+        """Start supervising the manager's freshly connected hub (on the manager loop)"""
+        from pybricksdev.connections import ConnectionState
+
+        self._dispose()
+        self.address = address
+        hub = self.manager.hub
+
+        def handle_connection(state):
+            if state == ConnectionState.DISCONNECTED:
+                # The bleak disconnect callback is not guaranteed to run on the loop
+                self.manager.loop.call_soon_threadsafe(self._handle_lost, "Link dropped")
+
+        def handle_status(flags):
+            self.heartbeats += 1
+            self.touch()
+
+        # Both observables replay their current value on subscribe
+        self._subscriptions = [
+            hub.connection_state_observable.subscribe(handle_connection),
+            hub.status_observable.subscribe(handle_status),
+        ]
+        self.touch()
+        self._set_state(LinkState.CONNECTED, attempt=self._attempt_of_recovery())
+        self._monitor = asyncio.ensure_future(self._check_health(hub))
+
+    def _attempt_of_recovery(self) -> int:
+        if self.state != LinkState.RECONNECTING or not self.events:
+            return 0
+        return self.events[-1].attempt
+
+    def detach(self):
+        """Stop supervising, e.g. before an intentional disconnect"""
+        self._dispose()
+        self.cancel_reconnect()
+        self._set_state(LinkState.DISCONNECTED)
+
+    def cancel_reconnect(self):
+        """Stop a pending reconnect (no-op when called from the reconnect itself)"""
+        task = self._reconnect_task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+            self._reconnect_task = None
+
+    def _dispose(self):
+        for subscription in self._subscriptions:
+            subscription.dispose()
+        self._subscriptions = []
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+
+    # -- Health and recovery -------------------------------------------------
+
+    async def _check_health(self, hub):
+        """Catch a dead client whose disconnect callback never fired"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            client = getattr(hub, "client", None)
+            if client is not None and not client.is_connected:
+                self._handle_lost("Client reports not connected")
+                return
+
+    def health(self) -> Dict[str, object]:
+        """Snapshot of the link health"""
+        now = time.monotonic()
+        return {
+            "state": self.state.value,
+            "address": self.address,
+            "idle_seconds": None if self.last_notification is None else round(now - self.last_notification, 3),
+            "heartbeats": self.heartbeats,
+            "reconnects": self.reconnects,
+            "last_recovery_seconds": self.last_recovery,
+            "last_error": self.last_error,
+        }
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before reconnect attempt ``attempt`` (starting at 1)"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return self._random.uniform(delay * (1 - self.jitter), delay)
+
+    def _handle_lost(self, reason: str):
+        if not self._subscriptions or self.state != LinkState.CONNECTED:
+            return  # Detached in the meantime or already handled
+        logger.warning(f"Connection to {self.address} lost: {reason}")
+        self._dispose()
+        self.lost_at = time.monotonic()
+        self.last_error = reason
+        self.manager._link_lost()
+        self._set_state(LinkState.LOST, error=reason)
+
+        if self.enabled and self.address:
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        attempt = 0
+        while self.max_attempts is None or attempt < self.max_attempts:
+            attempt += 1
+            delay = self.backoff(attempt)
+            self._set_state(LinkState.RECONNECTING, attempt=attempt, delay=delay,
+                            error=self.last_error)
+            await asyncio.sleep(delay)
+            try:
+                # connect() calls attach(), which reports CONNECTED
+                await self.manager.connect(self.address)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Reconnect attempt {attempt} failed: {e}")
+                continue
+            self.reconnects += 1
+            self.manager.metrics.inc("reconnects")
+            self.last_recovery = round(time.monotonic() - self.lost_at, 3)
+            logger.info(f"Reconnected to {self.address} after {self.last_recovery}s")
+            return
+        self._set_state(LinkState.FAILED, attempt=attempt, error=self.last_error)
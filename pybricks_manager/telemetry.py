@@ -0,0 +1,257 @@
+"""
+Binary telemetry frames from hub stdout and a NumPy time-series store
+
+Hub programs send samples as compact frames instead of formatted text::
+
+    0x1E | channel (uint8) | count (uint8) | type (ord("i") int32 / ord("f") float32) | values (little endian)
+
+0x1E (ASCII record separator) never appears in printed text, so frames can
+be mixed freely with ``print()`` output. Hubs without ``usys.stdout.buffer``
+fall back to text lines of the form ``TLM <channel> <v1> <v2> ...``, which
+are parsed from the output lines and removed from it. See ``examples/telemetry_stream.py`` for
+the hub side.
+
+Frames carry no hub time. Samples are stamped with the host time they are
+decoded at, so the frames of one BLE notification share a timestamp and
+the spacing on the host reflects the link, not the hub loop. Programs that
+need exact timing send the hub clock (e.g. ``StopWatch.time()``) as a value.
+"""
+import logging
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRAME_START = 0x1E
+FRAME_HEADER = 4
+TEXT_PREFIX = "TLM "
+
+_VALUE_TYPES = {ord("i"): "<i4", ord("f"): "<f4"}
+
+
+class ChannelBuffer:
+    """Preallocated ring buffer of (timestamp, values) samples for one channel"""
+
+    def __init__(self, capacity: int, width: int):
+        import numpy as np
+
+        self.capacity = capacity
+        self.width = width
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((capacity, width), dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        self.total = 0
+
+    def append(self, t: float, values):
+        i = self.head
+        self.times[i] = t
+        self.values[i, :len(values)] = values
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def ordered(self):
+        """Copies of (times, values), oldest first"""
+        import numpy as np
+
+        if self.count < self.capacity:
+            return self.times[:self.count].copy(), self.values[:self.count].copy()
+        order = np.r_[self.head:self.capacity, 0:self.head]
+        return self.times[order], self.values[order]
+
+
+class TelemetryStore:
+    """
+    Per-channel time series of telemetry samples
+
+    Each channel gets a fixed-size NumPy ring buffer on its first sample, so
+    memory is bounded and appending does not allocate Python objects per
+    value. Appends come from the manager's event loop; queries may come from
+    any thread. Timestamps are host receive times (see the module docstring).
+    """
+
+    def __init__(self, capacity: int = 10000, max_width: int = 16,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.max_width = max_width
+        self._clock = clock
+        self._channels: Dict[int, ChannelBuffer] = {}
+        self.names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def append(self, channel: int, values, t: Optional[float] = None):
+        """Add one sample (values beyond ``max_width`` are dropped)"""
+        values = values[:self.max_width]
+        with self._lock:
+            buf = self._channels.get(channel)
+            if buf is None or buf.width < len(values):
+                buf = self._grow(channel, buf, len(values))
+            buf.append(self._clock() if t is None else t, values)
+
+    def _grow(self, channel: int, old: Optional[ChannelBuffer], width: int) -> ChannelBuffer:
+        buf = ChannelBuffer(self.capacity, max(width, old.width if old else 0))
+        if old is not None:
+            times, values = old.ordered()
+            for t, row in zip(times, values):
+                buf.append(t, row)
+        self._channels[channel] = buf
+        return buf
+
+    def name_channel(self, channel: int, name: str):
+        """Give a channel a display name"""
+        self.names[channel] = name
+
+    @property
+    def channels(self) -> List[int]:
+        with self._lock:
+            return sorted(self._channels)
+
+    def clear(self):
+        with self._lock:
+            self._channels.clear()
+
+    def window(self, channel: int, seconds: Optional[float] = None,
+               max_points: int = 500) -> Tuple["object", "object"]:
+        """
+        Samples of a channel for plotting
+
+        Args:
+            channel: Channel id
+            seconds: Only samples from the last ``seconds`` (None for all)
+            max_points: Downsample by averaging buckets of consecutive samples
+                so at most this many points are returned
+
+        Returns:
+            Tuple of (times, values) NumPy arrays; values has one column per
+            value in the frame
+        """
+        import numpy as np
+
+        with self._lock:
+            buf = self._channels.get(channel)
+            if buf is None:
+                return np.zeros(0), np.zeros((0, 0))
+            times, values = buf.ordered()
+
+        if seconds is not None and len(times):
+            start = np.searchsorted(times, times[-1] - seconds)
+            times, values = times[start:], values[start:]
+
+        bucket = -(-len(times) // max_points) if max_points > 0 else 1
+        if bucket > 1:
+            usable = len(times) - len(times) % bucket
+            times = times[len(times) - usable:].reshape(-1, bucket).mean(axis=1)
+            values = values[len(values) - usable:].reshape(-1, bucket, values.shape[1]).mean(axis=1)
+        return times, values
+
+    def stats(self) -> Dict[int, int]:
+        """Total samples received per channel"""
+        with self._lock:
+            return {ch: buf.total for ch, buf in self._channels.items()}
+
+
+class TelemetryDecoder:
+    """
+    Splits raw hub stdout into text and telemetry frames
+
+    Frames may be split across BLE packets; incomplete frames are held back
+    until the rest arrives.
+    """
+
+    def __init__(self, store_factory: Callable[[], TelemetryStore]):
+        self._store_factory = store_factory
+        self.store: Optional[TelemetryStore] = None
+        self._pending = bytearray()
+        self.frames = 0
+        self.errors = 0
+
+    def _store(self) -> TelemetryStore:
+        # Created on the first sample so NumPy is only imported when used
+        if self.store is None:
+            self.store = self._store_factory()
+        return self.store
+
+    def feed(self, data: bytes) -> bytes:
+        """
+        Consume stdout bytes
+
+        Returns:
+            The text bytes with all complete frames removed
+        """
+        if not self._pending and FRAME_START not in data:
+            return data
+
+        buf = self._pending
+        buf.extend(data)
+        text = bytearray()
+
+        while buf:
+            start = buf.find(FRAME_START)
+            if start < 0:
+                text.extend(buf)
+                buf.clear()
+                break
+            text.extend(buf[:start])
+            del buf[:start]
+
+            if len(buf) < FRAME_HEADER:
+                break
+            count = buf[2]
+            dtype = _VALUE_TYPES.get(buf[3])
+            if dtype is None:
+                # Not a frame after all, pass the marker through as text
+                self.errors += 1
+                text.append(buf[0])
+                del buf[:1]
+                continue
+            size = FRAME_HEADER + 4 * count
+            if len(buf) < size:
+                break
+
+            self._decode(buf[1], dtype, bytes(buf[FRAME_HEADER:size]))
+            del buf[:size]
+
+        return bytes(text)
+
+    def _decode(self, channel: int, dtype: str, payload: bytes):
+        import numpy as np
+
+        self._store().append(channel, np.frombuffer(payload, dtype=dtype))
+        self.frames += 1
+
+    def feed_line(self, line: str) -> bool:
+        """
+        Parse a text fallback line
+
+        Returns:
+            True if the line was a telemetry sample
+        """
+        if not line.startswith(TEXT_PREFIX):
+            return False
+        try:
+            parts = line.split()
+            channel = int(parts[1])
+            values = [float(v) for v in parts[2:]]
+        except (IndexError, ValueError):
+            self.errors += 1
+            return False
+        self._store().append(channel, values)
+        self.frames += 1
+        return True
+
+    def reset(self):
+        """Drop a partial frame and the samples of the previous run (when a new program starts)"""
+        self._pending.clear()
+        if self.store is not None:
+            self.store.clear()
+
+
+def pack_frame(channel: int, values, float_values: bool = False) -> bytes:
+    """Build a frame on the host (for tests, simulators and benchmarks)"""
+    code = "f" if float_values else "i"
+    # Same layout as the hub side, which packs the type as "B" (ustruct has no "c")
+    return struct.pack(f"<BBBB{len(values)}{code}", FRAME_START, channel, len(values),
+                       ord(code), *values)
@@ -0,0 +1,156 @@
+"""
+Pipelined program upload over the Pybricks command characteristic
+"""
+import logging
+import struct
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# write(data, response) - one GATT write to the command characteristic
+WriteFunc = Callable[[bytes, bool], Awaitable[None]]
+
+# Command byte + uint32 offset in front of every COMMAND_WRITE_USER_RAM packet
+HEADER_SIZE = 5
+
+# Safe payload for the minimum ATT MTU of 23 bytes
+MIN_WRITE_SIZE = 20
+
+# pybricksdev.ble.pybricks.Command values, kept here so importing this module
+# does not load the BLE stack
+WRITE_USER_PROGRAM_META = 3
+COMMAND_WRITE_USER_RAM = 4
+
+
+@dataclass
+class UploadStats:
+    """Result of one upload (``elapsed`` in seconds)"""
+    size: int
+    bytes_sent: int = 0
+    packets: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    window: int = 0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class ProgramUploader:
+    """
+    Writes program images to hub RAM with a credit window
+
+    Packets are sized to the largest write the link allows. Within a window
+    they are sent as write-without-response; the last packet of each window
+    is a write-with-response, which acts as the acknowledgement for the whole
+    window because ATT processes writes in order. A window that completes
+    grows the next one by one packet; a failed write halves it and the window
+    is resent (``COMMAND_WRITE_USER_RAM`` carries absolute offsets, so
+    resending is harmless).
+    """
+
+    def __init__(self, write: WriteFunc, max_write_size: int,
+                 initial_window: int = 4, max_window: int = 32, max_retries: int = 5):
+        """
+        Args:
+            write: Coroutine function performing one GATT write
+            max_write_size: Largest characteristic write in bytes (from the
+                hub capabilities and the negotiated MTU)
+            initial_window: Packets per window to start with
+            max_window: Upper bound for the window
+            max_retries: Failed windows tolerated per upload before giving up
+        """
+        self._write = write
+        self.payload_size = max(MIN_WRITE_SIZE, max_write_size) - HEADER_SIZE
+        self.window = initial_window
+        self.max_window = max_window
+        self.max_retries = max_retries
+
+    async def write_meta(self, size: int):
+        """Write the program size header (0 marks the program invalid while writing)"""
+        await self._write(struct.pack("<BI", WRITE_USER_PROGRAM_META, size), True)
+
+    async def upload(self, program: bytes,
+                     ranges: Optional[Iterable[Tuple[int, int]]] = None) -> UploadStats:
+        """
+        Upload a program image
+
+        Args:
+            program: Complete program image
+            ranges: (start, end) byte ranges to send. Defaults to the whole
+                image; other bytes must already be in hub RAM.
+
+        Returns:
+            UploadStats with throughput figures
+        """
+        stats = UploadStats(size=len(program))
+        start_time = time.monotonic()
+
+        await self.write_meta(0)
+        for start, end in ranges if ranges is not None else [(0, len(program))]:
+            await self._send_range(program, start, end, stats)
+        await self.write_meta(len(program))
+
+        stats.elapsed = time.monotonic() - start_time
+        stats.window = self.window
+        logger.info(
+            f"Uploaded {stats.bytes_sent} of {stats.size} bytes in {stats.elapsed:.3f}s "
+            f"({stats.bytes_per_second:.0f} B/s, {stats.packets} packets, {stats.retries} retries)"
+        )
+        return stats
+
+    async def _send_range(self, program: bytes, start: int, end: int, stats: UploadStats):
+        view = memoryview(program)
+        confirmed = start
+
+        while confirmed < end:
+            offset = confirmed
+            sent = 0
+            try:
+                while offset < end and sent < self.window:
+                    size = min(self.payload_size, end - offset)
+                    packet = struct.pack("<BI", COMMAND_WRITE_USER_RAM, offset) + view[offset:offset + size]
+                    offset += size
+                    sent += 1
+                    await self._write(packet, sent == self.window or offset >= end)
+                    stats.packets += 1
+            except Exception as e:
+                stats.retries += 1
+                if stats.retries > self.max_retries:
+                    raise
+                self.window = max(1, self.window // 2)
+                logger.warning(f"Write failed at offset {offset} ({e}), resending with window {self.window}")
+                continue
+
+            stats.bytes_sent += offset - confirmed
+            confirmed = offset
+            self.window = min(self.max_window, self.window + 1)
+
+
+def diff_ranges(old: bytes, new: bytes, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Byte ranges of ``new`` that differ from ``old``, at chunk granularity
+
+    Ranges are aligned to ``chunk_size`` so each one maps onto whole upload
+    packets, and adjacent changed chunks are merged. Everything past the end
+    of ``old`` counts as changed.
+
+    Returns:
+        List of (start, end) ranges, empty if the images are identical
+    """
+    ranges: List[Tuple[int, int]] = []
+    common = min(len(old), len(new))
+
+    for start in range(0, len(new), chunk_size):
+        end = min(start + chunk_size, len(new))
+        if end <= common and old[start:end] == new[start:end]:
+            continue
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    return ranges
@@ -0,0 +1,31 @@
+import os
+
+from pybricks_manager.archive import OutputArchive
+
+
+def test_oldest_runs_are_pruned(tmp_path):
+    archive = OutputArchive(str(tmp_path), max_runs=3, max_bytes=None)
+    ids = []
+    for i in range(5):
+        run = archive.open_run("hub")
+        run.write([f"run {i}"])
+        run.close()
+        ids.append(run.run_id)
+
+    assert sorted(archive.runs()) == sorted(ids[-3:])
+    assert archive.reader(ids[-1]).tail(1)[0].text == "run 4"
+
+
+def test_size_limit_keeps_the_run_being_written(tmp_path):
+    archive = OutputArchive(str(tmp_path), max_runs=None, max_bytes=1)
+    first = archive.open_run()
+    first.write(["x" * 100])
+    first.close()
+    current = archive.open_run()
+    current.write(["y" * 100])
+
+    # The closed run goes; the open one stays even though it is over the limit
+    assert archive.runs() == [current.run_id]
+    archive.prune()
+    assert os.path.isdir(os.path.join(str(tmp_path), current.run_id))
+    current.close()
@@ -0,0 +1,50 @@
+import pytest
+
+from pybricks_manager.archive import OutputArchive
+from pybricks_manager.cli import DEFAULT_SOCKET, SCAN_TIMEOUT, build_parser, main
+
+
+def parse(*argv):
+    return build_parser().parse_args(list(argv))
+
+
+def test_hub_commands_take_the_connection_options():
+    for command in (["run", "x.py"], ["stop"], ["watch"]):
+        args = parse(*command, "-t", "3", "--socket", "/tmp/s", "-a", "AA", "-d")
+        assert (args.timeout, args.socket, args.address, args.daemon) == (3.0, "/tmp/s", "AA", True)
+
+    args = parse("stop")
+    assert (args.timeout, args.socket, args.address, args.daemon) == (SCAN_TIMEOUT, DEFAULT_SOCKET, None, False)
+
+
+def test_each_command_only_takes_its_own_options():
+    assert parse("scan").timeout == 5.0
+    assert parse("daemon", "--socket", "/tmp/s").socket == "/tmp/s"
+    assert parse("daemon").timeout == SCAN_TIMEOUT
+    assert parse("metrics", "--socket", "/tmp/s", "--json").socket == "/tmp/s"
+
+    for command in (["scan", "--socket", "/tmp/s"], ["scan", "-a", "AA"],
+                    ["logs", "-t", "3"], ["logs", "--socket", "/tmp/s"],
+                    ["metrics", "-t", "3"], ["bench", "-t", "3"], ["bench", "--socket", "/tmp/s"]):
+        with pytest.raises(SystemExit):
+            parse(*command)
+
+
+def test_bench_options():
+    args = parse("bench", "--compare", "base.json", "--threshold", "0.2", "-r", "3", "--latency", "7.5")
+    assert (args.compare, args.threshold, args.repeat, args.latency) == ("base.json", 0.2, 3, 7.5)
+    assert args.json is False and args.output is None
+
+
+def test_logs_prints_the_latest_run(tmp_path, capsys):
+    archive = OutputArchive(str(tmp_path))
+    for text in ("old", "new"):
+        run = archive.open_run("hub")
+        run.write([f"{text} 1", f"{text} 2", f"{text} 3"])
+        run.close()
+
+    assert main(["logs", "--archive", str(tmp_path), "-n", "2", "--numbers"]) == 0
+    assert capsys.readouterr().out == "1\tnew 2\n2\tnew 3\n"
+
+    assert main(["logs", "--archive", str(tmp_path), "-g", "NEW 2", "-i"]) == 0
+    assert capsys.readouterr().out == "new 2\n"
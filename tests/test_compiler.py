@@ -0,0 +1,75 @@
+import os
+
+from pybricks_manager.compiler import CompileCache, pack_program
+
+
+def test_key_covers_source_abi_compiler_and_options():
+    key = CompileCache.key("print(1)", 6, "1.20.0")
+    assert key == CompileCache.key("print(1)", 6, "1.20.0")
+    others = {
+        CompileCache.key("print(2)", 6, "1.20.0"),
+        CompileCache.key("print(1)", 5, "1.20.0"),
+        CompileCache.key("print(1)", 6, "1.21.0"),
+        CompileCache.key("print(1)", 6, "1.20.0", "lib.py"),
+    }
+    assert key not in others and len(others) == 4
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = CompileCache(str(tmp_path))
+    key = CompileCache.key("print(1)", 6, "1.20.0")
+    assert cache.get(key) is None
+    cache.put(key, b"mpy")
+
+    assert cache.get(key) == b"mpy"
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    # Only the entry is left, no temp files
+    assert os.listdir(str(tmp_path)) == [key + CompileCache.SUFFIX]
+
+
+def test_oldest_entries_are_evicted_over_the_size_cap(tmp_path):
+    cache = CompileCache(str(tmp_path), max_bytes=250)
+    keys = [CompileCache.key(f"x = {i}", 6, "1.20.0") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, bytes(100))
+        # Distinct modification times, oldest first
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    cache.put(CompileCache.key("x = 3", 6, "1.20.0"), bytes(100))
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_a_hit_counts_as_recent_use(tmp_path):
+    cache = CompileCache(str(tmp_path), max_bytes=250)
+    old, new = (CompileCache.key(f"x = {i}", 6, "1.20.0") for i in range(2))
+    cache.put(old, bytes(100))
+    cache.put(new, bytes(100))
+    os.utime(cache._path(old), (1000, 1000))
+    os.utime(cache._path(new), (2000, 2000))
+    assert cache.get(old) is not None  # touches the entry
+    cache.put(CompileCache.key("x = 2", 6, "1.20.0"), bytes(100))
+
+    assert cache.get(old) is not None
+    assert cache.get(new) is None
+
+
+def test_pack_program_layout():
+    image = pack_program([("__main__", b"\x01\x02"), ("lib", b"\x03")])
+    assert image == b"\x02\x00\x00\x00__main__\x00\x01\x02" + b"\x01\x00\x00\x00lib\x00\x03"
+
+
+def test_manager_compiles_a_script_once(tmp_path):
+    from pybricks_manager.manager import PybricksManager
+
+    manager = PybricksManager(compile_cache=CompileCache(str(tmp_path)))
+    try:
+        first = manager.call(manager.validate_script("print('hi')"), timeout=60)
+        second = manager.call(manager.validate_script("print('hi')"), timeout=60)
+        other = manager.call(manager.validate_script("print('ho')"), timeout=60)
+    finally:
+        manager.close()
+
+    assert first.mpy == second.mpy != other.mpy
+    assert manager.compile_cache.stats() == {"hits": 1, "misses": 2}
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+from pybricks_manager.compiler import CompileCache
+from pybricks_manager.devices import DeviceCache
+from pybricks_manager.manager import PybricksManager
+from pybricks_manager.simhub import HubSimulator, LinkProfile
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def device(address):
+    return SimpleNamespace(address=address, name="Pybricks Hub")
+
+
+def test_entries_expire_after_the_ttl():
+    clock = Clock()
+    cache = DeviceCache(ttl=60, clock=clock)
+    hub = device("aa:bb:cc:dd:ee:01")
+    cache.put(hub)
+
+    clock.now = 59
+    assert cache.get("AA:BB:CC:DD:EE:01") is hub
+    assert "aa:bb:cc:dd:ee:01" in cache
+    clock.now = 61
+    assert "AA:BB:CC:DD:EE:01" not in cache
+    assert cache.get("AA:BB:CC:DD:EE:01") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 0}
+
+
+def test_least_recently_used_is_evicted():
+    cache = DeviceCache(max_size=2)
+    first, second, third = (device(f"AA:00:00:00:00:0{i}") for i in range(3))
+    cache.put(first)
+    cache.put(second)
+    # Using the first entry makes the second one the oldest
+    cache.get(first.address)
+    cache.put(third)
+
+    assert first.address in cache
+    assert second.address not in cache
+    assert third.address in cache
+    assert len(cache) == 2
+
+
+def test_connect_skips_the_scan_for_a_cached_hub(tmp_path):
+    simulator = HubSimulator()
+    hub = simulator.add_hub(link=LinkProfile(latency=0.005))
+    with simulator:
+        manager = PybricksManager(compile_cache=CompileCache(str(tmp_path)), auto_reconnect=False)
+        try:
+            manager.device_cache.put(hub.device())
+            manager.call(manager.connect(hub.address), timeout=10)
+            assert manager.connected
+            assert manager.device_cache.stats()["hits"] == 1
+            # No advertisement was needed
+            assert manager.scanner.advertisements == 0
+            manager.call(manager.disconnect(), timeout=10)
+        finally:
+            manager.close()
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from pybricks_manager.compiler import CompileCache
+from pybricks_manager.jobs import JobCancelled, JobState, RunPolicy
+from pybricks_manager.manager import PybricksManager
+from pybricks_manager.minify import MinifyOptions
+from pybricks_manager.simhub import HubSimulator, LinkProfile
+
+SCRIPT = "x = 1\nassert x == 1, 'x must be one'\nprint(x)\n"
+FULL = MinifyOptions(strip_asserts=True, strip_debug=True)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = PybricksManager(compile_cache=CompileCache(str(tmp_path)), minify=MinifyOptions())
+    try:
+        yield manager
+    finally:
+        manager.close()
+
+
+@pytest.fixture
+def hub(manager):
+    simulator = HubSimulator()
+    hub = simulator.add_hub(link=LinkProfile(latency=0.005, advertising_interval=0.02))
+    with simulator:
+        manager.call(manager.connect(hub.address), 10)
+        yield hub
+        manager.call(manager.disconnect(), 10)
+
+
+def runs_for(seconds):
+    async def program(hub):
+        await asyncio.sleep(seconds)
+    return program
+
+
+def test_run_options_do_not_change_the_manager(manager):
+    default = manager.minify
+    job = manager.run_script(SCRIPT, minify=FULL)
+    other = manager.run_script(SCRIPT)
+
+    assert job.minify is FULL
+    assert other.minify is default
+    assert manager.minify is default
+    with pytest.raises(RuntimeError):
+        other.wait(5)
+
+
+def test_validate_uses_the_options_of_the_call(manager):
+    full = manager.call(manager.validate_script(SCRIPT, minify=FULL), timeout=60)
+    plain = manager.call(manager.validate_script(SCRIPT, minify=None), timeout=60)
+
+    assert full.ok and plain.ok
+    assert full.reduction.removed["asserts"] == 1
+    assert plain.reduction is None
+    assert len(full.mpy) < len(plain.mpy)
+
+
+def test_queued_jobs_run_in_order_and_prefetch_is_not_timed(manager, hub):
+    hub.program = runs_for(0.3)
+
+    async def submit():
+        # From the manager loop, so all three are queued before the first starts
+        return (manager.run_script("print(1)"), manager.run_script("print(2)"),
+                manager.run_script("print(3)", priority=1))
+
+    first, second, urgent = manager.call(submit(), 5)
+
+    for job in (first, second, urgent):
+        job.wait(10)
+    # Higher priority first, then in submission order
+    assert urgent.started_at < first.started_at < second.started_at
+    assert [job.state for job in (first, second, urgent)] == [JobState.DONE] * 3
+
+    # Every run times its compile once; the compiles done in the background
+    # while the previous program ran are cache fills, not in the histogram
+    assert manager.metrics.snapshot()["phases"]["compile"]["count"] == 3
+    assert manager.compile_cache.stats() == {"hits": 2, "misses": 3}
+
+
+def test_replace_cancels_the_running_and_queued_jobs(manager, hub):
+    hub.program = runs_for(30)
+    running = manager.run_script("print(1)")
+    queued = manager.run_script("print(2)")
+    manager.call(running.started(), 10)
+
+    hub.program = runs_for(0)
+    replacement = manager.run_script("print(3)", policy=RunPolicy.REPLACE)
+
+    replacement.wait(10)
+    for job in (running, queued):
+        with pytest.raises(JobCancelled):
+            job.wait(10)
+    assert replacement.state == JobState.DONE
+
+
+def test_preempt_needs_a_higher_priority(manager, hub):
+    hub.program = runs_for(30)
+    running = manager.run_script("print(1)", priority=1)
+    manager.call(running.started(), 10)
+
+    hub.program = runs_for(0)
+    same = manager.run_script("print(2)", priority=1, policy=RunPolicy.PREEMPT)
+    higher = manager.run_script("print(3)", priority=2, policy=RunPolicy.PREEMPT)
+
+    higher.wait(10)
+    with pytest.raises(JobCancelled):
+        running.wait(10)
+    # The equal-priority job only queued and runs after the preempting one
+    same.wait(10)
+    assert same.state == JobState.DONE
+    assert higher.started_at < same.started_at
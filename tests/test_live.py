@@ -0,0 +1,137 @@
+import asyncio
+import ast
+
+import pytest
+
+from pybricks_manager.jobs import RunPolicy
+from pybricks_manager.live import MARKER, LiveError, _statements
+from pybricks_manager.manager import PybricksManager
+from pybricks_manager.preflight import PreflightError
+from pybricks_manager.simhub import HubSimulator, LinkProfile
+
+SCRIPT = """\
+gain = 2
+
+def scale(x):
+    return gain * x
+
+a = 1; b = 2
+value = scale(a + b)
+"""
+
+
+class Agent:
+    """Plays the live agent on a simulated hub, running requests in CPython"""
+
+    def __init__(self):
+        self.requests = []
+        # Cleared to let the hub run an ordinary (instant) program instead
+        self.enabled = True
+
+    async def __call__(self, hub):
+        if not self.enabled:
+            return
+        ns = {"__name__": "__live__"}
+        await hub.print(MARKER + "0 ok 0 'ready'")
+        while True:
+            if b"\n" not in hub.stdin:
+                await asyncio.sleep(0.005)
+                continue
+            line, _, rest = bytes(hub.stdin).partition(b"\n")
+            hub.stdin[:] = rest
+            rid, kind, offset, arg = line.decode().split(" ", 3)
+            src = "\n" * int(offset) + ast.literal_eval(arg)
+            self.requests.append((kind, int(offset), src))
+            try:
+                value = None
+                if kind == "e":
+                    value = repr(eval(src, ns))
+                elif kind == "x":
+                    exec(compile(src, "main.py", "exec"), ns)
+                elif kind == "r":
+                    ns = {"__name__": "__live__"}
+                await hub.print(MARKER + rid, "ok", 1, repr(value))
+            except Exception as e:
+                tb = e.__traceback__
+                while tb.tb_next is not None:
+                    tb = tb.tb_next
+                await hub.print(MARKER + rid, "err", 1, repr(f"line {tb.tb_lineno}: {e}"))
+
+
+@pytest.fixture
+def agent():
+    return Agent()
+
+
+@pytest.fixture
+def manager(agent):
+    simulator = HubSimulator()
+    hub = simulator.add_hub(link=LinkProfile(latency=0.005, advertising_interval=0.02))
+    hub.program = agent
+    with simulator:
+        manager = PybricksManager()
+        try:
+            manager.call(manager.connect(hub.address), 10)
+            yield manager
+            manager.call(manager.disconnect(), 10)
+        finally:
+            manager.close()
+
+
+def test_statements():
+    source = "@dec\ndef f():\n    pass\n\na = 1; b = 2\nprint(a)\n"
+    assert _statements(source) == [(1, "@dec\ndef f():\n    pass"), (5, "a = 1; b = 2"), (6, "print(a)")]
+
+
+def test_sync_sends_only_changed_statements(manager, agent):
+    live = manager.live
+    first = manager.call(live.sync(SCRIPT), 30)
+    assert first.ok and first.statements == 4
+    assert live.active
+
+    # Nothing changed: nothing is sent
+    again = manager.call(live.sync(SCRIPT), 10)
+    assert again.sent == 0 and len(agent.requests) == 1
+
+    edited = SCRIPT.replace("gain = 2", "gain = 3")
+    result = manager.call(live.sync(edited), 10)
+    assert result.statements == 1
+    kind, offset, src = agent.requests[-1]
+    # Sent minified, at its own line
+    assert (kind, offset) == ("x", 0) and src.replace(" ", "") == "gain=3"
+    assert manager.call(live.execute("scale(2)"), 10).value == "6"
+
+
+def test_changed_statements_keep_their_line_numbers(manager, agent):
+    live = manager.live
+    manager.call(live.sync(SCRIPT), 30)
+
+    edited = SCRIPT.replace("return gain * x", "return gain * missing")
+    manager.call(live.sync(edited), 10)
+    _, offset, src = agent.requests[-1]
+    assert offset == 2 and src.split("\n")[2] == "def scale(x):"
+
+    result = manager.call(live.execute("scale(1)"), 10)
+    assert not result.ok and "line 4" in result.error
+
+
+def test_errors_are_found_before_sending(manager, agent):
+    with pytest.raises(PreflightError):
+        manager.call(manager.live.sync("from pybricks.tools import wiat\n"), 30)
+    assert agent.requests == []
+
+
+def test_another_run_ends_the_session(manager, agent):
+    live = manager.live
+    manager.call(live.sync(SCRIPT), 30)
+
+    agent.enabled = False
+    manager.run_script("print('hi')", policy=RunPolicy.REPLACE).wait(10)
+    assert not live.active
+    with pytest.raises(LiveError):
+        manager.call(live._request("e", "1", 0, 5), 10)
+
+    agent.enabled = True
+    # The next sync starts a new agent and sends the whole script again
+    result = manager.call(live.sync(SCRIPT), 30)
+    assert result.ok and result.statements == 4
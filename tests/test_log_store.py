@@ -0,0 +1,17 @@
+import json
+
+from pybricks_manager.log_store import LogStore
+
+
+def test_jsonl_keeps_structured_details_as_objects():
+    store = LogStore()
+    store.add("INFO", "connected", {"a": 1, "hub": ["x", None]})
+    store.add("WARN", "plain", "some text")
+    store.add("ERROR", "bare")
+
+    lines = [json.loads(line) for line in store.iter_jsonl()]
+
+    assert lines[0]["details"] == {"a": 1, "hub": ["x", None]}
+    assert lines[1]["details"] == "some text"
+    assert lines[2]["details"] is None
+    assert [l["level"] for l in lines] == ["INFO", "WARN", "ERROR"]
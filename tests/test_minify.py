@@ -0,0 +1,35 @@
+import ast
+
+from pybricks_manager.minify import MinifyOptions, minify
+
+SOURCE = '''\
+"""Module docstring"""
+GREETING = "hello world"
+
+
+def greet(x):
+    """Say hello"""
+    if 'hello world' in x:  # interned next to a keyword
+        print('hello world')
+    return ['hello world' for _ in x]
+
+
+print(greet('hello world'), 'hello world' 'hello world')
+'''
+
+
+def test_interned_output_parses():
+    result = minify(SOURCE, MinifyOptions(intern_strings=True))
+
+    ast.parse(result.source)
+    assert result.removed["interned"] > 0
+    assert "_S0 in x" in result.source
+    assert result.size < result.original_size
+
+
+def test_lines_do_not_move():
+    result = minify(SOURCE, MinifyOptions(intern_strings=True))
+
+    lines = result.source.split("\n")
+    assert len(lines) == len(SOURCE.split("\n"))
+    assert "print(_S0)" in lines[7]
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from pybricks_manager.compiler import CompileCache
+from pybricks_manager.pool import HubPool, HubState
+from pybricks_manager.simhub import HubSimulator, LinkProfile
+
+
+@pytest.fixture
+def simulator():
+    simulator = HubSimulator()
+    for _ in range(2):
+        simulator.add_hub(link=LinkProfile(latency=0.005, advertising_interval=0.02))
+    with simulator:
+        yield simulator
+
+
+@pytest.fixture
+def pool(simulator, tmp_path):
+    pool = HubPool()
+    pool.compile_cache = CompileCache(str(tmp_path))
+    try:
+        yield pool
+    finally:
+        pool.close()
+
+
+def test_invalid_transitions_are_refused(pool):
+    pool._set_state("HUB", HubState.CONNECTING)
+    pool._set_state("HUB", HubState.IDLE)
+    with pytest.raises(RuntimeError):
+        pool._set_state("HUB", HubState.CONNECTING)
+    assert pool.state("hub") == HubState.IDLE
+
+
+def test_connect_and_disconnect(simulator, pool):
+    addresses = [hub.address for hub in simulator.hubs]
+    results = pool.call(pool.connect_all(addresses), 30)
+
+    assert all(result.ok for result in results.values())
+    assert set(pool.states().values()) == {HubState.IDLE}
+
+    pool.call(pool.disconnect(addresses[0]), 10)
+    assert pool.state(addresses[0]) == HubState.DISCONNECTED
+    assert pool.addresses == [pool._key(addresses[1])]
+
+
+def test_connect_failure_is_an_error_state(pool):
+    result = pool.call(pool.connect("SIM:FF:FF:FF:FF:FF"), 30)
+    assert not result.ok and result.error
+    assert pool.state("SIM:FF:FF:FF:FF:FF") == HubState.ERROR
+
+
+def test_broadcast_compiles_once_and_runs_everywhere(simulator, pool):
+    async def greet(hub):
+        await hub.print("hello")
+
+    for hub in simulator.hubs:
+        hub.program = greet
+    pool.call(pool.connect_all(hub.address for hub in simulator.hubs), 30)
+
+    results = pool.call(pool.broadcast_run("print('hello')"), 60)
+
+    assert all(result.ok and result.program_size for result in results.values())
+    assert set(pool.states().values()) == {HubState.IDLE}
+    assert pool.compile_cache.stats()["misses"] == 1
+    for address in results:
+        assert "hello" in pool.manager(address).output.read()[0]
+
+
+def test_run_without_wait_returns_to_idle(simulator, pool):
+    async def forever(hub):
+        await asyncio.sleep(60)
+
+    hub = simulator.hubs[0]
+    hub.program = forever
+    pool.call(pool.connect(hub.address), 30)
+
+    results = pool.call(pool.map_run({hub.address: "pass"}, wait=False), 60)
+    assert results[pool._key(hub.address)].ok
+    assert pool.state(hub.address) == HubState.RUNNING
+
+    pool.call(pool.stop(hub.address), 10)
+    assert pool.state(hub.address) == HubState.IDLE
+    job_id = results[pool._key(hub.address)].job_id
+    job = next(job for job in pool.manager(hub.address).jobs.jobs() if job.id == job_id)
+    job.wait(10)
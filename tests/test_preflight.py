@@ -0,0 +1,78 @@
+import asyncio
+
+from pybricks_manager.preflight import Preflight, PreflightError, check_source
+
+
+def lines(result):
+    return [(d.line, d.severity, d.stage) for d in result.diagnostics]
+
+
+def test_valid_script_is_compiled():
+    result = check_source(
+        "from pybricks.pupdevices import Motor\n"
+        "from pybricks.parameters import Port\n"
+        "motor = Motor(Port.A)\n"
+    )
+    assert result.ok and result.mpy
+    assert result.diagnostics == []
+
+
+def test_syntax_error_has_its_line():
+    result = check_source("x = 1\nif x\n    pass\n")
+    assert lines(result) == [(2, "error", "syntax")]
+    assert result.mpy is None
+
+
+def test_api_errors_have_their_lines_and_suggestions():
+    result = check_source(
+        "from pybricks.parameters import Port\n"
+        "from pybricks.pupdevices import Motr\n"
+        "import pybricks.robotic\n"
+        "\n"
+        "motor = Port.Q\n"
+    )
+    assert lines(result) == [(2, "error", "api"), (3, "error", "api"), (5, "error", "api")]
+    messages = [d.message for d in result.diagnostics]
+    assert "did you mean 'Motor'?" in messages[0]
+    assert "did you mean 'pybricks.robotics'?" in messages[1]
+    assert "Port has no member 'Q'" in messages[2]
+    # Not compiled while there are errors
+    assert result.mpy is None
+    assert str(result.diagnostics[2]) == "line 5: Port has no member 'Q'"
+
+
+def test_enum_check_ends_when_the_name_is_rebound():
+    result = check_source(
+        "from pybricks.parameters import Port\n"
+        "Port = {'Q': 1}\n"
+        "x = Port.Q\n",
+        compile=False,
+    )
+    assert result.diagnostics == []
+
+
+def test_unavailable_modules_are_warnings_unless_local():
+    source = "import numpy\nimport helpers\n"
+    result = check_source(source, compile=False)
+    assert lines(result) == [(1, "warning", "api"), (2, "warning", "api")]
+
+    result = check_source(source, compile=False, local_modules=["helpers"])
+    assert lines(result) == [(1, "warning", "api")]
+    assert result.warnings and not result.errors
+
+
+def test_preflight_error_lists_errors_only():
+    result = check_source("import numpy\nfrom pybricks.tools import wiat\n", compile=False)
+    error = PreflightError(result.diagnostics)
+    assert str(error).startswith("line 2: 'wiat' is not in pybricks.tools")
+    assert "numpy" not in str(error)
+
+
+def test_worker_reports_the_same_diagnostics():
+    preflight = Preflight()
+    try:
+        result = asyncio.run(preflight.check("print('ok'\n", file_name="main.py"))
+    finally:
+        preflight.close()
+    assert [d.stage for d in result.diagnostics] == ["syntax"]
+    assert result.diagnostics[0].line == 1
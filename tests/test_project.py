@@ -0,0 +1,88 @@
+import ast
+
+import pytest
+
+from pybricks_manager.compiler import CompileCache
+from pybricks_manager.manager import PybricksManager
+from pybricks_manager.project import ENTRY_MODULE, LAUNCHER_SOURCE, SCRIPT_MODULE, Project
+from pybricks_manager.upload import diff_ranges
+
+MAIN = """import lib
+
+def main():
+    lib.drive({speed})
+
+if __name__ == "__main__":
+    main()
+"""
+
+LIB = """def drive(speed):
+    print("driving at", speed)
+"""
+
+
+def unpack(image):
+    """(name, data) of every module in a program image"""
+    modules, offset = [], 0
+    while offset < len(image):
+        size = int.from_bytes(image[offset:offset + 4], "little")
+        end = image.index(b"\x00", offset + 4)
+        name = image[offset + 4:end].decode()
+        modules.append((name, image[end + 1:end + 1 + size]))
+        offset = end + 1 + size
+    return modules
+
+
+def build(project):
+    """Pack with the source as stand-in for the MPY"""
+    modules = project.modules()
+    stale = project.stale(modules, 6)
+    for module in stale:
+        project.store(module, 6, module.source.encode(), "")
+    return project.pack(modules, [m.name for m in stale])
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "main.py").write_text(MAIN.format(speed=100))
+    (tmp_path / "lib.py").write_text(LIB)
+    return Project(str(tmp_path / "main.py"))
+
+
+def test_launcher_runs_the_entry_script(project):
+    modules = unpack(build(project))
+
+    assert modules[0] == (ENTRY_MODULE, LAUNCHER_SOURCE.encode())
+    assert {name for name, _ in modules} == {ENTRY_MODULE, SCRIPT_MODULE, "lib"}
+    entry = dict(modules)[SCRIPT_MODULE].decode()
+    # Imported as __entry__, but the main block still runs; lines do not move
+    assert 'if "__main__" == "__main__":' in entry
+    assert entry.count("\n") == MAIN.count("\n")
+    ast.parse(entry)
+
+
+def test_entry_edit_only_resends_the_tail(project, tmp_path):
+    build(project)
+    (tmp_path / "main.py").write_text(MAIN.format(speed=1000))
+    first = build(project)
+    assert [name for name, _ in unpack(first)] == [ENTRY_MODULE, "lib", SCRIPT_MODULE]
+
+    # The entry script is last now: an edit that changes its size leaves
+    # the launcher and lib where they are
+    (tmp_path / "main.py").write_text(MAIN.format(speed=10000))
+    second = build(project)
+    entry_offset = len(first) - len(dict(unpack(first))[SCRIPT_MODULE]) - len(SCRIPT_MODULE) - 5
+    assert second[:entry_offset] == first[:entry_offset]
+    assert diff_ranges(first, second, 16)[0][0] >= entry_offset - 16
+
+
+def test_project_compiles(tmp_path):
+    (tmp_path / "main.py").write_text(MAIN.format(speed=100))
+    (tmp_path / "lib.py").write_text(LIB)
+    manager = PybricksManager(compile_cache=CompileCache(str(tmp_path / "cache")))
+    try:
+        result = manager.call(manager.validate_project(Project(str(tmp_path / "main.py"))), timeout=60)
+    finally:
+        manager.close()
+    assert result.ok, result.diagnostics
+    assert [name for name, _ in unpack(result.mpy)][0] == ENTRY_MODULE
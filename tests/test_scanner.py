@@ -0,0 +1,78 @@
+import pytest
+
+from pybricks_manager.compiler import CompileCache
+from pybricks_manager.devices import DeviceCache
+from pybricks_manager.loop import EventLoopThread
+from pybricks_manager.manager import PybricksManager
+from pybricks_manager.pool import HubPool
+from pybricks_manager.scanner import DeviceScanner
+from pybricks_manager.simhub import HubSimulator, LinkProfile
+
+
+@pytest.fixture
+def simulator():
+    simulator = HubSimulator()
+    simulator.add_hub(link=LinkProfile(latency=0.005, advertising_interval=0.02))
+    with simulator:
+        yield simulator
+
+
+@pytest.fixture
+def loop():
+    loop = EventLoopThread("test-scanner-loop")
+    try:
+        yield loop
+    finally:
+        loop.stop(5)
+
+
+def test_scan_runs_until_every_holder_stops(simulator, loop):
+    scanner = DeviceScanner(DeviceCache())
+    loop.call(scanner.start("tab 1"), 5)
+    loop.call(scanner.start("tab 2"), 5)
+    loop.call(scanner.start("tab 2"), 5)
+    assert scanner.holders == 2
+
+    loop.call(scanner.stop("tab 1"), 5)
+    assert scanner.running
+    loop.call(scanner.stop("tab 2"), 5)
+    assert not scanner.running
+
+
+def test_wait_for_returns_on_the_first_advertisement(simulator, loop):
+    hub = simulator.hubs[0]
+    scanner = DeviceScanner(DeviceCache())
+    seen = loop.call(scanner.wait_for(hub.address, timeout=5), 10)
+
+    assert seen is not None and seen.address == hub.address and seen.is_pybricks
+    # Nobody holds the scan, so it ends with the wait
+    assert not scanner.running
+    assert loop.call(scanner.wait_for("AA:BB:CC:DD:EE:FF", timeout=0.1), 5) is None
+
+
+def test_connect_keeps_another_holders_scan(simulator, tmp_path):
+    hub = simulator.hubs[0]
+    scanner = DeviceScanner(DeviceCache())
+    manager = PybricksManager(compile_cache=CompileCache(str(tmp_path)), scanner=scanner,
+                              auto_reconnect=False)
+    try:
+        manager.call(manager.scan_devices(timeout=5, settle=0), 10)
+        manager.call(scanner.start("other session"), 5)
+        manager.call(manager.connect(hub.address), 10)
+
+        # The manager released its own scan only
+        assert manager.connected
+        assert scanner.running and scanner.holders == 1
+        manager.call(manager.disconnect(), 10)
+    finally:
+        manager.close()
+    # Closing the manager that owns the loop ends the scan for everyone
+    assert not scanner.running
+
+
+def test_pool_close_stops_the_scanner(simulator):
+    pool = HubPool()
+    pool.call(pool.scanner.start("someone"), 5)
+    assert pool.scanner.running
+    pool.close()
+    assert not pool.scanner.running
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+from pybricksdev.ble.pybricks import StatusFlag
+from reactivex.subject import BehaviorSubject
+
+from pybricks_manager.compiler import CompileCache
+from pybricks_manager.manager import PybricksManager
+from pybricks_manager.simhub import HubSimulator, LinkProfile
+
+
+class FakeHub:
+    """Stands in for PybricksHub: the program stops ``delay`` seconds after the stop command"""
+
+    def __init__(self, delay: float = 0.015):
+        self.delay = delay
+        self.status_observable = BehaviorSubject(StatusFlag.USER_PROGRAM_RUNNING)
+        self.stop_commands = 0
+        self.disconnects = 0
+
+    async def stop_user_program(self):
+        self.stop_commands += 1
+        asyncio.get_running_loop().call_later(self.delay, self.status_observable.on_next, StatusFlag(0))
+
+    async def disconnect(self):
+        self.disconnects += 1
+
+
+@pytest.fixture
+def manager():
+    manager = PybricksManager()
+    try:
+        yield manager
+    finally:
+        manager.close()
+
+
+def test_stop_is_fast_and_keeps_the_connection(manager):
+    hub = FakeHub()
+    manager.hub, manager.connected = hub, True
+
+    start = time.perf_counter()
+    manager.call(manager.stop_script(), timeout=5)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.25
+    assert hub.stop_commands == 1
+    assert hub.disconnects == 0
+    assert manager.connected and manager.hub is hub
+
+
+def test_stop_times_out_when_the_program_keeps_running(manager):
+    hub = FakeHub(delay=60)
+    manager.hub, manager.connected = hub, True
+
+    with pytest.raises(RuntimeError, match="Timed out"):
+        manager.call(manager.stop_script(timeout=0.05), timeout=5)
+    assert manager.connected
+
+
+@pytest.fixture
+def connected(tmp_path):
+    simulator = HubSimulator()
+    hub = simulator.add_hub(link=LinkProfile(latency=0.015))
+    with simulator:
+        manager = PybricksManager(compile_cache=CompileCache(str(tmp_path)))
+        manager.call(manager.connect(hub.address), timeout=10)
+        try:
+            yield manager, hub
+        finally:
+            manager.call(manager.disconnect(), timeout=10)
+            manager.close()
+
+
+def test_stop_on_a_simulated_hub(connected):
+    manager, hub = connected
+    client = manager.hub.client
+    manager.call(manager.upload_script("print('running')"), timeout=30)
+    manager.call(manager.start_script(wait=False), timeout=5)
+    assert hub.running
+
+    start = time.perf_counter()
+    manager.call(manager.stop_script(), timeout=5)
+    elapsed = time.perf_counter() - start
+
+    # A stop command and a status report, not a disconnect and reconnect
+    assert elapsed < 0.25
+    assert not hub.running
+    assert manager.connected
+    assert manager.hub.client is client and client.is_connected
+    assert manager.supervisor.reconnecting is False
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from pybricks_manager.manager import PybricksManager
+from pybricks_manager.simhub import HubSimulator, LinkProfile
+from pybricks_manager.supervisor import LinkState, ReconnectSupervisor
+
+
+@pytest.fixture
+def simulator():
+    simulator = HubSimulator()
+    simulator.add_hub(link=LinkProfile(latency=0.005, advertising_interval=0.02))
+    with simulator:
+        yield simulator
+
+
+@pytest.fixture
+def manager(simulator):
+    manager = PybricksManager()
+    manager.supervisor.base_delay = 0.02
+    manager.supervisor.max_delay = 0.05
+    try:
+        manager.call(manager.connect(simulator.hubs[0].address), 10)
+        yield manager
+    finally:
+        manager.close()
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_backoff_doubles_up_to_the_limit():
+    supervisor = ReconnectSupervisor(manager=None, base_delay=0.5, max_delay=3.0, jitter=0.0)
+    assert [supervisor.backoff(n) for n in range(1, 6)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+
+    supervisor.jitter = 0.5
+    for attempt in range(1, 6):
+        delay = min(3.0, 0.5 * 2 ** (attempt - 1))
+        assert delay / 2 <= supervisor.backoff(attempt) <= delay
+
+
+def test_dropped_link_reconnects(simulator, manager):
+    supervisor = manager.supervisor
+    manager.call(_drop(simulator.hubs[0]), 5)
+
+    # Counted once connect() has returned, after the CONNECTED event
+    wait_until(lambda: supervisor.reconnects == 1)
+    states = [event.state for event in supervisor.events]
+    assert states[-3:] == [LinkState.LOST, LinkState.RECONNECTING, LinkState.CONNECTED]
+    assert manager.connected
+
+
+def test_reconnect_gives_up_after_max_attempts(simulator, manager):
+    supervisor = manager.supervisor
+    supervisor.max_attempts = 3
+    hub = simulator.hubs[0]
+    manager.call(_drop(hub, taken=True), 5)
+
+    wait_until(lambda: supervisor.state == LinkState.FAILED)
+    attempts = [event for event in supervisor.events if event.state == LinkState.RECONNECTING]
+    assert [event.attempt for event in attempts] == [1, 2, 3]
+    assert all(0 < event.delay <= supervisor.max_delay for event in attempts)
+    assert supervisor.reconnects == 0
+    assert "already connected" in supervisor.last_error
+    hub.connection = None
+
+
+async def _drop(hub, taken=False):
+    hub.connection._drop()
+    if taken:
+        # Someone else connects to the hub first, so every attempt fails
+        hub.connection = object()
@@ -0,0 +1,79 @@
+import ast
+import io
+import os
+import struct
+
+from pybricks_manager.output import OutputBuffer
+from pybricks_manager.telemetry import TelemetryDecoder, TelemetryStore
+
+
+def test_text_samples_are_not_output():
+    decoder = TelemetryDecoder(TelemetryStore)
+    output = OutputBuffer(consume=decoder.feed_line)
+
+    assert output.feed(b"hello\nTLM 1 2.5 3\nTL") == ["hello"]
+    assert output.feed(b"M 1 4 5\nTLM x\nworld") == ["TLM x"]
+    assert output.flush() == ["world"]
+    assert output.read()[0] == ["hello", "TLM x", "world"]
+    assert decoder.store.stats() == {1: 2}
+
+
+def test_reset_clears_the_previous_run():
+    decoder = TelemetryDecoder(TelemetryStore)
+    decoder.feed_line("TLM 3 1 2")
+    store = decoder.store
+    decoder.reset()
+
+    assert decoder.store is store
+    assert store.channels == []
+
+
+# Format codes of MicroPython's ustruct (no "c", "?", "n" or "N")
+_USTRUCT_CODES = set("<>!=@bBhHiIlLqQefdsPx0123456789")
+
+
+class _MicroPythonStruct:
+    @staticmethod
+    def pack(fmt, *values):
+        unsupported = set(fmt) - _USTRUCT_CODES
+        if unsupported:
+            raise ValueError(f"ustruct does not support {''.join(sorted(unsupported))!r}")
+        return struct.pack(fmt, *values)
+
+
+def _example_send(out):
+    """The send() function of examples/telemetry_stream.py, writing to ``out``"""
+    path = os.path.join(os.path.dirname(__file__), "..", "examples", "telemetry_stream.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    func = next(n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name == "send")
+    namespace = {"ustruct": _MicroPythonStruct, "_out": out}
+    exec(compile(ast.Module([func], type_ignores=[]), path, "exec"), namespace)
+    return namespace["send"]
+
+
+def test_example_frames_decode():
+    out = io.BytesIO()
+    send = _example_send(out)
+    send(0, 90, -300)
+    send(1, 123456)
+
+    data = out.getvalue()
+    decoder = TelemetryDecoder(TelemetryStore)
+    # Split mid-frame, as BLE notifications may
+    assert decoder.feed(b"before\n" + data[:5]) == b"before\n"
+    assert decoder.feed(data[5:] + b"after\n") == b"after\n"
+
+    assert decoder.frames == 2 and decoder.errors == 0
+    assert decoder.store.window(0)[1].tolist() == [[90, -300]]
+    assert decoder.store.window(1)[1].tolist() == [[123456]]
+
+
+def test_example_text_fallback_decodes(capsys):
+    send = _example_send(None)
+    send(0, 90, -300)
+
+    decoder = TelemetryDecoder(TelemetryStore)
+    output = OutputBuffer(consume=decoder.feed_line)
+    assert output.feed(capsys.readouterr().out.encode()) == []
+    assert decoder.store.window(0)[1].tolist() == [[90, -300]]
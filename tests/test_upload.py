@@ -0,0 +1,98 @@
+import asyncio
+import struct
+
+import pytest
+
+from pybricks_manager.upload import (
+    COMMAND_WRITE_USER_RAM, HEADER_SIZE, WRITE_USER_PROGRAM_META, ProgramUploader, diff_ranges,
+)
+
+
+class FakeLink:
+    """Command characteristic that keeps RAM writes and fails chosen writes"""
+
+    def __init__(self, fail=()):
+        self.ram = bytearray(4096)
+        self.meta = []
+        self.writes = []
+        self.fail = set(fail)
+
+    async def write(self, data, response):
+        n = len(self.writes)
+        self.writes.append((data[0], response))
+        if n in self.fail:
+            raise OSError("write failed")
+        if data[0] == WRITE_USER_PROGRAM_META:
+            self.meta.append(struct.unpack_from("<I", data, 1)[0])
+        elif data[0] == COMMAND_WRITE_USER_RAM:
+            offset = struct.unpack_from("<I", data, 1)[0]
+            self.ram[offset:offset + len(data) - HEADER_SIZE] = data[HEADER_SIZE:]
+
+
+def test_diff_ranges():
+    old = bytes(100)
+    assert diff_ranges(old, old, 10) == []
+
+    new = bytearray(old)
+    new[5] = new[15] = new[55] = 1
+    assert diff_ranges(old, bytes(new), 10) == [(0, 20), (50, 60)]
+
+    # Growing the image sends the tail; a shorter image sends nothing extra
+    assert diff_ranges(old, old + b"x" * 15, 10) == [(100, 115)]
+    assert diff_ranges(old, old[:95], 10) == []
+    assert diff_ranges(b"", b"abc", 10) == [(0, 3)]
+
+
+def test_upload_writes_the_whole_image():
+    link = FakeLink()
+    uploader = ProgramUploader(link.write, max_write_size=25, initial_window=2, max_window=3)
+    program = bytes(range(256)) * 2
+
+    stats = asyncio.run(uploader.upload(program))
+
+    assert bytes(link.ram[:len(program)]) == program
+    assert link.meta == [0, len(program)]
+    assert stats.bytes_sent == len(program) and stats.retries == 0
+    assert stats.packets == -(-len(program) // 20)
+    # The window grows one packet per acknowledged window, up to the limit
+    assert uploader.window == 3
+    # Every window ends with a write-with-response
+    ram_writes = [response for command, response in link.writes if command == COMMAND_WRITE_USER_RAM]
+    assert ram_writes[:5] == [False, True, False, False, True]
+
+
+def test_upload_of_ranges_only_sends_those_bytes():
+    link = FakeLink()
+    uploader = ProgramUploader(link.write, max_write_size=25)
+    program = b"a" * 100
+
+    stats = asyncio.run(uploader.upload(program, [(20, 30), (60, 65)]))
+
+    assert stats.bytes_sent == 15
+    assert bytes(link.ram[:100]) == bytes(20) + b"a" * 10 + bytes(30) + b"a" * 5 + bytes(35)
+
+
+def test_failed_write_halves_the_window_and_resends():
+    # Write 0 is the meta header; write 3 is the third packet of the window
+    link = FakeLink(fail={3})
+    uploader = ProgramUploader(link.write, max_write_size=25, initial_window=4)
+    program = bytes(range(100))
+
+    stats = asyncio.run(uploader.upload(program))
+
+    assert stats.retries == 1
+    assert bytes(link.ram[:100]) == program
+    assert stats.bytes_sent == len(program)
+    # Halved to 2, then grown after windows of 2 and 3 packets
+    assert stats.window == 4
+
+
+def test_upload_gives_up_after_max_retries():
+    link = FakeLink(fail=range(1, 100))
+    uploader = ProgramUploader(link.write, max_write_size=25, max_retries=2)
+
+    with pytest.raises(OSError):
+        asyncio.run(uploader.upload(bytes(50)))
+    assert uploader.window == 1
+    # Initial meta write plus one attempt and two retries
+    assert len(link.writes) == 1 + 3
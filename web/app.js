@@ -1,22 +1,45 @@
 let editor, device, server, commandChar, isConnected = false;
 
 // --- CONFIGURACIÓN DEL PROTOCOLO (CORREGIDA) ---
-// El Hub usa MTU de ~23 bytes por defecto en negociaciones simples.
-// Estructura: [CMD(1) + OFFSET(4) + DATA(N)]
-// Max Payload por paquete = 18 bytes (para ir seguros con cabeceras)
-const PAYLOAD_SIZE = 18;
-const PACKET_DELAY = 50;  // 50ms es seguro y fluido
+// Igual que pybricks_manager/upload.py:
+//   META(0) -> WRITE_USER_RAM [CMD(1) + OFFSET(4) + DATA(N)] ... -> META(tamaño)
+// El tamaño de paquete se lee de las capacidades del Hub (MTU negociado).
+// Si no se pueden leer, usamos el mínimo seguro (MTU 23 -> 20 bytes).
+const HEADER_SIZE = 5;
+const MIN_WRITE_SIZE = 20;
+
+// Ventana de créditos: N paquetes sin respuesta + 1 con respuesta (ACK)
+const INITIAL_WINDOW = 4;
+const MAX_WINDOW = 32;
+const MAX_RETRIES = 5;
 
 const SERVICE_UUID = 'c5f50001-8280-46da-89f4-6d8051e4aeef';
 const CHAR_UUID = 'c5f50002-8280-46da-89f4-6d8051e4aeef';
+const CAPABILITIES_UUID = 'c5f50003-8280-46da-89f4-6d8051e4aeef';
 
 // --- COMANDOS OFICIALES PYBRICKS ---
-const CMD_STOP_USER = 0;  // Detener programa
-const CMD_START_USER = 1; // Iniciar programa
-const CMD_WRITE_RAM = 2;  // Escribir en RAM (Offset + Datos)
+const CMD_STOP_USER = 0;       // Detener programa
+const CMD_START_USER = 1;      // Iniciar programa
+const CMD_WRITE_META = 3;      // Tamaño del programa (0 = inválido mientras se escribe)
+const CMD_WRITE_USER_RAM = 4;  // Escribir en RAM (Offset + Datos)
+
+// Compilador MPY (ABI v6) en WebAssembly, el mismo que usa Pybricks Code
+const MPY_CROSS_URL = 'https://cdn.jsdelivr.net/npm/@pybricks/mpy-cross-v6@2.0.0/+esm';
+const MPY_CROSS_WASM = 'https://cdn.jsdelivr.net/npm/@pybricks/mpy-cross-v6@2.0.0/build/mpy-cross-v6.wasm';
+let mpyCross = null;
 
 const wait = (ms) => new Promise(resolve => setTimeout(resolve, ms));
 
+// Capacidades del Hub (se actualizan al conectar)
+let maxWriteSize = MIN_WRITE_SIZE;
+let maxProgramSize = 0;
+let uploadWindow = INITIAL_WINDOW;
+
+// Último programa escrito en la RAM del Hub (null tras conectar)
+let hubImage = null;
+// Si cambia más de esta fracción, se envía el programa completo
+const DELTA_MAX_FRACTION = 0.5;
+
 require.config({ paths: { vs: 'https://cdnjs.cloudflare.com/ajax/libs/monaco-editor/0.46.0/min/vs' } });
 require(['vs/editor/editor.main'], () => {
     editor = monaco.editor.create(document.getElementById('editor-container'), {
@@ -68,16 +91,125 @@ window.onload = () => {
     document.getElementById('connectBtn').onclick = toggleConnect;
     document.getElementById('runBtn').onclick = runScript;
     document.getElementById('stopBtn').onclick = stopScript;
+    consoleInit();
     // Botones extra ocultos o simplificados para esta prueba
 };
 
-function log(msg, type = '') {
+// --- CONSOLA ---
+// Las líneas se guardan en un anillo de tamaño fijo y solo se pintan las
+// visibles, una vez por frame: un print() en bucle en el Hub no bloquea la
+// pestaña.
+const CONSOLE_MAX_LINES = 5000;
+const CONSOLE_ROW_HEIGHT = 18; // px, igual que .console-row en index.html
+const CONSOLE_OVERSCAN = 10;   // Filas extra por encima y por debajo
+const STATUS_USER_PROGRAM_RUNNING = 1 << 6;
+
+const consoleLines = new Array(CONSOLE_MAX_LINES);
+let consoleStart = 0;   // Índice de la línea más antigua en el anillo
+let consoleCount = 0;
+let consoleDropped = 0;
+let consoleFrame = 0;   // requestAnimationFrame pendiente (0 = ninguno)
+let consoleView = null; // { box, spacer, rows, stats }
+
+// Stdout del Hub: un solo decodificador para que las líneas (y los caracteres
+// UTF-8) partidos entre paquetes se unan
+let stdoutDecoder = new TextDecoder('utf-8');
+let stdoutPartial = '';
+let programRunning = false;
+
+function consoleInit() {
     const box = document.getElementById('consoleOutput');
-    const time = new Date().toLocaleTimeString().split(' ')[0];
-    const cleanMsg = msg.replace(/\n/g, '<br>');
+    const spacer = document.createElement('div');
+    spacer.className = 'console-spacer';
+    const rows = document.createElement('div');
+    rows.className = 'console-rows';
+    spacer.appendChild(rows);
+    box.replaceChildren(spacer);
+    box.addEventListener('scroll', scheduleConsoleRender, { passive: true });
+    new ResizeObserver(scheduleConsoleRender).observe(box);
+    consoleView = { box, spacer, rows, stats: document.getElementById('consoleStats') };
+    scheduleConsoleRender();
+}
+
+function consolePush(text, cls) {
+    const entry = { time: new Date().toLocaleTimeString().split(' ')[0], text, cls };
+    if (consoleCount < CONSOLE_MAX_LINES) {
+        consoleLines[(consoleStart + consoleCount++) % CONSOLE_MAX_LINES] = entry;
+    } else {
+        consoleLines[consoleStart] = entry;
+        consoleStart = (consoleStart + 1) % CONSOLE_MAX_LINES;
+        consoleDropped++;
+    }
+}
+
+function scheduleConsoleRender() {
+    if (!consoleFrame) consoleFrame = requestAnimationFrame(renderConsole);
+}
+
+function renderConsole() {
+    consoleFrame = 0;
+    if (!consoleView) return;
+    const { box, spacer, rows, stats } = consoleView;
+    const pending = stdoutPartial ? 1 : 0;
+    const total = consoleCount + pending;
+
+    // Lecturas primero, escrituras después: un solo cálculo de layout por frame
+    const height = box.clientHeight;
+    const stick = box.scrollTop + height >= box.scrollHeight - CONSOLE_ROW_HEIGHT;
+
+    spacer.style.height = `${total * CONSOLE_ROW_HEIGHT}px`;
+    const top = stick ? Math.max(0, total * CONSOLE_ROW_HEIGHT - height) : box.scrollTop;
+    const first = Math.max(0, Math.floor(top / CONSOLE_ROW_HEIGHT) - CONSOLE_OVERSCAN);
+    const last = Math.min(total, Math.ceil((top + height) / CONSOLE_ROW_HEIGHT) + CONSOLE_OVERSCAN);
+
+    // Se reutilizan las filas ya creadas
+    while (rows.childElementCount < last - first) {
+        const row = document.createElement('div');
+        row.className = 'console-row';
+        row.append(document.createElement('span'), ' ', document.createElement('span'));
+        row.firstChild.className = 'text-gray';
+        rows.appendChild(row);
+    }
+    while (rows.childElementCount > last - first) rows.lastChild.remove();
+    rows.style.transform = `translateY(${first * CONSOLE_ROW_HEIGHT}px)`;
+
+    for (let i = first; i < last; i++) {
+        const entry = i < consoleCount
+            ? consoleLines[(consoleStart + i) % CONSOLE_MAX_LINES]
+            : { time: '', text: stdoutPartial, cls: 'text-green' };
+        const [time, , text] = rows.children[i - first].childNodes;
+        time.textContent = entry.time ? `[${entry.time}]` : '';
+        text.textContent = entry.text;
+        text.className = entry.cls;
+    }
+    if (stick) box.scrollTop = total * CONSOLE_ROW_HEIGHT;
+    if (stats) {
+        stats.textContent = consoleDropped
+            ? `${consoleCount} líneas (${consoleDropped} descartadas)`
+            : `${consoleCount} líneas`;
+    }
+}
+
+function feedStdout(bytes) {
+    const lines = (stdoutPartial + stdoutDecoder.decode(bytes, { stream: true })).split('\n');
+    stdoutPartial = lines.pop();
+    for (const line of lines) consolePush(line.replace(/\r$/, ''), 'text-green');
+    scheduleConsoleRender();
+}
+
+// Cierra la última línea (p. ej. al terminar el programa sin salto de línea)
+function flushStdout() {
+    const rest = stdoutPartial + stdoutDecoder.decode();
+    stdoutPartial = '';
+    stdoutDecoder = new TextDecoder('utf-8');
+    if (rest) consolePush(rest.replace(/\r$/, ''), 'text-green');
+    scheduleConsoleRender();
+}
+
+function log(msg, type = '') {
     const color = type === 'error' ? 'text-red' : (type === 'success' ? 'text-green' : 'text-gray');
-    box.innerHTML += `<div class="log-entry" style="font-family: monospace;"><span class="text-gray">[${time}]</span> <span class="${color}">${cleanMsg}</span></div>`;
-    box.scrollTop = box.scrollHeight;
+    for (const line of String(msg).split('\n')) consolePush(line, color);
+    scheduleConsoleRender();
 }
 
 async function toggleConnect() {
@@ -91,11 +223,12 @@ async function toggleConnect() {
                 optionalServices: [SERVICE_UUID]
             });
             device.addEventListener('gattserverdisconnected', () => {
-                isConnected = false; updateUI(); log('Desconectado.');
+                isConnected = false; hubImage = null; flushStdout(); updateUI(); log('Desconectado.');
             });
             server = await device.gatt.connect();
             const service = await server.getPrimaryService(SERVICE_UUID);
             commandChar = await service.getCharacteristic(CHAR_UUID);
+            await readCapabilities(service);
 
             await commandChar.startNotifications();
             commandChar.addEventListener('characteristicvaluechanged', handleNotifications);
@@ -105,20 +238,149 @@ async function toggleConnect() {
     }
 }
 
+async function readCapabilities(service) {
+    // Formato: max_write_size (uint16) | flags (uint32) | max_program_size (uint32)
+    try {
+        const caps = await service.getCharacteristic(CAPABILITIES_UUID);
+        const view = await caps.readValue();
+        maxWriteSize = Math.max(MIN_WRITE_SIZE, view.getUint16(0, true));
+        maxProgramSize = view.getUint32(6, true);
+    } catch (e) {
+        // Firmware antiguo sin capacidades: mínimo seguro
+        maxWriteSize = MIN_WRITE_SIZE;
+        maxProgramSize = 0;
+    }
+    uploadWindow = INITIAL_WINDOW;
+    hubImage = null;
+    log(`Paquete máximo: ${maxWriteSize} bytes`);
+}
+
+// Imagen del programa: tamaño (uint32) | "__main__\0" | MPY (como compiler.pack_program)
+async function compileProgram(code) {
+    if (!mpyCross) mpyCross = await import(MPY_CROSS_URL);
+    const result = await mpyCross.compile('__main__.py', code, undefined, MPY_CROSS_WASM);
+    if (result.status !== 0 || !result.mpy) {
+        throw new Error('Error de compilación:\n' + result.err.join('\n'));
+    }
+    const name = new TextEncoder().encode('__main__\0');
+    const image = new Uint8Array(4 + name.length + result.mpy.length);
+    new DataView(image.buffer).setUint32(0, result.mpy.length, true);
+    image.set(name, 4);
+    image.set(result.mpy, 4 + name.length);
+    return image;
+}
+
+function writeMeta(size) {
+    const packet = new ArrayBuffer(5);
+    const view = new DataView(packet);
+    view.setUint8(0, CMD_WRITE_META);
+    view.setUint32(1, size, true);
+    return commandChar.writeValueWithResponse(packet);
+}
+
+function writeRamPacket(bytes, offset, length) {
+    const packet = new ArrayBuffer(HEADER_SIZE + length);
+    const view = new DataView(packet);
+    view.setUint8(0, CMD_WRITE_USER_RAM);   // Comando 4
+    view.setUint32(1, offset, true);        // Offset Little Endian
+    new Uint8Array(packet, HEADER_SIZE).set(bytes.subarray(offset, offset + length));
+    return packet;
+}
+
+// Envía bytes[start, end) en ventanas: los paquetes van sin respuesta y el
+// último de cada ventana con respuesta, que confirma toda la ventana (ATT
+// procesa las escrituras en orden). Ventana completada: +1 paquete.
+// Error: ventana a la mitad y se reenvía (los offsets son absolutos).
+async function uploadRange(bytes, start, end, stats) {
+    const payload = maxWriteSize - HEADER_SIZE;
+    let confirmed = start;
+
+    while (confirmed < end) {
+        let offset = confirmed;
+        let sent = 0;
+        try {
+            while (offset < end && sent < uploadWindow) {
+                const length = Math.min(payload, end - offset);
+                const packet = writeRamPacket(bytes, offset, length);
+                offset += length;
+                sent++;
+                if (sent === uploadWindow || offset >= end) {
+                    await commandChar.writeValueWithResponse(packet);
+                } else {
+                    await commandChar.writeValueWithoutResponse(packet);
+                }
+                stats.packets++;
+            }
+        } catch (e) {
+            if (++stats.retries > MAX_RETRIES) throw e;
+            uploadWindow = Math.max(1, uploadWindow >> 1);
+            continue;
+        }
+        stats.bytesSent += offset - confirmed;
+        confirmed = offset;
+        uploadWindow = Math.min(MAX_WINDOW, uploadWindow + 1);
+    }
+}
+
+// Rangos (alineados a paquetes) que difieren del programa ya cargado
+function diffRanges(oldBytes, newBytes, chunk) {
+    const ranges = [];
+    const common = Math.min(oldBytes.length, newBytes.length);
+    for (let start = 0; start < newBytes.length; start += chunk) {
+        const end = Math.min(start + chunk, newBytes.length);
+        let same = end <= common;
+        for (let i = start; same && i < end; i++) same = oldBytes[i] === newBytes[i];
+        if (same) continue;
+        const last = ranges[ranges.length - 1];
+        if (last && last[1] === start) last[1] = end;
+        else ranges.push([start, end]);
+    }
+    return ranges;
+}
+
+async function uploadProgram(bytes) {
+    const stats = { bytesSent: 0, packets: 0, retries: 0, seconds: 0, rate: 0 };
+    const t0 = performance.now();
+
+    // Delta: solo los rangos cambiados, entre META(0) y META(tamaño nuevo),
+    // así el Hub conoce la nueva longitud aunque el final no se reenvíe
+    let ranges = [[0, bytes.length]];
+    const limit = bytes.length * DELTA_MAX_FRACTION;
+    if (hubImage && Math.abs(bytes.length - hubImage.length) <= limit) {
+        const delta = diffRanges(hubImage, bytes, maxWriteSize - HEADER_SIZE);
+        const changed = delta.reduce((n, [s, e]) => n + e - s, 0);
+        if (changed <= limit) {
+            ranges = delta;
+            log(`Delta: ${changed} de ${bytes.length} bytes cambiados`);
+        }
+    }
+
+    // Tamaño 0 mientras se escribe: el Hub no ejecuta una imagen a medias
+    hubImage = null;
+    await writeMeta(0);
+    for (const [start, end] of ranges) await uploadRange(bytes, start, end, stats);
+    await writeMeta(bytes.length);
+    hubImage = bytes;
+    stats.seconds = (performance.now() - t0) / 1000;
+    stats.rate = stats.seconds > 0 ? stats.bytesSent / stats.seconds : 0;
+    return stats;
+}
+
 function handleNotifications(e) {
     const view = e.target.value;
     const type = view.getUint8(0);
 
-    // TIPO 1: Salida de texto (print del robot)
+    // TIPO 1: Salida de texto (print del robot), una línea puede venir en varios paquetes
     if (type === 1) {
-        const msg = new TextDecoder().decode(new Uint8Array(view.buffer, view.byteOffset + 1, view.byteLength - 1));
-        log(msg, 'success');
+        feedStdout(new Uint8Array(view.buffer, view.byteOffset + 1, view.byteLength - 1));
     }
     // TIPO 0: Status Update (Flags)
     // 0x02 = IDLE. No es un error, es información.
-    else if (type === 0) {
-        // Ignoramos el spam de status para no ensuciar la consola, 
-        // a menos que sea útil para debugging interno.
+    else if (type === 0 && view.byteLength >= 5) {
+        // Sin mostrar el spam de status: solo se cierra la salida al terminar el programa
+        const running = (view.getUint32(1, true) & STATUS_USER_PROGRAM_RUNNING) !== 0;
+        if (programRunning && !running) flushStdout();
+        programRunning = running;
     }
 }
 
@@ -130,49 +392,256 @@ function updateUI() {
     document.getElementById('stopBtn').disabled = !isConnected;
 }
 
-async function runScript() {
-    if (!isConnected) return;
+// --- REDUCCIÓN DEL SCRIPT ---
+// Comentarios, docstrings y sangría ocupan enlace BLE. Se quitan sin mover
+// ninguna línea, así los errores del Hub siguen apuntando al editor.
+const WORD_CHAR = /[\p{L}\p{N}_]/u;
+const STRING_PREFIX = /^[rRbBuUfF]{1,2}$/;
+// Pares de operadores que, pegados, cambiarían de significado
+const MERGING_OPS = new Set(['**', '//', '<<', '>>', '==', '!=', '<=', '>=', '->', ':=', '..',
+    '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '@=', '<>']);
+// Sentencias que no admiten nada delante con ';'
+const COMPOUND_START = new Set(['def', 'class', 'if', 'elif', 'else', 'for', 'while', 'with', 'try',
+    'except', 'finally', 'async', 'match', 'case', '@']);
 
-    const raw = editor.getValue();
-    const code = raw.replace(/\r\n/g, '\n');
-    const bytes = new TextEncoder().encode(code);
-    const size = bytes.length;
+// Tokens: str, comment, nl, cont (barra + salto de línea), space, word, op
+function lexPython(code) {
+    const tokens = [];
+    let i = 0;
+    while (i < code.length) {
+        const c = code[i];
+        if (WORD_CHAR.test(c)) {
+            let j = i + 1;
+            while (j < code.length && WORD_CHAR.test(code[j])) j++;
+            const word = code.slice(i, j);
+            if (STRING_PREFIX.test(word) && (code[j] === '"' || code[j] === '\'')) {
+                i = lexString(code, i, j, tokens);
+            } else {
+                tokens.push({ type: 'word', text: word });
+                i = j;
+            }
+        } else if (c === '"' || c === '\'') {
+            i = lexString(code, i, i, tokens);
+        } else if (c === '#') {
+            const j = code.indexOf('\n', i);
+            tokens.push({ type: 'comment', text: code.slice(i, j < 0 ? code.length : j) });
+            i = j < 0 ? code.length : j;
+        } else if (c === '\n') {
+            tokens.push({ type: 'nl', text: c });
+            i++;
+        } else if (c === '\\' && code[i + 1] === '\n') {
+            tokens.push({ type: 'cont', text: '\\\n' });
+            i += 2;
+        } else if (c === ' ' || c === '\t' || c === '\f' || c === '\r') {
+            let j = i + 1;
+            while (j < code.length && ' \t\f\r'.includes(code[j])) j++;
+            tokens.push({ type: 'space', text: code.slice(i, j) });
+            i = j;
+        } else {
+            tokens.push({ type: 'op', text: c });
+            i++;
+        }
+    }
+    return tokens;
+}
 
-    log(`Compilando envío (${size} bytes)...`);
+function lexString(code, start, quoteAt, tokens) {
+    const quote = code.startsWith(code[quoteAt].repeat(3), quoteAt) ? code[quoteAt].repeat(3) : code[quoteAt];
+    let j = quoteAt + quote.length;
+    while (j < code.length && !code.startsWith(quote, j)) {
+        if (code[j] === '\n' && quote.length === 1) break;
+        j += code[j] === '\\' ? 2 : 1;
+    }
+    j = Math.min(code.length, j + quote.length);
+    const prefix = code.slice(start, quoteAt);
+    tokens.push({ type: 'str', text: code.slice(start, j), prefix, plain: !/[bf]/i.test(prefix) });
+    return j;
+}
 
-    try {
-        // 1. DETENER (Para limpiar estado)
-        await commandChar.writeValueWithResponse(new Uint8Array([CMD_STOP_USER]));
-        await wait(100);
+// Agrupa los tokens en sentencias (líneas lógicas) con su sangría
+function logicalLines(tokens) {
+    const lines = [];
+    let line = { tokens: [] };
+    let brackets = 0;
+    for (const tok of tokens) {
+        line.tokens.push(tok);
+        if (tok.type === 'op' && '([{'.includes(tok.text)) brackets++;
+        else if (tok.type === 'op' && ')]}'.includes(tok.text)) brackets = Math.max(0, brackets - 1);
+        else if (tok.type === 'nl' && brackets === 0) {
+            lines.push(line);
+            line = { tokens: [] };
+        }
+    }
+    if (line.tokens.length) lines.push(line);
+
+    for (const l of lines) {
+        const code = l.tokens.filter(t => t.type === 'word' || t.type === 'op' || t.type === 'str');
+        const first = l.tokens[0];
+        l.blank = code.length === 0;
+        l.indent = first.type === 'space' ? indentWidth(first.text) : 0;
+        l.keyword = l.blank ? '' : code[0].text;
+        l.opener = !l.blank && code[code.length - 1].text === ':';
+        // Un str suelto es un docstring (un f-string puede tener efectos)
+        l.docstring = !l.blank && code.every(t => t.type === 'str' && t.plain);
+        l.rows = l.tokens.reduce((n, t) => n + (t.text.match(/\n/g) || []).length, 0);
+    }
+    return lines;
+}
+
+// Columnas como las cuenta Python: un tabulador avanza al siguiente múltiplo de 8
+function indentWidth(text) {
+    let width = 0;
+    for (const ch of text) width = ch === '\t' ? (Math.floor(width / 8) + 1) * 8 : width + 1;
+    return width;
+}
 
-        // 2. BUCLE DE ENVIO (Usando CMD_WRITE_RAM = 2)
-        // Estructura del paquete: [ CMD(1) | OFFSET(4 bytes Little Endian) | DATA(...) ]
-        let offset = 0;
+function needsSpace(prev, tok) {
+    const a = prev.text[prev.text.length - 1], b = tok.text[0];
+    if (WORD_CHAR.test(a) && (WORD_CHAR.test(b) || (b === '.' && /^\d/.test(prev.text)))) return true;
+    if (prev.type === 'word' && tok.type === 'str' && STRING_PREFIX.test(prev.text)) return true;
+    if ((a === '"' || a === '\'') && b === a) return true;  // '' '' no debe abrir un triple
+    return MERGING_OPS.has(a + b);
+}
 
-        while (offset < size) {
-            const chunkSize = Math.min(PAYLOAD_SIZE, size - offset);
+// Strings repetidos -> nombres _S<n> definidos en la primera sentencia simple del módulo
+function internStrings(code, lines) {
+    const anchor = lines.find(l => !l.blank && !l.drop && l.indent === 0 && !COMPOUND_START.has(l.keyword)
+        && !(l.keyword === 'from' && l.tokens.some(t => t.text === '__future__')));
+    const uses = new Map();
+    for (const l of lines.slice(lines.indexOf(anchor) + 1)) {
+        if (l.blank || l.drop || l.keyword === 'match' || l.keyword === 'case') continue;
+        const code = l.tokens.filter(t => t.type === 'word' || t.type === 'op' || t.type === 'str');
+        code.forEach((t, n) => {
+            if (t.type !== 'str' || t.prefix || t.text.length < 3 || t.text.includes('\n')) return;
+            // Concatenación implícita: 'a' 'b' no puede llevar un nombre en medio
+            if (code[n - 1]?.type === 'str' || code[n + 1]?.type === 'str') return;
+            if (!uses.has(t.text)) uses.set(t.text, []);
+            uses.get(t.text).push(t);
+        });
+    }
+    const names = new Map();
+    const defs = [];
+    let n = 0;
+    for (const [text, list] of [...uses].sort((a, b) => b[1].length - a[1].length)) {
+        if (!anchor || list.length * (text.length - 3) <= text.length + 5) continue;
+        let name;
+        do { name = `_S${n++}`; } while (new RegExp(`\\b${name}\\b`).test(code));
+        defs.push(`${name}=${text}`);
+        for (const t of list) names.set(t, name);
+    }
+    return { anchor, names, defs: defs.join(';') };
+}
 
-            // Crear Buffer: 1 byte CMD + 4 bytes Offset + N bytes Data
-            const packet = new ArrayBuffer(5 + chunkSize);
-            const view = new DataView(packet);
+/**
+ * Reduce un programa Pybricks antes de enviarlo, conservando los números de línea.
+ * Devuelve { source, originalSize, size, removed }.
+ */
+function minifyScript(code, { intern = false } = {}) {
+    code = code.replace(/\r\n/g, '\n');
+    const lines = logicalLines(lexPython(code));
+    const removed = { docstrings: 0, comments: 0, interned: 0 };
 
-            view.setUint8(0, CMD_WRITE_RAM);        // Comando 2
-            view.setUint32(1, offset, true);        // Offset Little Endian
+    // Docstrings fuera; si vacían un bloque, queda 'pass' en su lugar
+    const statements = lines.filter(l => !l.blank);
+    statements.forEach((l, k) => {
+        if (!l.docstring) return;
+        l.drop = true;
+        removed.docstrings++;
+        const before = statements[k - 1];
+        if (!before || !before.opener || before.indent >= l.indent) return;
+        const block = [];
+        for (const next of statements.slice(k)) {
+            if (next.indent < l.indent) break;
+            if (next.indent === l.indent) block.push(next);
+        }
+        if (block.every(s => s.docstring)) l.pass = true;
+    });
 
-            // Copiar datos del script al paquete
-            new Uint8Array(packet, 5).set(bytes.slice(offset, offset + chunkSize));
+    const { anchor, names, defs } = intern ? internStrings(code, lines) : { names: new Map() };
+    removed.interned = names.size;
 
-            // Enviar sin respuesta para velocidad, pero con delay controlado
-            await commandChar.writeValueWithoutResponse(packet);
+    // Misma fila para cada token, sangría de un espacio por nivel
+    const out = [];
+    const stack = [0];
+    for (const l of lines) {
+        if (l.blank || l.drop) {
+            removed.comments += l.tokens.filter(t => t.type === 'comment').length;
+            if (l.pass) {
+                while (l.indent < stack[stack.length - 1]) stack.pop();
+                if (l.indent > stack[stack.length - 1]) stack.push(l.indent);
+                out.push(' '.repeat(stack.length - 1) + 'pass');
+            }
+            out.push('\n'.repeat(l.rows));
+            continue;
+        }
+        while (l.indent < stack[stack.length - 1]) stack.pop();
+        if (l.indent > stack[stack.length - 1]) stack.push(l.indent);
+        out.push(' '.repeat(stack.length - 1));
+        if (l === anchor && defs) out.push(defs + ';');
 
-            offset += chunkSize;
-            // Pequeña pausa para que el Hub procese y no se ahogue
-            await wait(PACKET_DELAY);
+        let prev = null;
+        let spaced = false;
+        for (const tok of l.tokens) {
+            if (tok.type === 'comment') {
+                removed.comments++;
+            } else if (tok.type === 'space') {
+                spaced = prev !== null;
+            } else if (tok.type === 'nl' || tok.type === 'cont') {
+                out.push(tok.text);
+                prev = null;
+            } else {
+                const text = names.get(tok) || tok.text;
+                if (prev && spaced && needsSpace(prev, { type: tok.type, text })) out.push(' ');
+                out.push(text);
+                prev = { type: tok.type, text };
+                spaced = false;
+            }
         }
+    }
+
+    const source = out.join('');
+    const encoder = new TextEncoder();
+    return {
+        source,
+        originalSize: encoder.encode(code).length,
+        size: encoder.encode(source).length,
+        removed
+    };
+}
+
+async function runScript() {
+    if (!isConnected) return;
+
+    const raw = editor.getValue();
+    let code = raw.replace(/\r\n/g, '\n');
+    const mode = document.getElementById('minifyMode').value;
+    if (mode !== 'off') {
+        const reduced = minifyScript(code, { intern: mode === 'all' });
+        code = reduced.source;
+        const percent = Math.round(100 * (1 - reduced.size / Math.max(1, reduced.originalSize)));
+        log(`Reducido: ${reduced.originalSize} → ${reduced.size} bytes (−${percent}%)`);
+    }
+    try {
+        const bytes = await compileProgram(code);
+        const size = bytes.length;
+        log(`Compilado: ${size} bytes.`);
+
+        // 1. DETENER (Para limpiar estado)
+        await commandChar.writeValueWithResponse(new Uint8Array([CMD_STOP_USER]));
+        await wait(100);
+
+        if (maxProgramSize && size > maxProgramSize) {
+            throw new Error(`Programa demasiado grande (${size} > ${maxProgramSize} bytes)`);
+        }
+
+        // 2. ENVIO (META + WRITE_USER_RAM) con ventana de créditos
+        const stats = await uploadProgram(bytes);
 
-        log('Carga completada al 100%.', 'success');
+        log(`Carga completada al 100% (${stats.bytesSent}/${size} bytes enviados, ${stats.seconds.toFixed(2)} s, ${Math.round(stats.rate)} B/s, ` +
+            `${stats.packets} paquetes, ${stats.retries} reintentos).`, 'success');
 
-        // 3. EJECUTAR
+        // 3. EJECUTAR (la salida del programa anterior se cierra antes)
+        flushStdout();
         await wait(200);
         await commandChar.writeValueWithoutResponse(new Uint8Array([CMD_START_USER]));
         log('Comando de INICIO enviado.');